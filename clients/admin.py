@@ -1,11 +1,38 @@
 from django.contrib import admin
-from django.utils.html import format_html
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
-from .models import Mailing, Message, Recipient, MailingAttempt, MailingLog
+from .admin_filters import AutocompleteFilterMediaMixin, MailingAutocompleteFilter
+from .forms import MessageForm
+from .services import DeliveryTimingService, MailingService, StatisticsService
+from .models import (
+    ArchivedAttemptCount,
+    Mailing,
+    MailingAttempt,
+    MailingLog,
+    Message,
+    Recipient,
+    Segment,
+    SuppressedEmail,
+    Tag,
+)
+from .paginators import EstimatedCountPaginator
+from config.db_router import get_read_db
+
+
+class ReplicaReadAdminMixin:
+    """Чтение страниц админки с реплики; изменяющие запросы (POST) работают с основной базой."""
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.method in ("GET", "HEAD"):
+            queryset = queryset.using(get_read_db())
+        return queryset
 
 
 @admin.register(Recipient)
-class RecipientAdmin(admin.ModelAdmin):
+class RecipientAdmin(ReplicaReadAdminMixin, admin.ModelAdmin):
     """Админ-панель для управления получателями."""
 
     list_display = ("full_name", "email", "created_at", "mailings_count")
@@ -13,33 +40,78 @@ class RecipientAdmin(admin.ModelAdmin):
     search_fields = ("full_name", "email", "comment")
     ordering = ("-created_at",)
     readonly_fields = ("created_at", "updated_at", "mailings_count_display")
+    autocomplete_fields = ("tags",)
 
     fieldsets = (
-        ("Основная информация", {"fields": ("full_name", "email", "comment")}),
+        ("Основная информация", {"fields": ("full_name", "email", "comment", "tags")}),
         (
             "Системная информация",
             {"fields": ("created_at", "updated_at", "mailings_count_display"), "classes": ("collapse",)},
         ),
     )
 
+    def get_queryset(self, request):
+        """Количество рассылок считаем одним запросом для всей страницы."""
+        queryset = super().get_queryset(request)
+        return queryset.annotate(_mailings_count=Count("mailings", distinct=True))
+
     def mailings_count(self, obj):
         """Количество рассылок для получателя."""
-        return obj.mailings.count()
+        return obj._mailings_count
 
     mailings_count.short_description = "Кол-во рассылок"
+    mailings_count.admin_order_field = "_mailings_count"
 
     def mailings_count_display(self, obj):
         """Отображение количества рассылок в форме редактирования."""
-        count = obj.mailings.count()
+        count = getattr(obj, "_mailings_count", None)
+        if count is None:
+            count = obj.mailings.count()
         return mark_safe(f"<strong>{count}</strong> рассылок")
 
     mailings_count_display.short_description = "Количество рассылок"
 
 
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    """Админ-панель для тегов получателей."""
+
+    list_display = ("name", "owner")
+    search_fields = ("name",)
+    list_select_related = ("owner",)
+
+
+@admin.register(Segment)
+class SegmentAdmin(admin.ModelAdmin):
+    """Админ-панель для сегментов получателей."""
+
+    list_display = ("name", "owner", "created_from", "created_to", "created_at")
+    search_fields = ("name",)
+    list_select_related = ("owner",)
+    autocomplete_fields = ("tags",)
+    readonly_fields = ("created_at", "updated_at", "recipients_count")
+
+    fieldsets = (
+        ("Условия", {"fields": ("name", "owner", "tags", "created_from", "created_to")}),
+        (
+            "Системная информация",
+            {"fields": ("created_at", "updated_at", "recipients_count"), "classes": ("collapse",)},
+        ),
+    )
+
+    def recipients_count(self, obj):
+        """Сколько получателей попадает в сегмент сейчас."""
+        return obj.get_recipients().count() if obj.pk else 0
+
+    recipients_count.short_description = "Получателей сейчас"
+
+
 @admin.register(Message)
-class MessageAdmin(admin.ModelAdmin):
+class MessageAdmin(ReplicaReadAdminMixin, admin.ModelAdmin):
     """Админ-панель для управления сообщениями."""
 
+    # Та же проверка шаблонов письма, что и в форме сайта
+    form = MessageForm
     list_display = ("subject", "body_preview", "created_at", "mailings_count")
     list_filter = ("created_at",)
     search_fields = ("subject", "body")
@@ -47,7 +119,7 @@ class MessageAdmin(admin.ModelAdmin):
     readonly_fields = ("created_at", "updated_at", "mailings_count_display")
 
     fieldsets = (
-        ("Содержание сообщения", {"fields": ("subject", "body")}),
+        ("Содержание сообщения", {"fields": ("subject", "body", "html_body")}),
         (
             "Системная информация",
             {"fields": ("created_at", "updated_at", "mailings_count_display"), "classes": ("collapse",)},
@@ -60,15 +132,23 @@ class MessageAdmin(admin.ModelAdmin):
 
     body_preview.short_description = "Тело письма"
 
+    def get_queryset(self, request):
+        """Количество рассылок считаем одним запросом для всей страницы."""
+        queryset = super().get_queryset(request)
+        return queryset.annotate(_mailings_count=Count("mailings", distinct=True))
+
     def mailings_count(self, obj):
         """Количество рассылок с этим сообщением."""
-        return obj.mailings.count()
+        return obj._mailings_count
 
     mailings_count.short_description = "Кол-во рассылок"
+    mailings_count.admin_order_field = "_mailings_count"
 
     def mailings_count_display(self, obj):
         """Отображение количества рассылок в форме редактирования."""
-        count = obj.mailings.count()
+        count = getattr(obj, "_mailings_count", None)
+        if count is None:
+            count = obj.mailings.count()
         return mark_safe(f"<strong>{count}</strong> рассылок")
 
     mailings_count_display.short_description = "Количество рассылок"
@@ -79,7 +159,8 @@ class MailingAttemptInline(admin.TabularInline):
 
     model = MailingAttempt
     extra = 0
-    readonly_fields = ("attempt_time", "status", "server_response")
+    fields = ("attempt_time", "status", "server_response")
+    readonly_fields = fields
     can_delete = False
 
     def has_add_permission(self, request, obj=None):
@@ -87,7 +168,7 @@ class MailingAttemptInline(admin.TabularInline):
 
 
 @admin.register(Mailing)
-class MailingAdmin(admin.ModelAdmin):
+class MailingAdmin(ReplicaReadAdminMixin, admin.ModelAdmin):
     """Админ-панель для управления рассылками."""
 
     list_display = (
@@ -102,17 +183,20 @@ class MailingAdmin(admin.ModelAdmin):
     list_filter = ("status", "created_at", "start_time", "end_time")
     search_fields = ("message__subject", "message__body", "recipients__full_name", "recipients__email")
     ordering = ("-created_at",)
-    readonly_fields = ("created_at", "updated_at", "status_display", "recipients_list")
-    filter_horizontal = ("recipients",)
+    readonly_fields = ("created_at", "updated_at", "status_display", "recipients_list", "timing_percentiles")
+    # Виджеты с автодополнением вместо выгрузки всех сообщений и получателей в форму
+    autocomplete_fields = ("message", "segment", "recipients")
     inlines = [MailingAttemptInline]
+    actions = ["clone_mailings"]
 
     fieldsets = (
-        ("Основные параметры", {"fields": ("message", "recipients", "status_display")}),
+        ("Основные параметры", {"fields": ("message", "segment", "recipients", "status_display")}),
         ("Временные настройки", {"fields": ("start_time", "end_time")}),
         (
             "Информация о рассылке",
             {"fields": ("created_at", "updated_at", "recipients_list"), "classes": ("collapse",)},
         ),
+        ("Время отправки по фазам", {"fields": ("timing_percentiles",), "classes": ("collapse",)}),
     )
 
     def message_subject(self, obj):
@@ -120,6 +204,7 @@ class MailingAdmin(admin.ModelAdmin):
         return obj.message.subject
 
     message_subject.short_description = "Тема письма"
+    message_subject.admin_order_field = "message__subject"
 
     def status_display(self, obj):
         """Цветной индикатор статуса."""
@@ -139,41 +224,118 @@ class MailingAdmin(admin.ModelAdmin):
     status_display.short_description = "Статус"
 
     def recipients_count(self, obj):
-        """Количество получателей."""
-        return obj.recipients.count()
+        """Количество получателей; у рассылки по сегменту — название сегмента, он вычисляется при отправке."""
+        if obj.segment_id:
+            return f"Сегмент: {obj.segment}"
+        return obj._recipients_count
 
     recipients_count.short_description = "Получателей"
+    recipients_count.admin_order_field = "_recipients_count"
+
+    # Сколько получателей показывать в форме рассылки
+    RECIPIENTS_LIST_LIMIT = 100
 
     def recipients_list(self, obj):
         """Список получателей для просмотра."""
-        recipients = obj.recipients.all()
+        recipients = list(obj.get_recipients()[: self.RECIPIENTS_LIST_LIMIT + 1])
         if not recipients:
             return "Нет получателей"
 
-        recipient_list = "<br>".join([f"• {r.full_name} &lt;{r.email}&gt;" for r in recipients])
+        recipient_list = "<br>".join(
+            [f"• {r.full_name} &lt;{r.email}&gt;" for r in recipients[: self.RECIPIENTS_LIST_LIMIT]]
+        )
+        if len(recipients) > self.RECIPIENTS_LIST_LIMIT:
+            recipient_list += f"<br>… всего получателей: {obj.get_recipients().count()}"
         return mark_safe(f'<div style="max-height: 200px; overflow-y: auto;">{recipient_list}</div>')
 
     recipients_list.short_description = "Список получателей"
 
+    def timing_percentiles(self, obj):
+        """Процентили времени фаз отправки, мс."""
+        rows = DeliveryTimingService.get_percentiles(obj) if obj.pk else []
+        if not rows:
+            return "Нет замеров"
+        header = format_html_join(
+            "", "<th>{}</th>", [("Фаза",), ("Замеров",)] + [(f"p{p}",) for p in DeliveryTimingService.PERCENTILES]
+        )
+        body = format_html_join(
+            "",
+            "<tr><td>{}</td><td>{}</td>{}</tr>",
+            (
+                (row["label"], row["count"], format_html_join("", "<td>{}</td>", ((v,) for v in row["percentiles"])))
+                for row in rows
+            ),
+        )
+        return format_html("<table><thead><tr>{}</tr></thead><tbody>{}</tbody></table>", header, body)
+
+    timing_percentiles.short_description = "Процентили, мс"
+
+    def clone_mailings(self, request, queryset):
+        """Копии выбранных рассылок с теми же сообщением и получателями."""
+        mailings = list(queryset.select_related("owner"))
+        for mailing in mailings:
+            MailingService.clone(mailing)
+        self._clear_owner_caches(mailing.owner for mailing in mailings)
+        self.message_user(request, f"Создано копий: {len(mailings)}.")
+
+    clone_mailings.short_description = "Клонировать выбранные рассылки"
+
+    @staticmethod
+    def _clear_owner_caches(owners):
+        """Сбрасывает кеш статистики владельцев изменённых рассылок."""
+        for owner in set(owners):
+            StatisticsService.clear_user_stats_cache(owner)
+
+    def delete_model(self, request, obj):
+        """Помечаем рассылку удалённой; попытки и логи удалит purge_deleted_mailings."""
+        obj.mark_deleted()
+        self._clear_owner_caches([obj.owner])
+
+    def delete_queryset(self, request, queryset):
+        owners = [mailing.owner for mailing in queryset.select_related("owner")]
+        queryset.update(deleted_at=timezone.now())
+        self._clear_owner_caches(owners)
+
+    def get_deleted_objects(self, objs, request):
+        """Страница подтверждения без обхода всех связанных попыток и логов."""
+        objs = list(objs)
+        perms_needed = set() if self.has_delete_permission(request) else {self.opts.verbose_name}
+        return [str(obj) for obj in objs], {self.opts.verbose_name_plural: len(objs)}, perms_needed, []
+
     def get_queryset(self, request):
-        """Оптимизация запросов."""
+        """Оптимизация запросов: тема письма через JOIN, число получателей — аннотацией.
+
+        Получателей не подгружаем через prefetch_related: на странице списка нужен только
+        их счётчик, а полный список (recipients_list) строится для одной рассылки.
+        """
         queryset = super().get_queryset(request)
-        return queryset.select_related("message").prefetch_related("recipients")
+        return queryset.select_related("message", "segment").annotate(
+            _recipients_count=Count("recipients", distinct=True)
+        )
 
 
 @admin.register(MailingAttempt)
-class MailingAttemptAdmin(admin.ModelAdmin):
+class MailingAttemptAdmin(ReplicaReadAdminMixin, AutocompleteFilterMediaMixin, admin.ModelAdmin):
     """Админ-панель для управления попытками рассылки."""
 
     list_display = ("mailing_info", "status_display", "attempt_time", "server_response_preview")
-    list_filter = ("status", "attempt_time", "mailing")
+    list_filter = ("status", "attempt_time", MailingAutocompleteFilter)
     search_fields = ("mailing__message__subject", "server_response")
     ordering = ("-attempt_time",)
-    readonly_fields = ("attempt_time", "mailing", "status", "server_response")
+    timing_fields = tuple(f"{phase}_us" for phase, _ in MailingAttempt.TIMING_PHASES)
+    readonly_fields = ("attempt_time", "mailing", "status", "server_response") + timing_fields
+    fieldsets = (
+        (None, {"fields": ("attempt_time", "mailing", "status", "server_response")}),
+        ("Время фаз отправки", {"fields": timing_fields}),
+    )
+    list_select_related = ("mailing__message",)
+    # Таблица большая: вместо точного COUNT(*) берём оценку, полный счётчик не показываем
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def mailing_info(self, obj):
         """Информация о рассылке."""
-        return f"#{obj.mailing.id} - {obj.mailing.message.subject}"
+        return f"#{obj.mailing_id} - {obj.mailing.message.subject}"
 
     mailing_info.short_description = "Рассылка"
 
@@ -184,12 +346,11 @@ class MailingAttemptAdmin(admin.ModelAdmin):
             "failed": "#dc3545",  # красный
         }
         color = colors.get(obj.status, "#6c757d")
-        status_text = "Успешно" if obj.status == "success" else "Ошибка"
         return format_html(
             '<span style="background-color: {}; color: white; padding: 3px 8px; '
             'border-radius: 3px; font-weight: bold;">{}</span>',
             color,
-            status_text,
+            obj.get_status_display(),
         )
 
     status_display.short_description = "Статус"
@@ -204,18 +365,22 @@ class MailingAttemptAdmin(admin.ModelAdmin):
 
 
 @admin.register(MailingLog)
-class MailingLogAdmin(admin.ModelAdmin):
+class MailingLogAdmin(ReplicaReadAdminMixin, AutocompleteFilterMediaMixin, admin.ModelAdmin):
     """Админ-панель для управления логами рассылок."""
 
     list_display = ("mailing_info", "recipient_email", "status_display", "created_at", "server_response_preview")
-    list_filter = ("status", "created_at", "mailing")
+    list_filter = ("status", "created_at", MailingAutocompleteFilter)
     search_fields = ("mailing__message__subject", "recipient_email", "server_response")
     ordering = ("-created_at",)
     readonly_fields = ("created_at", "mailing", "recipient_email", "status", "server_response")
+    list_select_related = ("mailing__message",)
+    # Таблица большая: вместо точного COUNT(*) берём оценку, полный счётчик не показываем
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def mailing_info(self, obj):
         """Информация о рассылке."""
-        return f"#{obj.mailing.id} - {obj.mailing.message.subject}"
+        return f"#{obj.mailing_id} - {obj.mailing.message.subject}"
 
     mailing_info.short_description = "Рассылка"
 
@@ -226,12 +391,11 @@ class MailingLogAdmin(admin.ModelAdmin):
             "error": "#dc3545",  # красный
         }
         color = colors.get(obj.status, "#6c757d")
-        status_text = "Успешно" if obj.status == "success" else "Ошибка"
         return format_html(
             '<span style="background-color: {}; color: white; padding: 3px 8px; '
             'border-radius: 3px; font-weight: bold;">{}</span>',
             color,
-            status_text,
+            obj.get_status_display(),
         )
 
     status_display.short_description = "Статус"
@@ -245,6 +409,30 @@ class MailingLogAdmin(admin.ModelAdmin):
     server_response_preview.short_description = "Ответ сервера"
 
 
+@admin.register(ArchivedAttemptCount)
+class ArchivedAttemptCountAdmin(admin.ModelAdmin):
+    """Админ-панель счётчиков архивных попыток (только просмотр)."""
+
+    list_display = ("mailing", "status", "count")
+    list_filter = ("status",)
+    list_select_related = ("mailing",)
+    readonly_fields = ("mailing", "status", "count")
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(SuppressedEmail)
+class SuppressedEmailAdmin(admin.ModelAdmin):
+    """Админ-панель стоп-листа адресов."""
+
+    list_display = ("email", "reason", "created_at")
+    list_filter = ("reason", "created_at")
+    search_fields = ("email",)
+    ordering = ("-created_at",)
+    readonly_fields = ("created_at",)
+
+
 # Настройка заголовка админ-панели
 admin.site.site_header = "Управление рассылками"
 admin.site.site_title = "Рассылки"
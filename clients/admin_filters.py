@@ -0,0 +1,82 @@
+from django import forms
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.widgets import AutocompleteSelect
+
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """Фильтр по внешнему ключу с AJAX-автодополнением вместо списка всех объектов.
+
+    Стандартный фильтр по ForeignKey выводит в боковую панель каждый связанный объект.
+    Здесь рендерится один select2-виджет, который подгружает варианты через
+    autocomplete-представление админки, поэтому вес страницы не зависит от размера таблицы.
+    У ModelAdmin связанной модели должны быть заданы search_fields.
+    """
+
+    template = "admin/clients/autocomplete_filter.html"
+    field_name = None
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        field = model._meta.get_field(self.field_name)
+        self.form_field = forms.ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(field, model_admin.admin_site),
+            required=False,
+        )
+
+    @classmethod
+    def get_media(cls, model_admin):
+        """Статика виджета (jQuery, select2, autocomplete.js) для подключения в ModelAdmin."""
+        field = model_admin.model._meta.get_field(cls.field_name)
+        return AutocompleteSelect(field, model_admin.admin_site).media
+
+    def rendered_widget(self):
+        value = self.value()
+        # Некорректное значение не рендерим: сам фильтр вернёт ошибку параметров
+        if value is not None and not value.isdigit():
+            value = None
+        return self.form_field.widget.render(self.parameter_name, value, attrs={"id": f"filter_{self.field_name}"})
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if self.value():
+            try:
+                return queryset.filter(**{f"{self.field_name}_id": self.value()})
+            except ValueError as e:
+                raise IncorrectLookupParameters(e)
+        return queryset
+
+    def choices(self, changelist):
+        # Единственный "вариант" — адрес страницы без этого фильтра, к нему JS добавит выбранное значение
+        yield {
+            "selected": self.value() is None,
+            "query_string": changelist.get_query_string(remove=[self.parameter_name]),
+            "display": "Все",
+        }
+
+
+class AutocompleteFilterMediaMixin:
+    """Подключает к странице списка статику автодополняемых фильтров из list_filter."""
+
+    @property
+    def media(self):
+        media = super().media
+        for list_filter in self.list_filter:
+            if isinstance(list_filter, type) and issubclass(list_filter, AutocompleteFilter):
+                media += list_filter.get_media(self)
+        return media
+
+
+class MailingAutocompleteFilter(AutocompleteFilter):
+    """Фильтр по рассылке с автодополнением."""
+
+    title = "Рассылка"
+    field_name = "mailing"
+    # Тот же параметр, что у стандартного фильтра: старые ссылки продолжают работать
+    parameter_name = "mailing__id__exact"
@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class ClientsConfig(AppConfig):
     name = "clients"
+
+    def ready(self):
+        # Подключаем учёт открытых соединений с БД
+        from . import db_metrics  # noqa: F401
+        from config import profiling
+
+        # Учёт SQL-запросов для профилирования — до открытия первого соединения
+        profiling.install()
@@ -0,0 +1,106 @@
+"""
+SMTP-бэкенд с замером фаз отправки: DNS, TCP-соединение, TLS, AUTH и передача письма (MAIL/RCPT/DATA).
+
+Ведёт себя как django.core.mail.backends.smtp.EmailBackend; накопленные с прошлого вызова
+времена забираются через pop_timings().
+"""
+
+import functools
+import smtplib
+import socket
+import time
+
+from django.core.mail.backends.smtp import EmailBackend
+
+
+class PhaseTimingMixin:
+    """Копит время фаз SMTP-сессии в self.timings (секунды по имени фазы)."""
+
+    def __init__(self, *args, timings=None, **kwargs):
+        # Словарь передаёт бэкенд: так замеры доступны, даже если конструктор упал при соединении
+        self.timings = {} if timings is None else timings
+        # Соединение открывается прямо в конструкторе smtplib.SMTP
+        super().__init__(*args, **kwargs)
+
+    def _add_timing(self, phase, started):
+        self.timings[phase] = self.timings.get(phase, 0.0) + time.perf_counter() - started
+
+    def _timed(self, phase, method, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._add_timing(phase, started)
+
+    def _resolve(self, host, port):
+        return self._timed("dns", socket.getaddrinfo, host, port, 0, socket.SOCK_STREAM)
+
+    def _connect_socket(self, host, port, timeout):
+        """TCP-соединение по адресам, уже разрешённым через DNS."""
+        error = None
+        for family, socktype, proto, canonname, address in self._resolve(host, port):
+            started = time.perf_counter()
+            try:
+                return socket.create_connection(address[:2], timeout, self.source_address)
+            except OSError as e:
+                error = e
+            finally:
+                self._add_timing("connect", started)
+        raise error
+
+    def _get_socket(self, host, port, timeout):
+        if timeout is not None and not timeout:
+            raise ValueError("Non-blocking socket (timeout=0) is not supported")
+        return self._connect_socket(host, port, timeout)
+
+    def connect(self, *args, **kwargs):
+        # Приветствие сервера (220) — тоже часть соединения
+        started = time.perf_counter()
+        before = sum(self.timings.get(phase, 0.0) for phase in ("dns", "connect", "tls"))
+        try:
+            return super().connect(*args, **kwargs)
+        finally:
+            inner = sum(self.timings.get(phase, 0.0) for phase in ("dns", "connect", "tls")) - before
+            self.timings["connect"] = self.timings.get("connect", 0.0) + time.perf_counter() - started - inner
+
+    def starttls(self, *args, **kwargs):
+        return self._timed("tls", super().starttls, *args, **kwargs)
+
+    def login(self, *args, **kwargs):
+        return self._timed("auth", super().login, *args, **kwargs)
+
+    def sendmail(self, *args, **kwargs):
+        return self._timed("data", super().sendmail, *args, **kwargs)
+
+
+class TimedSMTP(PhaseTimingMixin, smtplib.SMTP):
+    pass
+
+
+class TimedSMTP_SSL(PhaseTimingMixin, smtplib.SMTP_SSL):
+    def _get_socket(self, host, port, timeout):
+        sock = super()._get_socket(host, port, timeout)
+        # Неявный TLS (порт 465) считается отдельной фазой, как STARTTLS
+        return self._timed("tls", self.context.wrap_socket, sock, server_hostname=self._host)
+
+
+class TimedSMTPBackend(EmailBackend):
+    """SMTP-бэкенд Django с замером фаз отправки."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._timings = {}
+
+    @property
+    def connection_class(self):
+        # Соединение пишет замеры в общий с бэкендом словарь: бэкенд не зависит от того,
+        # сохраняет ли Django объект соединения, не прошедшего TLS или AUTH
+        self._timings = {}
+        connection_class = TimedSMTP_SSL if self.use_ssl else TimedSMTP
+        return functools.partial(connection_class, timings=self._timings)
+
+    def pop_timings(self):
+        """Время фаз (секунды) с прошлого вызова, в том числе соединения, которое не открылось."""
+        timings = dict(self._timings)
+        self._timings.clear()
+        return timings
@@ -0,0 +1,259 @@
+"""
+Синтетический набор данных и замеры производительности для команды run_benchmarks.
+
+Замеры выполняются в отдельной тестовой базе (как у manage.py test), поэтому рабочие данные
+не затрагиваются. Для каждого замера сохраняются время (мс) и число SQL-запросов.
+"""
+
+import platform
+import statistics
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models import Count
+from django.test import Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .delivery import MailingDeliveryService
+from .models import Mailing, MailingAttempt, Message, Recipient
+from .services import StatisticsService
+from .smtp_sink import SMTPSink
+from .views import MailingListView
+
+BENCH_DOMAIN = "bench.example.com"
+
+
+class SyntheticDataset:
+    """Генерация пользователей, получателей, рассылок и попыток массовыми вставками."""
+
+    BATCH_SIZE = 10000
+
+    def __init__(self, users=10, recipients=1000, mailings=50, recipients_per_mailing=100, attempts=1_000_000):
+        self.users = users
+        self.recipients = recipients
+        self.mailings = mailings
+        self.recipients_per_mailing = min(recipients_per_mailing, recipients)
+        self.attempts = attempts
+
+    @staticmethod
+    def exists():
+        return get_user_model().objects.filter(email__endswith=f"@{BENCH_DOMAIN}").exists()
+
+    def seed(self, log=print):
+        """Наполняет базу; первый пользователь — менеджер, остальные — обычные пользователи."""
+        User = get_user_model()
+        users = User.objects.bulk_create(
+            User(
+                username=f"bench-user-{i}",
+                email=f"bench-user-{i}@{BENCH_DOMAIN}",
+                role=User.ROLE_MANAGER if i == 0 else User.ROLE_USER,
+                is_verified=True,
+            )
+            for i in range(self.users)
+        )
+        log(f"Пользователей: {len(users)}")
+
+        now = timezone.now()
+        mailing_ids = []
+        through = Mailing.recipients.through
+        for user in users:
+            recipients = Recipient.objects.bulk_create(
+                (
+                    Recipient(
+                        email=f"r{user.pk}-{i}@{BENCH_DOMAIN}",
+                        full_name=f"Получатель {i}",
+                        comment="Синтетический получатель" if i % 3 == 0 else "",
+                        owner=user,
+                    )
+                    for i in range(self.recipients)
+                ),
+                batch_size=self.BATCH_SIZE,
+            )
+            messages = Message.objects.bulk_create(
+                Message(subject=f"Тема {i}", body=f"Здравствуйте, {{{{ full_name }}}}! Письмо {i}.", owner=user)
+                for i in range(self.mailings)
+            )
+            mailings = Mailing.objects.bulk_create(
+                Mailing(
+                    start_time=now - timedelta(days=30),
+                    end_time=now + timedelta(days=30),
+                    status=(Mailing.CREATED, Mailing.STARTED, Mailing.COMPLETED)[i % 3],
+                    owner=user,
+                    message=message,
+                )
+                for i, message in enumerate(messages)
+            )
+            links = []
+            for i, mailing in enumerate(mailings):
+                for j in range(self.recipients_per_mailing):
+                    recipient = recipients[(i + j) % len(recipients)]
+                    links.append(through(mailing_id=mailing.pk, recipient_id=recipient.pk))
+            through.objects.bulk_create(links, batch_size=self.BATCH_SIZE)
+            mailing_ids.extend(mailing.pk for mailing in mailings)
+        log(f"Получателей: {self.users * self.recipients}, рассылок: {len(mailing_ids)}")
+
+        created = 0
+        while created < self.attempts:
+            size = min(self.BATCH_SIZE, self.attempts - created)
+            MailingAttempt.objects.bulk_create(
+                MailingAttempt(
+                    mailing_id=mailing_ids[(created + i) % len(mailing_ids)],
+                    # Примерно каждая десятая попытка — ошибка
+                    status=MailingAttempt.FAILED if (created + i) % 10 == 0 else MailingAttempt.SUCCESS,
+                    server_response="Успешно отправлено",
+                )
+                for i in range(size)
+            )
+            created += size
+            if created % (self.BATCH_SIZE * 50) == 0 or created == self.attempts:
+                log(f"Попыток: {created}")
+
+    @staticmethod
+    def describe():
+        """Размер набора данных в базе."""
+        return {
+            "users": get_user_model().objects.count(),
+            "recipients": Recipient.objects.count(),
+            "messages": Message.objects.count(),
+            "mailings": Mailing.objects.count(),
+            "attempts": MailingAttempt.objects.count(),
+        }
+
+
+class BenchmarkSuite:
+    """Замеры страниц, статистики и отправки на синтетическом наборе данных."""
+
+    def __init__(self, repeat=5, send_recipients=500, log=print):
+        self.repeat = repeat
+        self.send_recipients = send_recipients
+        self.log = log
+        self.results = {}
+
+    @staticmethod
+    def _capture_queries():
+        """Счётчик запросов по всем базам, включая реплику."""
+        stack = ExitStack()
+        contexts = [stack.enter_context(CaptureQueriesContext(connection)) for connection in connections.all()]
+        return stack, contexts
+
+    def measure(self, name, func, before=None, repeat=None):
+        """Выполняет func repeat раз; before() вызывается перед каждым запуском (например, сброс кеша)."""
+        timings = []
+        queries = 0
+        for _ in range(repeat or self.repeat):
+            if before:
+                before()
+            stack, contexts = self._capture_queries()
+            with stack:
+                started = time.perf_counter()
+                func()
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = sum(len(context) for context in contexts)
+        self.results[name] = {
+            "runs": len(timings),
+            "min_ms": round(min(timings), 2),
+            "median_ms": round(statistics.median(timings), 2),
+            "max_ms": round(max(timings), 2),
+            "queries": queries,
+        }
+        self.log(f"{name}: медиана {self.results[name]['median_ms']} мс, запросов {queries}")
+
+    @staticmethod
+    def _get(client, url):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url}: HTTP {response.status_code}")
+        return response
+
+    def run(self):
+        User = get_user_model()
+        users = User.objects.filter(email__endswith=f"@{BENCH_DOMAIN}").order_by("pk")
+        for label, user in (("manager", users.filter(role=User.ROLE_MANAGER).first()), ("user", users.last())):
+            self.run_pages(label, user)
+            self.run_stats(label, user)
+        self.run_send(users.last())
+        return self.results
+
+    def run_pages(self, label, user):
+        client = Client()
+        client.force_login(user)
+        factory = RequestFactory()
+
+        def clear_caches():
+            StatisticsService.clear_user_stats_cache(user)
+
+        def mailing_list():
+            # Путь "" занят главной страницей, поэтому список рассылок вызывается напрямую
+            request = factory.get("/")
+            request.user = user
+            MailingListView.as_view()(request).render()
+
+        mailing = (
+            Mailing.objects.filter(owner=user)
+            .annotate(attempts_count=Count("attempts"))
+            .order_by("-attempts_count")
+            .first()
+        )
+        pages = {
+            "home": lambda: self._get(client, reverse("clients:home")),
+            "mailing_list": mailing_list,
+            "message_list": lambda: self._get(client, reverse("clients:message_list")),
+            "recipient_list": lambda: self._get(client, reverse("clients:recipient_list")),
+            "mailing_detail": lambda: self._get(client, reverse("clients:mailing_detail", args=[mailing.pk])),
+        }
+        for name, func in pages.items():
+            self.measure(f"{name}[{label}]", func, before=clear_caches)
+
+    def run_stats(self, label, user):
+        def cold():
+            StatisticsService.clear_user_stats_cache(user)
+
+        self.measure(f"stats_cold[{label}]", lambda: StatisticsService.get_user_stats(user), before=cold)
+        StatisticsService.get_user_stats(user)
+        self.measure(f"stats_warm[{label}]", lambda: StatisticsService.get_user_stats(user))
+
+    def run_send(self, user):
+        """Отправка через SMTP-сессию с локальным сервером-приёмником, без и с персонализацией."""
+        recipients = list(Recipient.objects.filter(owner=user).values_list("pk", flat=True)[: self.send_recipients])
+        variants = {"send_static": "Новости сервиса", "send_personalized": "Здравствуйте, {{ full_name }}"}
+        with SMTPSink() as sink:
+            smtp = {
+                "EMAIL_BACKEND": "clients.backends.TimedSMTPBackend",
+                "EMAIL_HOST": "127.0.0.1",
+                "EMAIL_PORT": sink.port,
+                "EMAIL_USE_SSL": False,
+                "EMAIL_USE_TLS": False,
+                "EMAIL_HOST_USER": "",
+                "EMAIL_HOST_PASSWORD": "",
+            }
+            for name, subject in variants.items():
+                message = Message.objects.create(subject=subject, body="Текст письма.\n" * 20, owner=user)
+                now = timezone.now()
+                mailing = Mailing.objects.create(start_time=now, end_time=now, owner=user, message=message)
+                mailing.recipients.set(recipients)
+                delivered = sink.messages
+                with override_settings(**smtp):
+                    self.measure(name, lambda: MailingDeliveryService.send(mailing), repeat=1)
+                result = self.results[name]
+                result["messages"] = len(recipients)
+                result["delivered"] = sink.messages - delivered
+                result["messages_per_second"] = round(len(recipients) / (result["median_ms"] / 1000), 1)
+                # Отправка не должна менять набор данных между запусками
+                Mailing.all_objects.filter(pk=mailing.pk).delete()
+                message.delete()
+
+    @staticmethod
+    def environment():
+        return {
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connections["default"].vendor,
+            "cache": settings.CACHES["default"]["BACKEND"],
+        }
@@ -0,0 +1,54 @@
+import threading
+from collections import Counter
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Сколько физических соединений открыл этот процесс (по алиасам БД)
+_connections_opened = Counter()
+_lock = threading.Lock()
+
+
+def _count_connection(sender, connection, **kwargs):
+    with _lock:
+        _connections_opened[connection.alias] += 1
+
+
+connection_created.connect(_count_connection, dispatch_uid="clients_db_metrics_count_connection")
+
+
+def get_pool_stats(alias="default"):
+    """Статистика соединений процесса: размер пула, ожидание, переподключения.
+
+    Для пула psycopg 3 данные берутся из ConnectionPool.get_stats(), без пула —
+    считаем только открытые соединения.
+    """
+    connection = connections[alias]
+    stats = {
+        "alias": alias,
+        "pooled": False,
+        "conn_max_age": connection.settings_dict.get("CONN_MAX_AGE"),
+        "connections_opened": _connections_opened[alias],
+    }
+
+    pool = getattr(connection, "pool", None)
+    if pool is None:
+        return stats
+
+    pool_stats = pool.get_stats()
+    stats.update(
+        {
+            "pooled": True,
+            "pool_min": pool_stats.get("pool_min"),
+            "pool_max": pool_stats.get("pool_max"),
+            "pool_size": pool_stats.get("pool_size"),
+            "pool_available": pool_stats.get("pool_available"),
+            "requests_waiting": pool_stats.get("requests_waiting"),
+            "requests_num": pool_stats.get("requests_num", 0),
+            "requests_wait_ms": pool_stats.get("requests_wait_ms", 0),
+            "requests_errors": pool_stats.get("requests_errors", 0),
+            "connections_num": pool_stats.get("connections_num", 0),
+            "connections_lost": pool_stats.get("connections_lost", 0),
+        }
+    )
+    return stats
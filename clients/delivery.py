@@ -0,0 +1,277 @@
+import email.message
+import email.policy
+import time
+from email.utils import formatdate, make_msgid
+
+from django.conf import settings
+from django.core.mail import EmailMessage, EmailMultiAlternatives, get_connection
+from django.core.mail.utils import DNS_NAME
+from django.template import Context, Engine
+from django.utils.encoding import punycode
+
+from . import metrics
+from .models import MailingAttempt, MailingLog, SuppressedEmail
+from .services import ProgressService
+
+# Отдельный движок шаблонов для писем: без загрузчиков файлов, только встроенные теги и фильтры
+message_engine = Engine()
+
+
+class CompiledMessage:
+    """Тема, текст и HTML-версия сообщения, скомпилированные один раз на запуск рассылки.
+
+    В теме и теле можно использовать переменные получателя: {{ full_name }}, {{ email }}, {{ comment }}.
+    Шаблон разбирается в конструкторе, а для каждого получателя выполняется только render.
+    Текст без тегов шаблона не компилируется вовсе и отдаётся как есть.
+    """
+
+    def __init__(self, message):
+        self.subject = self.compile(message.subject)
+        self.body = self.compile(message.body)
+        self.html_body = self.compile(message.html_body)
+
+    @staticmethod
+    def compile(text):
+        """Компилирует текст в шаблон (TemplateSyntaxError при ошибке в шаблоне)."""
+        if "{{" not in text and "{%" not in text:
+            return text
+        return message_engine.from_string(text)
+
+    @property
+    def personalized(self):
+        """Зависит ли письмо от получателя (есть ли в нём теги шаблона)."""
+        return not all(isinstance(part, str) for part in (self.subject, self.body, self.html_body))
+
+    @staticmethod
+    def get_context(recipient):
+        return {"full_name": recipient.full_name, "email": recipient.email, "comment": recipient.comment}
+
+    def render(self, recipient):
+        """Возвращает (тема, текст) письма для получателя."""
+        # Текстовая часть — без HTML-экранирования
+        subject = self._render(self.subject, recipient, autoescape=False)
+        # Перевод строки в теме недопустим в заголовке письма
+        return " ".join(subject.splitlines()), self._render(self.body, recipient, autoescape=False)
+
+    def render_html(self, recipient):
+        """HTML-версия письма для получателя (пустая строка, если её нет)."""
+        return self._render(self.html_body, recipient, autoescape=True)
+
+    def build(self, recipient=None):
+        """Письмо получателю; без recipient — общее письмо без адресата для неперсонализированного сообщения."""
+        subject, body = self.render(recipient)
+        to = [recipient.email] if recipient else []
+        email_message = EmailMultiAlternatives(subject, body, settings.DEFAULT_FROM_EMAIL, to)
+        html_body = self.render_html(recipient)
+        if html_body:
+            email_message.attach_alternative(html_body, "text/html")
+        return email_message
+
+    def _render(self, template, recipient, autoescape):
+        if isinstance(template, str):
+            return template
+        return template.render(Context(self.get_context(recipient), autoescape=autoescape))
+
+
+class PreparedMessage:
+    """MIME-письмо рассылки, собранное и закодированное один раз.
+
+    Тема, текст и HTML-часть кодируются (charset, base64 / quoted-printable) при создании,
+    а для каждого получателя к готовым байтам добавляются только заголовки To, Date и Message-ID.
+    Подходит только для сообщений без переменных получателя.
+    """
+
+    RECIPIENT_HEADERS = ("To", "Date", "Message-ID")
+    policy = email.policy.SMTP
+
+    def __init__(self, email_message):
+        mime = email_message.message(policy=self.policy)
+        for header in self.RECIPIENT_HEADERS:
+            del mime[header]
+        self.subject = email_message.subject
+        self.body = email_message.body
+        self.from_email = email_message.from_email
+        self.payload = mime.as_bytes()
+
+    @staticmethod
+    def to_header(address):
+        """Адрес для заголовка To: домен IDN кодируется punycode, как это делает EmailMessage.
+
+        Без SMTPUTF8 email.policy превратил бы домен в encoded-word, и адрес стал бы некорректным.
+        """
+        username, at, domain = address.rpartition("@")
+        if at and not domain.isascii():
+            return f"{username}@{punycode(domain)}"
+        return address
+
+    def as_bytes(self, address):
+        headers = (
+            self.policy.fold("To", self.to_header(address))
+            + self.policy.fold("Date", formatdate(localtime=settings.EMAIL_USE_LOCALTIME))
+            + self.policy.fold("Message-ID", make_msgid(domain=DNS_NAME))
+        )
+        return headers.encode("ascii") + self.payload
+
+    def for_recipient(self, address):
+        return PreparedEmail(self, address)
+
+
+class RawMIMEMessage(email.message.Message):
+    """Уже сериализованное письмо: почтовые бэкенды берут из него только as_bytes()."""
+
+    def __init__(self, data):
+        super().__init__()
+        self.data = data
+
+    def as_bytes(self, *args, **kwargs):
+        return self.data
+
+    def as_string(self, *args, **kwargs):
+        return self.data.decode("utf-8")
+
+
+class PreparedEmail(EmailMessage):
+    """Письмо одному получателю на основе PreparedMessage, без повторной сборки MIME."""
+
+    def __init__(self, prepared, address):
+        super().__init__(prepared.subject, prepared.body, prepared.from_email, [address])
+        self.prepared = prepared
+
+    def message(self, *, policy=email.policy.default):
+        return RawMIMEMessage(self.prepared.as_bytes(self.to[0]))
+
+
+class AttemptWriter:
+    """Буфер попыток рассылки: пишет их в базу пачками, а не отдельным INSERT на каждое письмо.
+
+    Пачка уходит в базу, когда набралось FLUSH_SIZE попыток или прошло FLUSH_INTERVAL секунд.
+    """
+
+    FLUSH_SIZE = 500
+    FLUSH_INTERVAL = 5.0
+
+    def __init__(self, mailing):
+        self.mailing = mailing
+        self.pending = []
+        self.last_flush = time.monotonic()
+        # Время записи предыдущей пачки в расчёте на одну попытку, мкс
+        self.db_us = None
+
+    def add(self, status, server_response, timings=None):
+        """Добавляет попытку; timings — время фаз отправки письма в секундах."""
+        fields = {f"{phase}_us": round(seconds * 1_000_000) for phase, seconds in (timings or {}).items()}
+        self.pending.append(
+            MailingAttempt(
+                mailing=self.mailing, status=status, server_response=server_response, db_us=self.db_us, **fields
+            )
+        )
+        if len(self.pending) >= self.FLUSH_SIZE or time.monotonic() - self.last_flush >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            started = time.perf_counter()
+            MailingAttempt.objects.bulk_create(self.pending)
+            elapsed = time.perf_counter() - started
+            metrics.attempt_flush_size.observe(len(self.pending))
+            metrics.attempt_flush_seconds.observe(elapsed)
+            self.db_us = round(elapsed * 1_000_000 / len(self.pending))
+            self.pending = []
+        self.last_flush = time.monotonic()
+
+
+class MailingDeliveryService:
+    """Отправка писем рассылки её получателям."""
+
+    RECIPIENT_FIELDS = ("email", "full_name", "comment")
+    RECIPIENT_CHUNK_SIZE = 2000
+    SKIPPED_BATCH_SIZE = 1000
+
+    @staticmethod
+    def send(mailing):
+        """Отправляет рассылку всем получателям. Возвращает (успешно, ошибок).
+
+        Адреса из стоп-листа пропускаются до обращения к SMTP и попадают в лог со статусом «Пропущено».
+        """
+        success_count = 0
+        error_count = 0
+        skipped_logs = []
+        attempts = AttemptWriter(mailing)
+        compiled = CompiledMessage(mailing.message)
+        # Без переменных получателя письмо одинаково для всех: MIME собирается один раз
+        prepared = None if compiled.personalized else PreparedMessage(compiled.build())
+        recipients = mailing.get_recipients()
+        suppressed = SuppressedEmail.suppressed_for(recipients)
+        ProgressService.start(mailing.pk, recipients.count())
+
+        # Одна SMTP-сессия на всю рассылку вместо соединения на каждое письмо
+        connection = get_connection()
+        # Пропущенные пишутся в лог пачками по ходу отправки, а не копятся в памяти до конца.
+        # finally: при сбое посреди рассылки записанное сохраняется, а прогресс не остаётся «идёт»
+        try:
+            # Получатели читаются потоком, порциями, а не загружаются в память целиком
+            for recipient in recipients.only(*MailingDeliveryService.RECIPIENT_FIELDS).iterator(
+                chunk_size=MailingDeliveryService.RECIPIENT_CHUNK_SIZE
+            ):
+                if recipient.email.lower() in suppressed:
+                    skipped_logs.append(
+                        MailingLog(
+                            mailing=mailing,
+                            recipient_email=recipient.email,
+                            status=MailingLog.SKIPPED,
+                            server_response="Адрес в стоп-листе",
+                        )
+                    )
+                    if len(skipped_logs) >= MailingDeliveryService.SKIPPED_BATCH_SIZE:
+                        MailingLog.objects.bulk_create(skipped_logs)
+                        skipped_logs = []
+                    ProgressService.increment(mailing.pk, MailingLog.SKIPPED)
+                    metrics.messages_skipped.inc()
+                    continue
+                timings = {}
+                try:
+                    started = time.perf_counter()
+                    if prepared:
+                        email_message = prepared.for_recipient(recipient.email)
+                    else:
+                        email_message = compiled.build(recipient)
+                    timings["render"] = time.perf_counter() - started
+                    MailingDeliveryService._open(connection)
+                    started = time.perf_counter()
+                    connection.send_messages([email_message])
+                    sent = time.perf_counter() - started
+                    metrics.smtp_send_seconds.observe(sent)
+                    timings.update(MailingDeliveryService._pop_timings(connection, data=sent))
+                    attempts.add(MailingAttempt.SUCCESS, "Успешно отправлено", timings)
+                    ProgressService.increment(mailing.pk, MailingAttempt.SUCCESS)
+                    metrics.messages_sent.inc()
+                    success_count += 1
+                except Exception as e:
+                    timings.update(MailingDeliveryService._pop_timings(connection))
+                    attempts.add(MailingAttempt.FAILED, str(e), timings)
+                    ProgressService.increment(mailing.pk, MailingAttempt.FAILED)
+                    metrics.messages_failed.inc()
+                    error_count += 1
+                    # После ошибки SMTP-сессия может быть в неопределённом состоянии
+                    connection.close()
+        finally:
+            connection.close()
+            attempts.flush()
+            MailingLog.objects.bulk_create(skipped_logs)
+            ProgressService.finish(mailing.pk)
+            metrics.registry.flush()
+        return success_count, error_count
+
+    @staticmethod
+    def _open(connection):
+        """Открывает соединение, если оно ещё не открыто или закрыто после ошибки."""
+        started = time.perf_counter()
+        # open() возвращает True, только если соединение действительно открылось
+        if connection.open():
+            metrics.smtp_connect_seconds.observe(time.perf_counter() - started)
+
+    @staticmethod
+    def _pop_timings(connection, **defaults):
+        """Время фаз SMTP-сессии от бэкенда; у бэкендов без замера — только то, что измерено снаружи."""
+        pop_timings = getattr(connection, "pop_timings", None)
+        return {**defaults, **pop_timings()} if pop_timings else defaults
@@ -1,28 +1,33 @@
 from django import forms
 from django.forms import ModelForm, DateTimeInput, ModelMultipleChoiceField
 from django.core.exceptions import ValidationError
+from django.template import TemplateSyntaxError
 from django.utils import timezone
-from .models import Mailing, Message, Recipient
+from .delivery import CompiledMessage
+from .models import Mailing, Message, Recipient, Segment, Tag
 
 
 class MailingForm(ModelForm):
     """Форма для создания и редактирования рассылки."""
 
     recipients = ModelMultipleChoiceField(
-        queryset=Recipient.objects.all(), widget=forms.CheckboxSelectMultiple, label="Получатели", required=True
+        queryset=Recipient.objects.none(), widget=forms.CheckboxSelectMultiple, label="Получатели", required=False
     )
 
     class Meta:
         model = Mailing
-        fields = ["start_time", "end_time", "message", "recipients"]
+        fields = ["start_time", "end_time", "message", "segment", "recipients"]
         widgets = {
             "start_time": DateTimeInput(attrs={"type": "datetime-local"}, format="%Y-%m-%dT%H:%M"),
             "end_time": DateTimeInput(attrs={"type": "datetime-local"}, format="%Y-%m-%dT%H:%M"),
         }
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, user, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields["message"].queryset = Message.objects.all()
+        # В форме только сообщения и получатели, доступные пользователю
+        self.fields["message"].queryset = Message.objects.for_user(user)
+        self.fields["segment"].queryset = Segment.objects.for_user(user)
+        self.fields["recipients"].queryset = Recipient.objects.for_user(user)
         self.fields["start_time"].input_formats = ["%Y-%m-%dT%H:%M"]
         self.fields["end_time"].input_formats = ["%Y-%m-%dT%H:%M"]
 
@@ -44,26 +49,118 @@ class MailingForm(ModelForm):
                 }
             )
 
+        # Получателей задаёт либо сегмент, либо явный список
+        segment = cleaned_data.get("segment")
+        recipients = cleaned_data.get("recipients")
+        if segment and recipients:
+            raise ValidationError({"recipients": "Выберите сегмент или получателей, но не то и другое"})
+        if not segment and not recipients and "recipients" not in self.errors:
+            raise ValidationError({"recipients": "Выберите сегмент или хотя бы одного получателя"})
+
         return cleaned_data
 
 
 class MessageForm(ModelForm):
     """Форма для создания и редактирования сообщения."""
 
+    TEMPLATE_HELP = "Можно использовать переменные получателя: {{ full_name }}, {{ email }}, {{ comment }}"
+
     class Meta:
         model = Message
-        fields = ["subject", "body"]
+        fields = ["subject", "body", "html_body"]
         widgets = {
             "body": forms.Textarea(attrs={"rows": 5}),
+            "html_body": forms.Textarea(attrs={"rows": 5}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["body"].help_text = self.TEMPLATE_HELP
+        self.fields["html_body"].help_text = self.TEMPLATE_HELP
+
+    def clean_subject(self):
+        return self._clean_template("subject")
+
+    def clean_body(self):
+        return self._clean_template("body")
+
+    def clean_html_body(self):
+        return self._clean_template("html_body")
+
+    def _clean_template(self, field):
+        """Проверяем, что текст компилируется как шаблон письма."""
+        value = self.cleaned_data.get(field)
+        try:
+            CompiledMessage.compile(value)
+        except TemplateSyntaxError as e:
+            raise ValidationError(f"Ошибка в шаблоне: {e}")
+        return value
+
 
 class RecipientForm(ModelForm):
     """Форма для создания и редактирования получателя."""
 
+    tags = forms.CharField(
+        label="Теги", required=False, help_text="Через запятую; новые теги создаются автоматически", max_length=500
+    )
+
     class Meta:
         model = Recipient
         fields = ["email", "full_name", "comment"]
         widgets = {
             "comment": forms.Textarea(attrs={"rows": 3}),
         }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial["tags"] = ", ".join(tag.name for tag in self.instance.tags.all())
+
+    def clean_tags(self):
+        names = {name.strip() for name in self.cleaned_data["tags"].split(",")}
+        names.discard("")
+        too_long = [name for name in names if len(name) > Tag._meta.get_field("name").max_length]
+        if too_long:
+            raise ValidationError(f"Слишком длинный тег: {too_long[0]}")
+        return sorted(names)
+
+    def _save_m2m(self):
+        super()._save_m2m()
+        # Теги принадлежат владельцу получателя
+        owner = self.instance.owner
+        existing = {tag.name: tag for tag in Tag.objects.filter(owner=owner, name__in=self.cleaned_data["tags"])}
+        missing = [Tag(owner=owner, name=name) for name in self.cleaned_data["tags"] if name not in existing]
+        Tag.objects.bulk_create(missing, ignore_conflicts=True)
+        self.instance.tags.set(Tag.objects.filter(owner=owner, name__in=self.cleaned_data["tags"]))
+
+
+class SegmentForm(ModelForm):
+    """Форма сегмента получателей."""
+
+    tags = ModelMultipleChoiceField(
+        queryset=Tag.objects.none(), widget=forms.CheckboxSelectMultiple, label="Теги", required=False
+    )
+
+    class Meta:
+        model = Segment
+        fields = ["name", "tags", "created_from", "created_to"]
+        widgets = {
+            "created_from": DateTimeInput(attrs={"type": "datetime-local"}, format="%Y-%m-%dT%H:%M"),
+            "created_to": DateTimeInput(attrs={"type": "datetime-local"}, format="%Y-%m-%dT%H:%M"),
+        }
+
+    def __init__(self, *args, user, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Теги сегмента — только теги владельца сегмента
+        owner = self.instance.owner if self.instance.pk else user
+        self.fields["tags"].queryset = Tag.objects.filter(owner=owner)
+        self.fields["created_from"].input_formats = ["%Y-%m-%dT%H:%M"]
+        self.fields["created_to"].input_formats = ["%Y-%m-%dT%H:%M"]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        created_from = cleaned_data.get("created_from")
+        created_to = cleaned_data.get("created_to")
+        if created_from and created_to and created_from > created_to:
+            raise ValidationError({"created_to": "Конец периода должен быть не раньше начала"})
+        return cleaned_data
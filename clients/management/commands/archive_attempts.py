@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from clients.services import ArchiveService
+
+
+class Command(BaseCommand):
+    help = "Перенос старых попыток и логов рассылок в сжатый архив на диске"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than", type=int, required=True, help="Архивировать записи старше указанного числа дней"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=ArchiveService.BATCH_SIZE, help="Размер порции на одну транзакцию"
+        )
+        parser.add_argument("--archive-dir", help="Каталог архива (по умолчанию settings.ARCHIVE_DIR)")
+        parser.add_argument(
+            "--only", choices=list(ArchiveService.ARCHIVES), help="Архивировать только попытки или только логи"
+        )
+
+    def handle(self, *args, **options):
+        older_than = timezone.now() - timedelta(days=options["older_than"])
+        kinds = [options["only"]] if options["only"] else list(ArchiveService.ARCHIVES)
+
+        for kind in kinds:
+            total = ArchiveService.archive(
+                kind, older_than, batch_size=options["batch_size"], directory=options["archive_dir"]
+            )
+            self.stdout.write(self.style.SUCCESS(f"{kind}: перенесено в архив {total} записей"))
@@ -0,0 +1,47 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+
+from clients.db_metrics import get_pool_stats
+
+
+class Command(BaseCommand):
+    help = "Замер запросов в секунду при текущих настройках соединений с БД (CONN_MAX_AGE / пул)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000, help="Сколько запросов выполнить")
+        parser.add_argument("--threads", type=int, default=4, help="Число параллельных потоков")
+
+    def handle(self, *args, **options):
+        total = options["requests"]
+        threads = options["threads"]
+        opened_before = get_pool_stats()["connections_opened"]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(self._fake_request, range(total)))
+        elapsed = time.perf_counter() - started
+
+        stats = get_pool_stats()
+        self.stdout.write(f"Запросов: {total}, потоков: {threads}, время: {elapsed:.2f} с")
+        self.stdout.write(self.style.SUCCESS(f"Запросов в секунду: {total / elapsed:.1f}"))
+        self.stdout.write(f"Открыто соединений: {stats['connections_opened'] - opened_before}")
+        if stats["pooled"]:
+            self.stdout.write(
+                f"Пул: размер {stats['pool_size']}, ожидание {stats['requests_wait_ms']} мс, "
+                f"потеряно соединений {stats['connections_lost']}"
+            )
+
+    @staticmethod
+    def _fake_request(_):
+        """Цикл запроса Django: сигналы начала/конца закрывают или возвращают соединение как в веб-воркере."""
+        request_started.send(sender=Command)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+        finally:
+            request_finished.send(sender=Command)
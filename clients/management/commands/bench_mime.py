@@ -0,0 +1,44 @@
+import time
+
+from django.core.mail import EmailMultiAlternatives
+from django.core.management.base import BaseCommand
+
+from clients.delivery import CompiledMessage, PreparedMessage
+from clients.models import Message
+
+
+class Command(BaseCommand):
+    help = "Замер сборки MIME: письмо, собранное один раз на рассылку, против сборки на каждого получателя"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recipients", type=int, default=20000, help="Число получателей")
+        parser.add_argument("--no-html", action="store_true", help="Без HTML-версии письма")
+
+    def handle(self, *args, **options):
+        count = options["recipients"]
+        message = Message(
+            subject="Новости сервиса рассылок за октябрь",
+            body="Здравствуйте!\n\n" + "Мы обновили сервис рассылок и подготовили подборку новостей.\n" * 20,
+            html_body="" if options["no_html"] else "<p>Здравствуйте!</p>" + "<p>Подборка новостей.</p>" * 20,
+        )
+        addresses = [f"user{i}@example.com" for i in range(count)]
+        compiled = CompiledMessage(message)
+
+        started = time.perf_counter()
+        for address in addresses:
+            # То же, что send_mail: сборка и кодирование письма для каждого получателя
+            email_message = EmailMultiAlternatives(compiled.subject, compiled.body, to=[address])
+            if compiled.html_body:
+                email_message.attach_alternative(compiled.html_body, "text/html")
+            email_message.message(policy=PreparedMessage.policy).as_bytes()
+        every = time.perf_counter() - started
+
+        started = time.perf_counter()
+        prepared = PreparedMessage(compiled.build())
+        for address in addresses:
+            prepared.for_recipient(address).message().as_bytes()
+        once = time.perf_counter() - started
+
+        self.stdout.write(f"Получателей: {count}")
+        self.stdout.write(self.style.SUCCESS(f"MIME один раз:     {once:.2f} с ({count / once:.0f} писем/с)"))
+        self.stdout.write(f"MIME на каждого:   {every:.2f} с ({count / every:.0f} писем/с)")
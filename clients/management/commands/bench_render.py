@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from clients.delivery import CompiledMessage
+from clients.models import Message, Recipient
+
+
+class Command(BaseCommand):
+    help = "Замер стоимости персонализации писем: компиляция шаблона один раз против разбора на каждого получателя"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recipients", type=int, default=100000, help="Число получателей")
+
+    def handle(self, *args, **options):
+        count = options["recipients"]
+        message = Message(
+            subject="Здравствуйте, {{ full_name }}!",
+            body=(
+                "Уважаемый(ая) {{ full_name }},\n\n"
+                "Письмо отправлено на {{ email }}.\n{% if comment %}{{ comment }}{% endif %}"
+            ),
+        )
+        recipients = [
+            Recipient(full_name=f"Получатель {i}", email=f"user{i}@example.com", comment="") for i in range(count)
+        ]
+
+        started = time.perf_counter()
+        compiled = CompiledMessage(message)
+        for recipient in recipients:
+            compiled.render(recipient)
+        once = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for recipient in recipients:
+            CompiledMessage(message).render(recipient)
+        every = time.perf_counter() - started
+
+        self.stdout.write(f"Получателей: {count}")
+        self.stdout.write(self.style.SUCCESS(f"Компиляция один раз: {once:.2f} с ({count / once:.0f} писем/с)"))
+        self.stdout.write(f"Разбор на каждого:   {every:.2f} с ({count / every:.0f} писем/с)")
@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clients.services import ExportService
+
+
+class Command(BaseCommand):
+    help = "Потоковая выгрузка попыток или логов рассылок в CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(ExportService.EXPORTS), help="Что выгружать: attempts или logs")
+        parser.add_argument("--output", "-o", help="Путь к файлу (по умолчанию stdout)")
+        parser.add_argument("--mailing", type=int, help="ID рассылки")
+        parser.add_argument("--owner", type=int, help="ID владельца рассылки")
+        parser.add_argument("--date-from", help="Начальная дата YYYY-MM-DD")
+        parser.add_argument("--date-to", help="Конечная дата YYYY-MM-DD (включительно)")
+        parser.add_argument("--status", help="Статус попытки/лога")
+
+    def handle(self, *args, **options):
+        kind = options["kind"]
+        try:
+            queryset = ExportService.get_queryset(
+                kind,
+                mailing=options["mailing"],
+                owner=options["owner"],
+                date_from=options["date_from"],
+                date_to=options["date_to"],
+                status=options["status"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        output = open(options["output"], "w", encoding="utf-8", newline="") if options["output"] else sys.stdout
+        try:
+            for line in ExportService.iter_csv(kind, queryset):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        if options["output"]:
+            self.stderr.write(self.style.SUCCESS(f"Выгрузка сохранена в {options['output']}"))
@@ -0,0 +1,60 @@
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clients.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = "Локальный SMTP-сервер для нагрузочных тестов отправки: задержки, отказы 4xx/5xx, обрывы соединений"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1", help="Адрес для приёма соединений")
+        parser.add_argument("--port", type=int, default=1025, help="Порт")
+        parser.add_argument("--latency", type=float, default=0, help="Задержка ответа на письмо, мс")
+        parser.add_argument("--connect-latency", type=float, default=0, help="Задержка приветствия сервера, мс")
+        parser.add_argument("--temp-fail-rate", type=float, default=0, help="Доля писем с ответом 4xx (0..1)")
+        parser.add_argument("--perm-fail-rate", type=float, default=0, help="Доля писем с ответом 5xx (0..1)")
+        parser.add_argument(
+            "--drop-rate", type=float, default=0, help="Доля писем, на которых рвётся соединение (0..1)"
+        )
+        parser.add_argument("--max-sessions", type=int, help="Максимум одновременных SMTP-сессий")
+        parser.add_argument("--seed", type=int, help="Зерно генератора для воспроизводимых отказов")
+        parser.add_argument("--report-interval", type=float, default=10, help="Как часто печатать счётчики, с")
+
+    def handle(self, *args, **options):
+        rates = (options["temp_fail_rate"], options["perm_fail_rate"], options["drop_rate"])
+        if any(rate < 0 for rate in rates) or sum(rates) > 1:
+            raise CommandError("Доли отказов и обрывов должны быть неотрицательными и в сумме не больше 1")
+
+        sink = SMTPSink(
+            host=options["host"],
+            port=options["port"],
+            latency=options["latency"] / 1000,
+            connect_latency=options["connect_latency"] / 1000,
+            temporary_failure_rate=options["temp_fail_rate"],
+            permanent_failure_rate=options["perm_fail_rate"],
+            drop_rate=options["drop_rate"],
+            max_sessions=options["max_sessions"],
+            seed=options["seed"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"SMTP-сервер слушает {options['host']}:{sink.port}, Ctrl+C — остановка"))
+
+        stopped = threading.Event()
+        reporter = threading.Thread(target=self.report, args=(sink, options["report_interval"], stopped), daemon=True)
+        reporter.start()
+        try:
+            sink.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stopped.set()
+            sink.server_close()
+            self.write_stats(sink)
+
+    def report(self, sink, interval, stopped):
+        while not stopped.wait(interval):
+            self.write_stats(sink)
+
+    def write_stats(self, sink):
+        self.stdout.write(", ".join(f"{name}: {value}" for name, value in sink.stats().items()))
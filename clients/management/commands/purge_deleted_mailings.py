@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from clients.services import MailingService
+
+
+class Command(BaseCommand):
+    help = "Удаление помеченных рассылок вместе с попытками и логами порциями"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=MailingService.PURGE_BATCH_SIZE, help="Размер порции на одну транзакцию"
+        )
+
+    def handle(self, *args, **options):
+        total = MailingService.purge_deleted(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Удалено рассылок: {total}"))
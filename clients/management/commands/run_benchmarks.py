@@ -0,0 +1,68 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.utils import timezone
+
+from clients.benchmarks import BenchmarkSuite, SyntheticDataset
+
+
+class Command(BaseCommand):
+    help = "Замеры производительности на синтетических данных в отдельной тестовой базе; результат — JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10, help="Число пользователей")
+        parser.add_argument("--recipients", type=int, default=1000, help="Получателей на пользователя")
+        parser.add_argument("--mailings", type=int, default=50, help="Рассылок на пользователя")
+        parser.add_argument("--recipients-per-mailing", type=int, default=100, help="Получателей в рассылке")
+        parser.add_argument("--attempts", type=int, default=1_000_000, help="Всего попыток рассылок")
+        parser.add_argument("--send-recipients", type=int, default=500, help="Получателей в замере отправки")
+        parser.add_argument("--repeat", type=int, default=5, help="Сколько раз повторять каждый замер")
+        parser.add_argument("--output", default="benchmark.json", help="Файл для результатов")
+        parser.add_argument(
+            "--keepdb", action="store_true", help="Не удалять тестовую базу и не наполнять её повторно"
+        )
+
+    def handle(self, *args, **options):
+        log = self.stdout.write
+        setup_test_environment()
+        # Тестовая база, как у manage.py test; без сериализации — данных много
+        old_config = setup_databases(
+            verbosity=options["verbosity"], interactive=False, keepdb=options["keepdb"], serialized_aliases=set()
+        )
+        # Отдельный префикс, чтобы не смешивать ключи кеша с рабочими
+        caches = {alias: {**config, "KEY_PREFIX": "bench"} for alias, config in settings.CACHES.items()}
+        try:
+            with override_settings(CACHES=caches):
+                dataset = SyntheticDataset(
+                    users=options["users"],
+                    recipients=options["recipients"],
+                    mailings=options["mailings"],
+                    recipients_per_mailing=options["recipients_per_mailing"],
+                    attempts=options["attempts"],
+                )
+                if SyntheticDataset.exists():
+                    log("Набор данных уже есть в базе, наполнение пропущено")
+                else:
+                    dataset.seed(log=log)
+                suite = BenchmarkSuite(repeat=options["repeat"], send_recipients=options["send_recipients"], log=log)
+                report = {
+                    "started_at": timezone.now().isoformat(),
+                    "environment": BenchmarkSuite.environment(),
+                    "dataset": SyntheticDataset.describe(),
+                    "results": suite.run(),
+                }
+        finally:
+            teardown_databases(old_config, verbosity=options["verbosity"], keepdb=options["keepdb"])
+            teardown_test_environment()
+
+        with open(options["output"], "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Результаты записаны в {options['output']}"))
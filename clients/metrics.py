@@ -0,0 +1,225 @@
+"""
+Метрики подсистемы отправки в текстовом формате Prometheus.
+
+Счётчики и гистограммы копятся в памяти процесса и раз в FLUSH_INTERVAL секунд
+(а также в конце отправки и перед выдачей метрик) добавляются в Redis через cache.incr.
+Поэтому значения суммируются по всем веб-процессам и воркерам, а запрос к Redis
+делается не на каждое письмо. Gauge-метрики вычисляются в момент запроса метрик;
+метрики соединений с базой (db_*) относятся к процессу, который отдал ответ.
+"""
+
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from users.models import OutgoingEmail
+
+from .db_metrics import get_pool_stats
+from .models import Mailing
+
+logger = logging.getLogger("clients.metrics")
+
+
+class Counter:
+    """Монотонный счётчик."""
+
+    type = "counter"
+
+    def __init__(self, registry, name, documentation):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+
+    def inc(self, amount=1):
+        self.registry.add(self.name, amount)
+
+    def keys(self):
+        return [self.name]
+
+    def samples(self, values):
+        yield self.name, values.get(self.name, 0)
+
+
+class Histogram:
+    """Гистограмма: число наблюдений по корзинам, сумма и количество."""
+
+    type = "histogram"
+    # Сумма хранится в Redis целым числом, в миллионных долях
+    SUM_SCALE = 1_000_000
+
+    def __init__(self, registry, name, documentation, buckets):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value):
+        bucket = next((le for le in self.buckets if value <= le), "+Inf")
+        self.registry.add(f"{self.name}_bucket:{bucket}", 1)
+        self.registry.add(f"{self.name}_sum", round(value * self.SUM_SCALE))
+        self.registry.add(f"{self.name}_count", 1)
+
+    def keys(self):
+        return [f"{self.name}_bucket:{le}" for le in (*self.buckets, "+Inf")] + [
+            f"{self.name}_sum",
+            f"{self.name}_count",
+        ]
+
+    def samples(self, values):
+        cumulative = 0
+        for le in (*self.buckets, "+Inf"):
+            cumulative += values.get(f"{self.name}_bucket:{le}", 0)
+            yield f'{self.name}_bucket{{le="{le}"}}', cumulative
+        yield f"{self.name}_sum", values.get(f"{self.name}_sum", 0) / self.SUM_SCALE
+        yield f"{self.name}_count", values.get(f"{self.name}_count", 0)
+
+
+class Gauge:
+    """Текущее значение, которое вычисляет функция в момент запроса метрик."""
+
+    type = "gauge"
+
+    def __init__(self, registry, name, documentation, function):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+
+    def keys(self):
+        return []
+
+    def samples(self, values):
+        yield self.name, self.function()
+
+
+class MetricsRegistry:
+    """Реестр метрик с общим для всех процессов хранилищем в кеше (Redis)."""
+
+    KEY_PREFIX = "metrics"
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self):
+        self.metrics = []
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def counter(self, name, documentation):
+        return self._register(Counter(self, name, documentation))
+
+    def histogram(self, name, documentation, buckets):
+        return self._register(Histogram(self, name, documentation, buckets))
+
+    def gauge(self, name, documentation, function):
+        return self._register(Gauge(self, name, documentation, function))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def _key(self, name):
+        return f"{self.KEY_PREFIX}:{name}"
+
+    def add(self, name, amount):
+        with self._lock:
+            self._pending[name] = self._pending.get(name, 0) + amount
+            due = time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Переносит накопленные в процессе приращения в общее хранилище."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        for name, amount in pending.items():
+            if not amount:
+                continue
+            key = self._key(name)
+            try:
+                try:
+                    cache.incr(key, amount)
+                except ValueError:
+                    # Ключа ещё нет: add не перезапишет значение, если его успел создать другой процесс
+                    cache.add(key, 0, timeout=None)
+                    cache.incr(key, amount)
+            except Exception:
+                logger.warning("Не удалось сохранить метрику %s", name, exc_info=True)
+                with self._lock:
+                    self._pending[name] = self._pending.get(name, 0) + amount
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+        self.flush()
+        keys = [key for metric in self.metrics for key in metric.keys()]
+        stored = cache.get_many([self._key(key) for key in keys])
+        values = {key: stored.get(self._key(key), 0) for key in keys}
+
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name} {value}" for name, value in metric.samples(values))
+        return "\n".join(lines) + "\n"
+
+
+def _queue_depth():
+    now = timezone.now()
+    return Mailing.objects.filter(status=Mailing.CREATED, start_time__lte=now, end_time__gte=now).count()
+
+
+def _outbox_pending():
+    return OutgoingEmail.objects.filter(status=OutgoingEmail.PENDING).count()
+
+
+def _outbox_retry_backlog():
+    return OutgoingEmail.objects.filter(status=OutgoingEmail.PENDING, attempts__gt=0).count()
+
+
+def _pool_stat(key):
+    return lambda: get_pool_stats().get(key) or 0
+
+
+registry = MetricsRegistry()
+
+messages_sent = registry.counter("mailing_messages_sent_total", "Отправлено писем")
+messages_failed = registry.counter("mailing_messages_failed_total", "Писем с ошибкой отправки")
+messages_skipped = registry.counter("mailing_messages_skipped_total", "Писем, пропущенных по стоп-листу")
+smtp_connect_seconds = registry.histogram(
+    "smtp_connect_seconds", "Время открытия SMTP-соединения, с", buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+smtp_send_seconds = registry.histogram(
+    "smtp_send_seconds", "Время отправки одного письма, с", buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+attempt_flush_size = registry.histogram(
+    "mailing_attempt_flush_size", "Попыток в одной записи в базу", buckets=(1, 10, 50, 100, 250, 500, 1000)
+)
+attempt_flush_seconds = registry.histogram(
+    "mailing_attempt_flush_seconds",
+    "Время записи пачки попыток в базу, с",
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+queue_depth = registry.gauge(
+    "mailing_queue_depth", "Рассылок, ожидающих отправки (статус «Создана», в периоде отправки)", _queue_depth
+)
+outbox_pending = registry.gauge("outbox_pending", "Системных писем в очереди на отправку", _outbox_pending)
+outbox_retry_backlog = registry.gauge(
+    "outbox_retry_backlog", "Системных писем, ожидающих повторной попытки после ошибки", _outbox_retry_backlog
+)
+db_connections_opened = registry.gauge(
+    "db_connections_opened", "Физических соединений с базой, открытых процессом", _pool_stat("connections_opened")
+)
+db_pool_size = registry.gauge("db_pool_size", "Соединений в пуле процесса (0 без пула)", _pool_stat("pool_size"))
+db_pool_available = registry.gauge("db_pool_available", "Свободных соединений в пуле", _pool_stat("pool_available"))
+db_pool_requests_waiting = registry.gauge(
+    "db_pool_requests_waiting", "Запросов, ждущих соединение из пула", _pool_stat("requests_waiting")
+)
+db_pool_requests_wait_ms = registry.gauge(
+    "db_pool_requests_wait_ms", "Суммарное ожидание соединения из пула, мс", _pool_stat("requests_wait_ms")
+)
+db_pool_connections_lost = registry.gauge(
+    "db_pool_connections_lost", "Соединений пула, потерянных и открытых заново", _pool_stat("connections_lost")
+)
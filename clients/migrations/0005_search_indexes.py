@@ -0,0 +1,75 @@
+# Generated by Django 6.0 on 2026-10-19 09:14
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+from django.db.models.functions import Upper
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся CONCURRENTLY, чтобы не блокировать запись в большие таблицы
+    atomic = False
+
+    dependencies = [
+        ("clients", "0004_populate_owner_fields"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name="mailingattempt",
+            index=GinIndex(
+                OpClass(Upper("server_response"), name="gin_trgm_ops"),
+                name="attempt_server_response_trgm",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="mailinglog",
+            index=GinIndex(
+                OpClass(Upper("recipient_email"), name="gin_trgm_ops"),
+                name="log_recipient_email_trgm",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="mailinglog",
+            index=GinIndex(
+                OpClass(Upper("server_response"), name="gin_trgm_ops"),
+                name="log_server_response_trgm",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="message",
+            index=GinIndex(
+                OpClass(Upper("subject"), name="gin_trgm_ops"),
+                name="message_subject_trgm",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="message",
+            index=GinIndex(
+                OpClass(Upper("body"), name="gin_trgm_ops"),
+                name="message_body_trgm",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="recipient",
+            index=GinIndex(
+                OpClass(Upper("full_name"), name="gin_trgm_ops"),
+                name="recipient_full_name_trgm",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="recipient",
+            index=GinIndex(
+                OpClass(Upper("email"), name="gin_trgm_ops"),
+                name="recipient_email_trgm",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="recipient",
+            index=GinIndex(
+                OpClass(Upper("comment"), name="gin_trgm_ops"),
+                name="recipient_comment_trgm",
+            ),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 6.0 on 2026-10-19 06:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clients", "0005_search_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedAttemptCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("success", "Успешно"), ("failed", "Не успешно")],
+                        max_length=20,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "count",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Количество"
+                    ),
+                ),
+                (
+                    "mailing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_counts",
+                        to="clients.mailing",
+                        verbose_name="Рассылка",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Архивные попытки",
+                "verbose_name_plural": "Архивные попытки",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("mailing", "status"),
+                        name="archived_attempt_count_unique",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 6.0 on 2026-10-19 06:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clients", "0006_archivedattemptcount"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mailing",
+            name="deleted_at",
+            field=models.DateTimeField(
+                blank=True, db_index=True, null=True, verbose_name="Дата удаления"
+            ),
+        ),
+    ]
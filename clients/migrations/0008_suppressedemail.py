@@ -0,0 +1,69 @@
+# Generated by Django 6.0 on 2026-10-19 06:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clients", "0007_mailing_deleted_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SuppressedEmail",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "email",
+                    models.EmailField(
+                        max_length=255, unique=True, verbose_name="Email"
+                    ),
+                ),
+                (
+                    "reason",
+                    models.CharField(
+                        choices=[
+                            ("bounced", "Жёсткий отказ"),
+                            ("unsubscribed", "Отписка"),
+                            ("complained", "Жалоба"),
+                        ],
+                        max_length=20,
+                        verbose_name="Причина",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата добавления"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Адрес в стоп-листе",
+                "verbose_name_plural": "Стоп-лист",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AlterField(
+            model_name="mailinglog",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("success", "Успешно"),
+                    ("error", "Ошибка"),
+                    ("skipped", "Пропущено"),
+                ],
+                max_length=10,
+                verbose_name="Статус",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-19 06:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clients", "0008_suppressedemail"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="html_body",
+            field=models.TextField(
+                blank=True,
+                help_text="Необязательная HTML-версия, отправляется вместе с текстом",
+                verbose_name="HTML-версия письма",
+            ),
+        ),
+    ]
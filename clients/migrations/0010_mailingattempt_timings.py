@@ -0,0 +1,62 @@
+# Generated by Django 6.0 on 2026-10-19 06:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clients", "0009_message_html_body"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mailingattempt",
+            name="auth_us",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="AUTH, мкс"
+            ),
+        ),
+        migrations.AddField(
+            model_name="mailingattempt",
+            name="connect_us",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="Соединение, мкс"
+            ),
+        ),
+        migrations.AddField(
+            model_name="mailingattempt",
+            name="data_us",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="Передача письма, мкс"
+            ),
+        ),
+        migrations.AddField(
+            model_name="mailingattempt",
+            name="db_us",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="Запись в базу, мкс"
+            ),
+        ),
+        migrations.AddField(
+            model_name="mailingattempt",
+            name="dns_us",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="DNS, мкс"
+            ),
+        ),
+        migrations.AddField(
+            model_name="mailingattempt",
+            name="render_us",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="Сборка письма, мкс"
+            ),
+        ),
+        migrations.AddField(
+            model_name="mailingattempt",
+            name="tls_us",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="TLS, мкс"
+            ),
+        ),
+    ]
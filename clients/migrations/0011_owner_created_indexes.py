@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-19 06:53
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся CONCURRENTLY, чтобы не блокировать запись в большие таблицы
+    atomic = False
+
+    dependencies = [
+        ("clients", "0010_mailingattempt_timings"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="mailing",
+            index=models.Index(
+                fields=["owner", "-created_at"], name="mailing_owner_created"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="message",
+            index=models.Index(
+                fields=["owner", "-created_at"], name="message_owner_created"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="recipient",
+            index=models.Index(
+                fields=["owner", "-created_at"], name="recipient_owner_created"
+            ),
+        ),
+    ]
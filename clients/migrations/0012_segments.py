@@ -0,0 +1,145 @@
+# Generated by Django 6.0 on 2026-10-19 06:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clients", "0011_owner_created_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="mailing",
+            name="recipients",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="mailings",
+                to="clients.recipient",
+                verbose_name="Получатели",
+            ),
+        ),
+        migrations.CreateModel(
+            name="Segment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, verbose_name="Название")),
+                (
+                    "created_from",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Добавлены с"
+                    ),
+                ),
+                (
+                    "created_to",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Добавлены по"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата создания"
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Дата обновления"),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="segments",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Владелец",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Сегмент",
+                "verbose_name_plural": "Сегменты",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="mailing",
+            name="segment",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="mailings",
+                to="clients.segment",
+                verbose_name="Сегмент",
+            ),
+        ),
+        migrations.CreateModel(
+            name="Tag",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, verbose_name="Название")),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="tags",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Владелец",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Тег",
+                "verbose_name_plural": "Теги",
+                "ordering": ["name"],
+            },
+        ),
+        migrations.AddField(
+            model_name="segment",
+            name="tags",
+            field=models.ManyToManyField(
+                blank=True,
+                help_text="Получатели с любым из тегов",
+                related_name="segments",
+                to="clients.tag",
+                verbose_name="Теги",
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipient",
+            name="tags",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="recipients",
+                to="clients.tag",
+                verbose_name="Теги",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="tag",
+            constraint=models.UniqueConstraint(
+                fields=("owner", "name"), name="tag_owner_name_unique"
+            ),
+        ),
+    ]
@@ -1,34 +1,54 @@
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.contrib import messages
+from django.db.models import Q
 from django.shortcuts import redirect
 
+from config.db_router import get_read_db
 
-class OwnerRequiredMixin(UserPassesTestMixin):
-    """Миксин для проверки прав владельца объекта."""
 
-    def test_func(self):
-        """Проверяет, является ли пользователь владельцем объекта."""
-        obj = self.get_object()
-        return obj.owner == self.request.user
+class ObjectPermissionMixin(UserPassesTestMixin):
+    """Проверка прав на объект страницы; объект загружается один раз за запрос.
+
+    test_func и сама страница (UpdateView, DeleteView, DetailView) получают один и тот же экземпляр.
+    """
+
+    # Связанные объекты, нужные странице, — загружаются тем же запросом
+    object_select_related = ()
+
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super().get_object(queryset)
+        if not hasattr(self, "_object"):
+            self._object = super().get_object(self.get_queryset().select_related(*self.object_select_related))
+        return self._object
+
+    def is_owner(self):
+        """Владелец ли пользователь объекта; сравниваются id без загрузки владельца."""
+        return self.get_object().owner_id == self.request.user.pk
 
     def handle_no_permission(self):
-        """Обрабатывает случай, когда у пользователя нет прав."""
+        """Обрабатывает случай, когда у пользователя нет прав; анонимного отправляет на вход."""
+        if not self.request.user.is_authenticated:
+            return super().handle_no_permission()
         messages.error(self.request, "У вас нет прав для редактирования этого объекта.")
         return redirect("clients:mailing_list")
 
 
-class ManagerOrOwnerRequiredMixin(UserPassesTestMixin):
+class OwnerRequiredMixin(ObjectPermissionMixin):
+    """Миксин для проверки прав владельца объекта."""
+
+    def test_func(self):
+        """Проверяет, является ли пользователь владельцем объекта."""
+        return self.request.user.is_authenticated and self.is_owner()
+
+
+class ManagerOrOwnerRequiredMixin(ObjectPermissionMixin):
     """Миксин для проверки прав менеджера или владельца."""
 
     def test_func(self):
         """Проверяет, является ли пользователь менеджером или владельцем."""
-        obj = self.get_object()
-        return self.request.user.is_manager() or obj.owner == self.request.user
-
-    def handle_no_permission(self):
-        """Обрабатывает случай, когда у пользователя нет прав."""
-        messages.error(self.request, "У вас нет прав для редактирования этого объекта.")
-        return redirect("clients:mailing_list")
+        user = self.request.user
+        return user.is_authenticated and (user.is_manager() or self.is_owner())
 
 
 class ManagerRequiredMixin(UserPassesTestMixin):
@@ -42,3 +62,37 @@ class ManagerRequiredMixin(UserPassesTestMixin):
         """Обрабатывает случай, когда у пользователя нет прав."""
         messages.error(self.request, "Эта функция доступна только менеджерам.")
         return redirect("clients:mailing_list")
+
+
+class SearchMixin:
+    """Миксин поиска по GET-параметру q для списков.
+
+    Поиск идёт через icontains по search_fields — под него построены триграммные индексы.
+    """
+
+    search_fields = ()
+
+    def get_search_query(self):
+        return self.request.GET.get("q", "").strip()
+
+    def search(self, queryset):
+        """Фильтрует queryset по строке поиска."""
+        query = self.get_search_query()
+        if not query:
+            return queryset
+        condition = Q()
+        for field in self.search_fields:
+            condition |= Q(**{f"{field}__icontains": query})
+        return queryset.filter(condition)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["search_query"] = self.get_search_query()
+        return context
+
+
+class ReplicaReadMixin:
+    """Миксин для ListView: страница списка читается с реплики, если она настроена."""
+
+    def paginate_queryset(self, queryset, page_size):
+        return super().paginate_queryset(queryset.using(get_read_db()), page_size)
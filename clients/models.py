@@ -1,10 +1,41 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Lower, Upper
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.conf import settings
 
 
+class OwnedQuerySet(models.QuerySet):
+    """Выборка объектов, доступных пользователю: менеджеру — все, остальным — только свои."""
+
+    # Путь от модели к владельцу
+    owner_field = "owner"
+
+    def for_user(self, user):
+        """Объекты, доступные пользователю; условие по владельцу совпадает с индексами (owner, -created_at)."""
+        if not user.is_authenticated:
+            return self.none()
+        if user.is_manager():
+            return self
+        return self.filter(**{f"{self.owner_field}_id": user.pk})
+
+
+class AttemptQuerySet(OwnedQuerySet):
+    """Попытки и логи принадлежат владельцу рассылки."""
+
+    owner_field = "mailing__owner"
+
+
+class MailingManager(models.Manager.from_queryset(OwnedQuerySet)):
+    """Менеджер рассылок, скрывающий помеченные на удаление."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Mailing(models.Model):
     """Модель рассылки."""
 
@@ -26,14 +57,32 @@ class Mailing(models.Model):
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name="Владелец", related_name="mailings"
     )
     message = models.ForeignKey("Message", on_delete=models.CASCADE, verbose_name="Сообщение", related_name="mailings")
-    recipients = models.ManyToManyField("Recipient", verbose_name="Получатели", related_name="mailings")
+    # Получателей задаёт либо сегмент (условия выборки), либо явный список
+    segment = models.ForeignKey(
+        "Segment",
+        on_delete=models.PROTECT,
+        verbose_name="Сегмент",
+        related_name="mailings",
+        null=True,
+        blank=True,
+    )
+    recipients = models.ManyToManyField("Recipient", verbose_name="Получатели", related_name="mailings", blank=True)
     created_at = models.DateTimeField("Дата создания", auto_now_add=True)
     updated_at = models.DateTimeField("Дата обновления", auto_now=True)
+    # Рассылка помечается удалённой сразу, а её попытки и логи удаляет purge_deleted_mailings
+    deleted_at = models.DateTimeField("Дата удаления", null=True, blank=True, db_index=True)
+
+    objects = MailingManager()
+    all_objects = models.Manager()
 
     class Meta:
         verbose_name = "Рассылка"
         verbose_name_plural = "Рассылки"
         ordering = ["-created_at"]
+        indexes = [
+            # Список рассылок пользователя: for_user + сортировка по дате создания
+            models.Index(fields=["owner", "-created_at"], name="mailing_owner_created"),
+        ]
 
     def __str__(self):
         return f"Рассылка {self.id} - {self.get_status_display()}"
@@ -71,6 +120,17 @@ class Mailing(models.Model):
             self.status = new_status
             self.save(update_fields=["status"])
 
+    def get_recipients(self):
+        """Получатели рассылки: выборка сегмента или явный список."""
+        if self.segment_id:
+            return self.segment.get_recipients()
+        return self.recipients.all()
+
+    def mark_deleted(self):
+        """Помечает рассылку удалённой без каскадного удаления связанных записей."""
+        self.deleted_at = timezone.now()
+        self.save(update_fields=["deleted_at"])
+
 
 class Recipient(models.Model):
     """Модель получателя рассылки."""
@@ -81,33 +141,120 @@ class Recipient(models.Model):
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name="Владелец", related_name="recipients"
     )
+    tags = models.ManyToManyField("Tag", verbose_name=_("Теги"), related_name="recipients", blank=True)
     created_at = models.DateTimeField(_("Дата создания"), auto_now_add=True)
     updated_at = models.DateTimeField(_("Дата обновления"), auto_now=True)
 
+    objects = OwnedQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Получатель")
         verbose_name_plural = _("Получатели")
         ordering = ["-created_at"]
+        # Триграммные индексы под поиск icontains (UPPER(col) LIKE UPPER('%x%'))
+        indexes = [
+            models.Index(fields=["owner", "-created_at"], name="recipient_owner_created"),
+            GinIndex(OpClass(Upper("full_name"), name="gin_trgm_ops"), name="recipient_full_name_trgm"),
+            GinIndex(OpClass(Upper("email"), name="gin_trgm_ops"), name="recipient_email_trgm"),
+            GinIndex(OpClass(Upper("comment"), name="gin_trgm_ops"), name="recipient_comment_trgm"),
+        ]
 
     def __str__(self):
         return f"{self.full_name} <{self.email}>"
 
 
+class Tag(models.Model):
+    """Метка получателя для отбора в сегменты."""
+
+    name = models.CharField("Название", max_length=50)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name="Владелец", related_name="tags"
+    )
+
+    objects = OwnedQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Тег"
+        verbose_name_plural = "Теги"
+        ordering = ["name"]
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "name"], name="tag_owner_name_unique"),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class Segment(models.Model):
+    """Сегмент получателей, заданный условиями, а не списком.
+
+    Получатели сегмента — получатели его владельца с любым из тегов сегмента (если теги заданы),
+    добавленные в указанный период. Выборка вычисляется в момент отправки, поэтому новые
+    получатели попадают в рассылку без правки, а на рассылку не хранится строка на каждого получателя.
+    """
+
+    name = models.CharField("Название", max_length=255)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name="Владелец", related_name="segments"
+    )
+    tags = models.ManyToManyField(
+        Tag, verbose_name="Теги", related_name="segments", blank=True, help_text="Получатели с любым из тегов"
+    )
+    created_from = models.DateTimeField("Добавлены с", null=True, blank=True)
+    created_to = models.DateTimeField("Добавлены по", null=True, blank=True)
+    created_at = models.DateTimeField("Дата создания", auto_now_add=True)
+    updated_at = models.DateTimeField("Дата обновления", auto_now=True)
+
+    objects = OwnedQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Сегмент"
+        verbose_name_plural = "Сегменты"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return self.name
+
+    def get_recipients(self):
+        """Получатели сегмента одним запросом; условие по тегам проверяется в базе, без загрузки тегов."""
+        recipients = Recipient.objects.filter(owner_id=self.owner_id)
+        if self.created_from:
+            recipients = recipients.filter(created_at__gte=self.created_from)
+        if self.created_to:
+            recipients = recipients.filter(created_at__lte=self.created_to)
+        segment_tags = Segment.tags.through.objects.filter(segment_id=self.pk)
+        tagged = Recipient.tags.through.objects.filter(
+            recipient_id=OuterRef("pk"), tag_id__in=segment_tags.values("tag_id")
+        )
+        return recipients.filter(~Exists(segment_tags) | Exists(tagged))
+
+
 class Message(models.Model):
     """Модель сообщения для рассылки."""
 
     subject = models.CharField("Тема письма", max_length=255, help_text="Введите тему письма")
     body = models.TextField("Тело письма", help_text="Введите текст письма")
+    html_body = models.TextField(
+        "HTML-версия письма", blank=True, help_text="Необязательная HTML-версия, отправляется вместе с текстом"
+    )
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name="Владелец", related_name="messages"
     )
     created_at = models.DateTimeField("Дата создания", auto_now_add=True)
     updated_at = models.DateTimeField("Дата обновления", auto_now=True)
 
+    objects = OwnedQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Сообщение"
         verbose_name_plural = "Сообщения"
         ordering = ["-created_at"]
+        # Триграммные индексы под поиск icontains (UPPER(col) LIKE UPPER('%x%'))
+        indexes = [
+            models.Index(fields=["owner", "-created_at"], name="message_owner_created"),
+            GinIndex(OpClass(Upper("subject"), name="gin_trgm_ops"), name="message_subject_trgm"),
+            GinIndex(OpClass(Upper("body"), name="gin_trgm_ops"), name="message_body_trgm"),
+        ]
 
     def __str__(self):
         return self.subject
@@ -116,9 +263,14 @@ class Message(models.Model):
 class MailingLog(models.Model):
     """Модель для хранения логов рассылок."""
 
+    SUCCESS = "success"
+    ERROR = "error"
+    SKIPPED = "skipped"
+
     STATUS_CHOICES = [
-        ("success", "Успешно"),
-        ("error", "Ошибка"),
+        (SUCCESS, "Успешно"),
+        (ERROR, "Ошибка"),
+        (SKIPPED, "Пропущено"),
     ]
 
     mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, related_name="logs", verbose_name="Рассылка")
@@ -127,10 +279,16 @@ class MailingLog(models.Model):
     server_response = models.TextField("Ответ сервера", blank=True, null=True)
     created_at = models.DateTimeField("Дата создания", auto_now_add=True)
 
+    objects = AttemptQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Лог рассылки"
         verbose_name_plural = "Логи рассылок"
         ordering = ["-created_at"]
+        indexes = [
+            GinIndex(OpClass(Upper("recipient_email"), name="gin_trgm_ops"), name="log_recipient_email_trgm"),
+            GinIndex(OpClass(Upper("server_response"), name="gin_trgm_ops"), name="log_server_response_trgm"),
+        ]
 
     def __str__(self):
         return f"{self.mailing} - {self.recipient_email} - {self.get_status_display()}"
@@ -150,7 +308,100 @@ class MailingAttempt(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, verbose_name="Статус")
     server_response = models.TextField(verbose_name="Ответ сервера", blank=True, null=True)
 
+    # Время фаз отправки в микросекундах; пусто, если фаза не выполнялась (например, соединение уже было открыто)
+    render_us = models.PositiveIntegerField("Сборка письма, мкс", null=True, blank=True)
+    dns_us = models.PositiveIntegerField("DNS, мкс", null=True, blank=True)
+    connect_us = models.PositiveIntegerField("Соединение, мкс", null=True, blank=True)
+    tls_us = models.PositiveIntegerField("TLS, мкс", null=True, blank=True)
+    auth_us = models.PositiveIntegerField("AUTH, мкс", null=True, blank=True)
+    data_us = models.PositiveIntegerField("Передача письма, мкс", null=True, blank=True)
+    # Доля записи пачки попыток в базу на одно письмо (по предыдущей пачке этой рассылки)
+    db_us = models.PositiveIntegerField("Запись в базу, мкс", null=True, blank=True)
+
+    # Фазы отправки; время фазы хранится в поле <фаза>_us
+    TIMING_PHASES = [
+        ("render", "Сборка письма"),
+        ("dns", "DNS"),
+        ("connect", "Соединение"),
+        ("tls", "TLS"),
+        ("auth", "AUTH"),
+        ("data", "Передача письма"),
+        ("db", "Запись в базу"),
+    ]
+
+    objects = AttemptQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Попытка рассылки"
         verbose_name_plural = "Попытки рассылок"
         ordering = ["-attempt_time"]
+        indexes = [
+            GinIndex(OpClass(Upper("server_response"), name="gin_trgm_ops"), name="attempt_server_response_trgm"),
+        ]
+
+
+class ArchivedAttemptCount(models.Model):
+    """Предагрегированные счётчики попыток, перенесённых в архив.
+
+    Строки MailingAttempt старше заданного срока уносятся в файлы архива, а здесь
+    остаются их количества по рассылке и статусу, чтобы статистика не теряла итоги.
+    """
+
+    mailing = models.ForeignKey(
+        Mailing, on_delete=models.CASCADE, related_name="archived_counts", verbose_name="Рассылка"
+    )
+    status = models.CharField("Статус", max_length=20, choices=MailingAttempt.STATUS_CHOICES)
+    count = models.PositiveBigIntegerField("Количество", default=0)
+
+    objects = AttemptQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Архивные попытки"
+        verbose_name_plural = "Архивные попытки"
+        constraints = [
+            models.UniqueConstraint(fields=["mailing", "status"], name="archived_attempt_count_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.mailing_id} - {self.status}: {self.count}"
+
+
+class SuppressedEmail(models.Model):
+    """Адрес, на который нельзя отправлять письма (отписка, жёсткий отказ, жалоба)."""
+
+    BOUNCED = "bounced"
+    UNSUBSCRIBED = "unsubscribed"
+    COMPLAINED = "complained"
+
+    REASON_CHOICES = [
+        (BOUNCED, "Жёсткий отказ"),
+        (UNSUBSCRIBED, "Отписка"),
+        (COMPLAINED, "Жалоба"),
+    ]
+
+    # Адрес хранится в нижнем регистре
+    email = models.EmailField("Email", max_length=255, unique=True)
+    reason = models.CharField("Причина", max_length=20, choices=REASON_CHOICES)
+    created_at = models.DateTimeField("Дата добавления", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Адрес в стоп-листе"
+        verbose_name_plural = "Стоп-лист"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.email} ({self.get_reason_display()})"
+
+    def save(self, *args, **kwargs):
+        self.email = self.email.lower()
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def suppressed_for(cls, recipients):
+        """Множество адресов (в нижнем регистре) из recipients, которые есть в стоп-листе.
+
+        Стоп-лист пересекается с получателями одним запросом в базе, поэтому в память
+        попадают только адреса этой рассылки, сколько бы записей ни было в стоп-листе.
+        """
+        emails = recipients.annotate(email_lower=Lower("email")).values("email_lower")
+        return set(cls.objects.filter(email__in=emails).values_list("email", flat=True))
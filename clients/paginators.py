@@ -0,0 +1,52 @@
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор, берущий число строк большой таблицы из статистики PostgreSQL.
+
+    Точный COUNT(*) по таблице из миллионов строк читает её целиком. Для запроса без
+    фильтров используем оценку pg_class.reltuples; если таблица небольшая, запрос
+    отфильтрован или база не PostgreSQL — считаем как обычно.
+    Оценка кешируется, чтобы страницы небольших таблиц не платили за лишний запрос к pg_class.
+    """
+
+    # Ниже этого порога точный COUNT достаточно дешёвый
+    ESTIMATE_THRESHOLD = 10000
+    ESTIMATE_CACHE_TIMEOUT = 300
+
+    @cached_property
+    def count(self):
+        estimate = self._estimated_count()
+        if estimate is not None and estimate >= self.ESTIMATE_THRESHOLD:
+            return estimate
+        return super().count
+
+    def _estimated_count(self):
+        query = getattr(self.object_list, "query", None)
+        if query is None or query.where:
+            return None
+
+        connection = connections[self.object_list.db]
+        if connection.vendor != "postgresql":
+            return None
+
+        db_table = self.object_list.model._meta.db_table
+        cache_key = f"paginator_estimate:{self.object_list.db}:{db_table}"
+        estimate = cache.get(cache_key)
+        if estimate is None:
+            with connection.cursor() as cursor:
+                # regclass учитывает search_path: одноимённая таблица из другой схемы не подойдёт
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [connection.ops.quote_name(db_table)],
+                )
+                row = cursor.fetchone()
+            estimate = int(row[0]) if row else -1
+            cache.set(cache_key, estimate, self.ESTIMATE_CACHE_TIMEOUT)
+        # reltuples = -1, если таблицу ещё ни разу не анализировали
+        if estimate < 0:
+            return None
+        return estimate
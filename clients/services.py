@@ -1,24 +1,42 @@
+import csv
+import gzip
+import json
+import operator
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+from functools import reduce
+
+from django.conf import settings
 from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Aggregate, Count, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from .models import Mailing, Recipient, MailingAttempt
+from django.utils.dateparse import parse_date
+from config.db_router import get_read_db
+from .models import Mailing, Recipient, MailingAttempt, MailingLog, ArchivedAttemptCount
 
 
 class StatisticsService:
     """Сервис для работы со статистикой рассылок."""
 
+    EMPTY_STATS = {
+        "total_mailings": 0,
+        "active_mailings": 0,
+        "unique_recipients": 0,
+        "total_attempts": 0,
+        "successful_attempts": 0,
+        "failed_attempts": 0,
+    }
+
     @staticmethod
     def get_user_stats(user):
         """Получение статистики для пользователя с кешированием."""
         # Проверяем, авторизован ли пользователь
         if not user.is_authenticated:
-            return {
-                "total_mailings": 0,
-                "active_mailings": 0,
-                "unique_recipients": 0,
-                "total_attempts": 0,
-                "successful_attempts": 0,
-                "failed_attempts": 0,
-            }
+            return dict(StatisticsService.EMPTY_STATS)
 
         cache_key = f"user_stats_{user.id}_{user.role}"
         cached_stats = cache.get(cache_key)
@@ -26,37 +44,75 @@ class StatisticsService:
         if cached_stats:
             return cached_stats
 
-        if user.is_manager():
-            stats = {
-                "total_mailings": Mailing.objects.count(),
-                "active_mailings": Mailing.objects.filter(
-                    status__in=[Mailing.STARTED, Mailing.CREATED], end_time__gte=timezone.now()
-                ).count(),
-                "unique_recipients": Recipient.objects.count(),
-                "total_attempts": MailingAttempt.objects.count(),
-                "successful_attempts": MailingAttempt.objects.filter(status=MailingAttempt.SUCCESS).count(),
-                "failed_attempts": MailingAttempt.objects.filter(status=MailingAttempt.FAILED).count(),
-            }
-        else:
-            stats = {
-                "total_mailings": Mailing.objects.filter(owner=user).count(),
-                "active_mailings": Mailing.objects.filter(
-                    owner=user, status__in=[Mailing.STARTED, Mailing.CREATED], end_time__gte=timezone.now()
-                ).count(),
-                "unique_recipients": Recipient.objects.filter(owner=user).count(),
-                "total_attempts": MailingAttempt.objects.filter(mailing__owner=user).count(),
-                "successful_attempts": MailingAttempt.objects.filter(
-                    mailing__owner=user, status=MailingAttempt.SUCCESS
-                ).count(),
-                "failed_attempts": MailingAttempt.objects.filter(
-                    mailing__owner=user, status=MailingAttempt.FAILED
-                ).count(),
-            }
+        querysets, archived = StatisticsService._get_stats_querysets(user)
+        stats = {name: queryset.count() for name, queryset in querysets.items()}
+        StatisticsService._add_archived_counts(stats, StatisticsService.get_archived_counts(archived))
 
         # Кешируем на 3 минуты
         cache.set(cache_key, stats, 180)
         return stats
 
+    @staticmethod
+    async def aget_user_stats(user):
+        """Асинхронная версия get_user_stats для async-представлений."""
+        if not user.is_authenticated:
+            return dict(StatisticsService.EMPTY_STATS)
+
+        cache_key = f"user_stats_{user.id}_{user.role}"
+        cached_stats = await cache.aget(cache_key)
+
+        if cached_stats:
+            return cached_stats
+
+        querysets, archived = StatisticsService._get_stats_querysets(user)
+        stats = {name: await queryset.acount() for name, queryset in querysets.items()}
+        archived_counts = {status: total async for status, total in StatisticsService._archived_totals(archived)}
+        StatisticsService._add_archived_counts(stats, archived_counts)
+
+        await cache.aset(cache_key, stats, 180)
+        return stats
+
+    @staticmethod
+    def _get_stats_querysets(user):
+        """Запросы для счётчиков статистики и архивных попыток пользователя."""
+        # Статистика допускает небольшое отставание, поэтому читаем с реплики
+        db = get_read_db()
+        mailings = Mailing.objects.using(db).for_user(user)
+        recipients = Recipient.objects.using(db).for_user(user)
+        attempts = MailingAttempt.objects.using(db).for_user(user)
+        archived = ArchivedAttemptCount.objects.using(db).for_user(user)
+
+        querysets = {
+            "total_mailings": mailings,
+            "active_mailings": mailings.filter(
+                status__in=[Mailing.STARTED, Mailing.CREATED], end_time__gte=timezone.now()
+            ),
+            "unique_recipients": recipients,
+            "total_attempts": attempts,
+            "successful_attempts": attempts.filter(status=MailingAttempt.SUCCESS),
+            "failed_attempts": attempts.filter(status=MailingAttempt.FAILED),
+        }
+        return querysets, archived
+
+    @staticmethod
+    def _archived_totals(queryset):
+        return queryset.values("status").annotate(total=Sum("count")).values_list("status", "total")
+
+    @staticmethod
+    def get_archived_counts(queryset):
+        """Суммы архивных попыток по статусам."""
+        return dict(StatisticsService._archived_totals(queryset))
+
+    @staticmethod
+    def _add_archived_counts(stats, archived_counts):
+        """Добавляет к статистике попытки, уже перенесённые в архив."""
+        for status, count in archived_counts.items():
+            stats["total_attempts"] += count
+            if status == MailingAttempt.SUCCESS:
+                stats["successful_attempts"] += count
+            elif status == MailingAttempt.FAILED:
+                stats["failed_attempts"] += count
+
     @staticmethod
     def clear_user_stats_cache(user):
         """Очистка кеша статистики пользователя."""
@@ -66,35 +122,414 @@ class StatisticsService:
         cache.delete(cache_key)
 
 
+class Percentile(Aggregate):
+    """Непрерывный процентиль PostgreSQL: percentile_cont(fraction) WITHIN GROUP (ORDER BY ...)."""
+
+    function = "percentile_cont"
+    template = "%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=fraction, **extra)
+
+
+class DeliveryTimingService:
+    """Процентили времени фаз отправки по попыткам рассылки."""
+
+    PERCENTILES = (50, 90, 99)
+
+    @classmethod
+    def get_percentiles(cls, mailing):
+        """Фазы с замерами: название, число замеров и процентили в миллисекундах; одним запросом."""
+        phases = [(f"{phase}_us", label) for phase, label in MailingAttempt.TIMING_PHASES]
+        total = sum((Coalesce(field, Value(0)) for field, _ in phases), Value(0))
+        phases.append((total, "Итого"))
+
+        aggregates = {}
+        for i, (expression, _) in enumerate(phases):
+            aggregates[f"count_{i}"] = Count(expression)
+            for percentile in cls.PERCENTILES:
+                aggregates[f"p{percentile}_{i}"] = Percentile(expression, percentile / 100)
+        # Попытки, записанные до появления замеров, не учитываются
+        measured = reduce(operator.or_, (Q(**{f"{field}__isnull": False}) for field, _ in phases[:-1]))
+        attempts = MailingAttempt.objects.using(get_read_db()).filter(measured, mailing=mailing)
+        values = attempts.aggregate(**aggregates)
+
+        rows = []
+        for i, (_, label) in enumerate(phases):
+            if values[f"count_{i}"]:
+                rows.append(
+                    {
+                        "label": label,
+                        "count": values[f"count_{i}"],
+                        "percentiles": [round(values[f"p{p}_{i}"] / 1000, 2) for p in cls.PERCENTILES],
+                    }
+                )
+        return rows
+
+
+class ProgressService:
+    """Счётчики прогресса отправки рассылки в кеше.
+
+    Путь отправки увеличивает счётчики sent/failed/skipped на каждое письмо, а страница прогресса
+    читает их одним запросом к кешу, не пересчитывая строки MailingAttempt на каждом шаге.
+    """
+
+    TIMEOUT = 60 * 60
+    FIELDS = ("total", "sent", "failed", "skipped", "started_at", "finished_at")
+    COUNTERS = {MailingAttempt.SUCCESS: "sent", MailingAttempt.FAILED: "failed", MailingLog.SKIPPED: "skipped"}
+
+    @staticmethod
+    def _key(mailing_id, field):
+        return f"mailing_progress_{mailing_id}_{field}"
+
+    @classmethod
+    def start(cls, mailing_id, total):
+        """Сбрасывает счётчики перед запуском отправки."""
+        cache.delete(cls._key(mailing_id, "finished_at"))
+        cache.set_many(
+            {
+                cls._key(mailing_id, "total"): total,
+                cls._key(mailing_id, "sent"): 0,
+                cls._key(mailing_id, "failed"): 0,
+                cls._key(mailing_id, "skipped"): 0,
+                cls._key(mailing_id, "started_at"): timezone.now().timestamp(),
+            },
+            cls.TIMEOUT,
+        )
+
+    @classmethod
+    def increment(cls, mailing_id, status, delta=1):
+        """Учитывает отправленное (SUCCESS), неотправленное (FAILED) или пропущенное (SKIPPED) письмо."""
+        key = cls._key(mailing_id, cls.COUNTERS[status])
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            # Счётчик истёк или отправка запущена в обход start()
+            cache.set(key, delta, cls.TIMEOUT)
+
+    @classmethod
+    def finish(cls, mailing_id):
+        cache.set(cls._key(mailing_id, "finished_at"), timezone.now().timestamp(), cls.TIMEOUT)
+
+    @classmethod
+    async def aget(cls, mailing):
+        """Прогресс отправки: отправлено, ошибок, пропущено, осталось и скорость (писем в секунду)."""
+        keys = {cls._key(mailing.pk, field): field for field in cls.FIELDS}
+        values = {keys[key]: value for key, value in (await cache.aget_many(list(keys))).items()}
+        if "total" not in values:
+            return await cls._aget_from_database(mailing)
+
+        sent = values.get("sent", 0)
+        failed = values.get("failed", 0)
+        skipped = values.get("skipped", 0)
+        finished_at = values.get("finished_at")
+        elapsed = (finished_at or timezone.now().timestamp()) - values["started_at"]
+        return {
+            "mailing": mailing.pk,
+            "running": finished_at is None,
+            "recipients": values["total"],
+            "sent": sent,
+            "failed": failed,
+            "skipped": skipped,
+            "remaining": max(values["total"] - sent - failed - skipped, 0),
+            "rate": round((sent + failed) / elapsed, 2) if elapsed > 0 else 0,
+        }
+
+    @staticmethod
+    async def _aget_from_database(mailing):
+        """Прогресс по базе — только когда счётчиков в кеше нет (отправка не запускалась или давно закончилась)."""
+        db = get_read_db()
+        attempts = MailingAttempt.objects.using(db).filter(mailing=mailing)
+        # Сегмент рассылки загружен вызывающим (select_related), обращение к нему не делает синхронного запроса
+        recipients = await mailing.get_recipients().using(db).acount()
+        sent = await attempts.filter(status=MailingAttempt.SUCCESS).acount()
+        failed = await attempts.filter(status=MailingAttempt.FAILED).acount()
+        skipped = await MailingLog.objects.using(db).filter(mailing=mailing, status=MailingLog.SKIPPED).acount()
+        return {
+            "mailing": mailing.pk,
+            "running": False,
+            "recipients": recipients,
+            "sent": sent,
+            "failed": failed,
+            "skipped": skipped,
+            "remaining": max(recipients - sent - failed - skipped, 0),
+            "rate": 0,
+        }
+
+
 class MailingService:
     """Сервис для работы с рассылками."""
 
     @staticmethod
     def get_user_mailings(user):
-        """Получение рассылок пользователя с кешированием."""
-        # Проверяем, авторизован ли пользователь
+        """Рассылки пользователя для списка.
+
+        Запрос не кешируется: при записи в кеш QuerySet выполнился бы целиком, с подсчётом получателей
+        всех видимых рассылок, а ReplicaReadMixin вызывает .using() и всё равно выполняет его заново.
+        Страница списка — один запрос с LIMIT.
+        """
         if not user.is_authenticated:
             return Mailing.objects.none()
 
-        cache_key = f"user_mailings_{user.id}_{user.role}"
-        cached_mailings = cache.get(cache_key)
+        # Тема и число получателей для списка — в том же запросе, а не отдельными запросами на каждую строку
+        return (
+            Mailing.objects.for_user(user)
+            .select_related("message", "segment")
+            .annotate(recipients_count=Count("recipients", distinct=True))
+            # Meta.ordering не применяется к запросам с GROUP BY
+            .order_by("-created_at")
+        )
 
-        if cached_mailings:
-            return cached_mailings
+    PURGE_BATCH_SIZE = 5000
 
-        if user.is_manager():
-            mailings = Mailing.objects.all()
-        else:
-            mailings = Mailing.objects.filter(owner=user)
+    @classmethod
+    def purge_deleted(cls, batch_size=None):
+        """Физическое удаление помеченных рассылок.
 
-        # Кешируем на 2 минуты
-        cache.set(cache_key, mailings, 120)
-        return mailings
+        Попытки, логи, архивные счётчики и связи с получателями удаляются порциями,
+        каждая в своей короткой транзакции, и только затем сама рассылка. Так удаление
+        рассылки с миллионом попыток не держит длинную транзакцию и не грузит все pk в память.
+        Возвращает количество удалённых рассылок.
+        """
+        batch_size = batch_size or cls.PURGE_BATCH_SIZE
+        mailing_ids = list(Mailing.all_objects.filter(deleted_at__isnull=False).values_list("pk", flat=True))
+
+        for mailing_id in mailing_ids:
+            for model in (MailingAttempt, MailingLog, ArchivedAttemptCount, Mailing.recipients.through):
+                cls._delete_in_batches(model.objects.filter(mailing_id=mailing_id), batch_size)
+            Mailing.all_objects.filter(pk=mailing_id).delete()
+        return len(mailing_ids)
 
     @staticmethod
-    def clear_mailings_cache(user):
-        """Очистка кеша рассылок пользователя."""
-        if not user.is_authenticated:
-            return
-        cache_key = f"user_mailings_{user.id}_{user.role}"
-        cache.delete(cache_key)
+    def _delete_in_batches(queryset, batch_size):
+        while True:
+            with transaction.atomic():
+                ids = list(queryset.values_list("pk", flat=True)[:batch_size])
+                if not ids:
+                    return
+                queryset.model.objects.filter(pk__in=ids).delete()
+
+    @staticmethod
+    def clone(mailing):
+        """Копия рассылки с тем же сообщением и получателями (сегментом или списком); возвращает новую рассылку.
+
+        Период отправки сдвигается на текущее время с той же длительностью. Связи с получателями
+        копируются одним INSERT ... SELECT в базе, без выгрузки id получателей в Python.
+        """
+        now = timezone.now()
+        through = Mailing.recipients.through._meta
+        qn = connection.ops.quote_name
+        table = qn(through.db_table)
+        mailing_column = qn(through.get_field("mailing").column)
+        recipient_column = qn(through.get_field("recipient").column)
+        with transaction.atomic():
+            clone = Mailing.objects.create(
+                start_time=now,
+                end_time=now + (mailing.end_time - mailing.start_time),
+                status=Mailing.CREATED,
+                owner_id=mailing.owner_id,
+                message_id=mailing.message_id,
+                segment_id=mailing.segment_id,
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {table} ({mailing_column}, {recipient_column}) "
+                    f"SELECT %s, {recipient_column} FROM {table} WHERE {mailing_column} = %s",
+                    [clone.pk, mailing.pk],
+                )
+        return clone
+
+
+class Echo:
+    """Псевдо-буфер: csv.writer пишет строку, а мы сразу отдаём её наружу."""
+
+    def write(self, value):
+        return value
+
+
+class ExportService:
+    """Сервис потоковой выгрузки попыток и логов рассылок в CSV."""
+
+    CHUNK_SIZE = 2000
+
+    ATTEMPTS = "attempts"
+    LOGS = "logs"
+
+    # Для каждого типа выгрузки: модель, поле даты, выгружаемые колонки и заголовок
+    EXPORTS = {
+        ATTEMPTS: {
+            "model": MailingAttempt,
+            "date_field": "attempt_time",
+            "fields": ("id", "mailing_id", "mailing__owner_id", "attempt_time", "status", "server_response"),
+            "header": ("id", "mailing_id", "owner_id", "attempt_time", "status", "server_response"),
+        },
+        LOGS: {
+            "model": MailingLog,
+            "date_field": "created_at",
+            "fields": (
+                "id",
+                "mailing_id",
+                "mailing__owner_id",
+                "recipient_email",
+                "created_at",
+                "status",
+                "server_response",
+            ),
+            "header": ("id", "mailing_id", "owner_id", "recipient_email", "created_at", "status", "server_response"),
+        },
+    }
+
+    @staticmethod
+    def parse_day(value, end=False):
+        """Преобразует дату YYYY-MM-DD в границу интервала (aware datetime)."""
+        if not value:
+            return None
+        day = parse_date(value) if isinstance(value, str) else value
+        if day is None:
+            raise ValueError(f"Некорректная дата: {value}")
+        if end:
+            # Конец интервала включительно: до начала следующего дня
+            day += timedelta(days=1)
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    @classmethod
+    def get_queryset(cls, kind, user=None, mailing=None, owner=None, date_from=None, date_to=None, status=None):
+        """Фильтрованный queryset кортежей для выгрузки, упорядоченный по первичному ключу.
+
+        С user — только данные, доступные пользователю (см. OwnedQuerySet.for_user).
+        """
+        export = cls.EXPORTS[kind]
+        date_field = export["date_field"]
+        filters = {}
+
+        if mailing:
+            filters["mailing_id"] = mailing
+        if owner:
+            filters["mailing__owner_id"] = owner
+        if status:
+            filters["status"] = status
+        if date_from:
+            filters[f"{date_field}__gte"] = cls.parse_day(date_from)
+        if date_to:
+            filters[f"{date_field}__lt"] = cls.parse_day(date_to, end=True)
+
+        # Сортировка по pk идёт по индексу и не требует сортировки всей таблицы; выгрузка читает с реплики
+        queryset = export["model"].objects.using(get_read_db())
+        if user is not None:
+            queryset = queryset.for_user(user)
+        return queryset.filter(**filters).order_by("pk").values_list(*export["fields"])
+
+    @classmethod
+    def iter_csv(cls, kind, queryset):
+        """Генератор строк CSV: заголовок, затем строки порциями по CHUNK_SIZE."""
+        writer = csv.writer(Echo())
+        yield writer.writerow(cls.EXPORTS[kind]["header"])
+        for row in queryset.iterator(chunk_size=cls.CHUNK_SIZE):
+            yield writer.writerow(row)
+
+
+class ArchiveService:
+    """Сервис переноса старых попыток и логов рассылок в архив на диске.
+
+    Строки уходят порциями в сжатые JSONL-файлы (ARCHIVE_DIR/<kind>-YYYY-MM-<первый id>.jsonl.gz,
+    файл на порцию и месяц) и удаляются из таблицы. Для попыток количество по рассылке и статусу
+    прибавляется к ArchivedAttemptCount, поэтому итоги статистики сохраняются.
+
+    Порция пишется во временный файл .part, который переименовывается только после коммита удаления.
+    Откат транзакции удаляет .part, и строки не попадают в архив дважды. Если процесс упал между
+    коммитом и переименованием, .part доводится до конца при следующем запуске.
+    """
+
+    BATCH_SIZE = 5000
+    PART_SUFFIX = ".part"
+
+    ARCHIVES = {
+        ExportService.ATTEMPTS: {
+            "model": MailingAttempt,
+            "date_field": "attempt_time",
+            "fields": ("id", "mailing_id", "attempt_time", "status", "server_response"),
+        },
+        ExportService.LOGS: {
+            "model": MailingLog,
+            "date_field": "created_at",
+            "fields": ("id", "mailing_id", "recipient_email", "created_at", "status", "server_response"),
+        },
+    }
+
+    @classmethod
+    def archive(cls, kind, older_than, batch_size=None, directory=None):
+        """Архивирует строки старше older_than. Возвращает количество перенесённых строк."""
+        archive = cls.ARCHIVES[kind]
+        batch_size = batch_size or cls.BATCH_SIZE
+        directory = directory or settings.ARCHIVE_DIR
+        os.makedirs(directory, exist_ok=True)
+        cls._recover_parts(kind, archive["model"], directory)
+
+        queryset = archive["model"].objects.filter(**{f"{archive['date_field']}__lt": older_than}).order_by("pk")
+        total = 0
+        while True:
+            parts = []
+            # Каждая порция — отдельная короткая транзакция
+            try:
+                with transaction.atomic():
+                    rows = list(queryset.values(*archive["fields"])[:batch_size])
+                    if not rows:
+                        break
+                    parts = cls._write_rows(kind, rows, archive["date_field"], directory)
+                    if kind == ExportService.ATTEMPTS:
+                        cls._add_archived_counts(rows)
+                    archive["model"].objects.filter(pk__in=[row["id"] for row in rows]).delete()
+            except BaseException:
+                for part in parts:
+                    os.remove(part)
+                raise
+            for part in parts:
+                os.replace(part, part.removesuffix(cls.PART_SUFFIX))
+            total += len(rows)
+        return total
+
+    @classmethod
+    def _write_rows(cls, kind, rows, date_field, directory):
+        """Пишет порцию во временные файлы по месяцам. Возвращает их пути."""
+        by_month = defaultdict(list)
+        for row in rows:
+            by_month[row[date_field].strftime("%Y-%m")].append(row)
+
+        parts = []
+        for month, month_rows in by_month.items():
+            path = os.path.join(directory, f"{kind}-{month}-{month_rows[0]['id']}.jsonl.gz{cls.PART_SUFFIX}")
+            parts.append(path)
+            with gzip.open(path, "wt", encoding="utf-8") as archive_file:
+                for row in month_rows:
+                    archive_file.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n")
+        return parts
+
+    @classmethod
+    def _recover_parts(cls, kind, model, directory):
+        """Доводит .part, оставшиеся после сбоя: строки удалены — в архив, иначе — в корзину."""
+        for name in os.listdir(directory):
+            if not (name.startswith(f"{kind}-") and name.endswith(cls.PART_SUFFIX)):
+                continue
+            path = os.path.join(directory, name)
+            with gzip.open(path, "rt", encoding="utf-8") as part_file:
+                first_id = json.loads(part_file.readline())["id"]
+            # Порция удаляется одной транзакцией: по первой строке видно, закоммичена ли она
+            if model.objects.filter(pk=first_id).exists():
+                os.remove(path)
+            else:
+                os.replace(path, path.removesuffix(cls.PART_SUFFIX))
+
+    @staticmethod
+    def _add_archived_counts(rows):
+        counts = Counter((row["mailing_id"], row["status"]) for row in rows)
+        for (mailing_id, status), count in counts.items():
+            counter = ArchivedAttemptCount.objects.filter(mailing_id=mailing_id, status=status)
+            if counter.update(count=F("count") + count):
+                continue
+            try:
+                with transaction.atomic():
+                    ArchivedAttemptCount.objects.create(mailing_id=mailing_id, status=status, count=count)
+            except IntegrityError:
+                # Параллельный запуск успел создать счётчик
+                counter.update(count=F("count") + count)
@@ -0,0 +1,175 @@
+import random
+import socketserver
+import threading
+import time
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Одна SMTP-сессия: принимает письма и никуда их не отправляет."""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def setup(self):
+        super().setup()
+        self.accepted = self.server.open_session()
+
+    def finish(self):
+        if self.accepted:
+            self.server.close_session()
+        super().finish()
+
+    def handle(self):
+        if not self.accepted:
+            self.reply("421 Too many connections, try again later")
+            return
+        self.server.delay(self.server.connect_latency)
+        self.reply("220 smtp-sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            command = line.split(None, 1)[0].upper() if line.strip() else b""
+            if command == b"EHLO":
+                self.reply("250-smtp-sink")
+                self.reply("250 8BITMIME")
+            elif command in (b"HELO", b"MAIL", b"RCPT", b"RSET", b"NOOP"):
+                self.reply("250 OK")
+            elif command == b"DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                self.read_data()
+                self.server.delay(self.server.latency)
+                outcome = self.server.message_outcome()
+                if outcome == SMTPSink.DROP:
+                    # Обрыв соединения без ответа на DATA
+                    break
+                self.reply(outcome)
+            elif command == b"QUIT":
+                self.reply("221 Bye")
+                break
+            else:
+                self.reply("502 Command not implemented")
+
+    def read_data(self):
+        for line in self.rfile:
+            if line in (b".\r\n", b".\n"):
+                break
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Локальный SMTP-сервер для замеров и тестов: принимает письма и только считает их.
+
+    Можно задать задержку ответа, долю временных (4xx) и постоянных (5xx) отказов,
+    долю обрывов соединения и ограничение на число одновременных сессий.
+    Порт 0 — свободный порт, выбранный системой (см. port).
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+    # Очередь входящих соединений под нагрузочные тесты
+    request_queue_size = 128
+
+    ACCEPTED = "250 OK: queued"
+    TEMPORARY_FAILURE = "451 Temporary local problem, try again later"
+    PERMANENT_FAILURE = "550 Mailbox unavailable"
+    DROP = None
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        connect_latency=0.0,
+        temporary_failure_rate=0.0,
+        permanent_failure_rate=0.0,
+        drop_rate=0.0,
+        max_sessions=None,
+        seed=None,
+        handler=SMTPSinkHandler,
+    ):
+        super().__init__((host, port), handler)
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.temporary_failure_rate = temporary_failure_rate
+        self.permanent_failure_rate = permanent_failure_rate
+        self.drop_rate = drop_rate
+        self.max_sessions = max_sessions
+        self.random = random.Random(seed)
+        self.messages = 0
+        self.temporary_failures = 0
+        self.permanent_failures = 0
+        self.dropped = 0
+        self.sessions = 0
+        self.active_sessions = 0
+        self.refused_sessions = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @staticmethod
+    def delay(seconds):
+        if seconds:
+            time.sleep(seconds)
+
+    def open_session(self):
+        """Учитывает новую сессию; False — превышен лимит одновременных сессий."""
+        with self._lock:
+            if self.max_sessions and self.active_sessions >= self.max_sessions:
+                self.refused_sessions += 1
+                return False
+            self.sessions += 1
+            self.active_sessions += 1
+            return True
+
+    def close_session(self):
+        with self._lock:
+            self.active_sessions -= 1
+
+    def message_outcome(self):
+        """Ответ на принятое письмо с учётом заданных долей отказов и обрывов."""
+        with self._lock:
+            roll = self.random.random()
+            if roll < self.drop_rate:
+                self.dropped += 1
+                return self.DROP
+            roll -= self.drop_rate
+            if roll < self.permanent_failure_rate:
+                self.permanent_failures += 1
+                return self.PERMANENT_FAILURE
+            roll -= self.permanent_failure_rate
+            if roll < self.temporary_failure_rate:
+                self.temporary_failures += 1
+                return self.TEMPORARY_FAILURE
+            self.messages += 1
+            return self.ACCEPTED
+
+    def stats(self):
+        with self._lock:
+            return {
+                "messages": self.messages,
+                "temporary_failures": self.temporary_failures,
+                "permanent_failures": self.permanent_failures,
+                "dropped": self.dropped,
+                "sessions": self.sessions,
+                "active_sessions": self.active_sessions,
+                "refused_sessions": self.refused_sessions,
+            }
+
+    def start(self):
+        """Запускает сервер в фоновом потоке."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
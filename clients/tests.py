@@ -1 +1,928 @@
-# Create your tests here.
+import email
+import email.policy
+import gzip
+import json
+import os
+import smtplib
+import socket
+import tempfile
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection, connections
+from django.core.mail import EmailMultiAlternatives
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .delivery import MailingDeliveryService, PreparedMessage
+from .forms import MailingForm
+from .models import Mailing, MailingAttempt, MailingLog, Message, Recipient, Segment, SuppressedEmail, Tag
+from .paginators import EstimatedCountPaginator
+from .services import ArchiveService, ExportService, MailingService, ProgressService, StatisticsService
+from .smtp_sink import SMTPSink
+from .views import PROGRESS_STREAM_START_GRACE, MailingListView
+
+User = get_user_model()
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QueryBudgetTests(TestCase):
+    """Число SQL-запросов страниц не растёт с объёмом данных и укладывается в бюджет.
+
+    Каждая страница рендерится на малом и на большом наборе данных с холодным кешем.
+    Если запросов на большом наборе больше — в странице появился N+1.
+    """
+
+    databases = "__all__"
+
+    SMALL = 2
+    # Больше размера страницы у всех списков
+    LARGE = 25
+
+    # Бюджет запросов на страницу, включая сессию и пользователя
+    BUDGETS = {
+        "home": 10,
+        "mailing_list": 4,
+        "message_list": 4,
+        "recipient_list": 4,
+        "segment_list": 5,
+        "mailing_detail": 9,
+        "admin:recipient": 5,
+        "admin:message": 5,
+        "admin:mailing": 5,
+        # EstimatedCountPaginator: на PostgreSQL при холодном кеше — ещё запрос оценки к pg_class
+        "admin:mailingattempt": 5,
+        "admin:mailinglog": 5,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", email="user@example.com", password="x")
+        cls.admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="x", role=User.ROLE_MANAGER
+        )
+
+    def seed(self, count):
+        """Добавляет count получателей, сообщений и рассылок с попытками и логами."""
+        now = timezone.now()
+        recipients = Recipient.objects.bulk_create(
+            Recipient(
+                email=f"r{Recipient.objects.count()}-{i}@example.com", full_name=f"Получатель {i}", owner=self.user
+            )
+            for i in range(count)
+        )
+        for i in range(count):
+            tag = Tag.objects.create(name=f"Тег {Tag.objects.count()}", owner=self.user)
+            Segment.objects.create(name=f"Сегмент {i}", owner=self.user).tags.add(tag)
+            message = Message.objects.create(subject=f"Тема {i}", body="Текст", owner=self.user)
+            mailing = Mailing.objects.create(
+                start_time=now - timedelta(days=1),
+                end_time=now + timedelta(days=1),
+                owner=self.user,
+                message=message,
+            )
+            mailing.recipients.set(recipients)
+            MailingAttempt.objects.bulk_create(
+                MailingAttempt(mailing=mailing, status=MailingAttempt.SUCCESS) for _ in range(count)
+            )
+            MailingLog.objects.bulk_create(
+                MailingLog(mailing=mailing, recipient_email=r.email, status=MailingLog.SUCCESS) for r in recipients
+            )
+
+    def pages(self):
+        """Страницы под проверкой: имя -> функция, выполняющая запрос."""
+        mailing = Mailing.objects.order_by("pk").first()
+
+        def mailing_list():
+            # Путь "" занят главной страницей, поэтому список рассылок вызывается напрямую
+            request = RequestFactory().get("/")
+            request.user = User.objects.get(pk=self.user.pk)
+            return MailingListView.as_view()(request).render()
+
+        pages = {
+            "home": lambda: self.client.get(reverse("clients:home")),
+            "mailing_list": mailing_list,
+            "message_list": lambda: self.client.get(reverse("clients:message_list")),
+            "recipient_list": lambda: self.client.get(reverse("clients:recipient_list")),
+            "segment_list": lambda: self.client.get(reverse("clients:segment_list")),
+            "mailing_detail": lambda: self.client.get(reverse("clients:mailing_detail", args=[mailing.pk])),
+        }
+        for model in ("recipient", "message", "mailing", "mailingattempt", "mailinglog"):
+            url = reverse(f"admin:clients_{model}_changelist")
+            pages[f"admin:{model}"] = lambda url=url: self.admin_client.get(url)
+        return pages
+
+    def count_queries(self):
+        """Число запросов каждой страницы по всем базам (включая реплику)."""
+        counts = {}
+        for name, page in self.pages().items():
+            # Первый запрос может что-то сохранить (статус рассылки) — не считаем его
+            page()
+            cache.clear()
+            with ExitStack() as stack:
+                contexts = [stack.enter_context(CaptureQueriesContext(connection)) for connection in connections.all()]
+                response = page()
+            self.assertEqual(response.status_code, 200, name)
+            counts[name] = sum(len(context) for context in contexts)
+        return counts
+
+    def test_queries_do_not_grow_with_data(self):
+        self.client.force_login(self.user)
+        self.admin_client = self.client_class()
+        self.admin_client.force_login(self.admin)
+
+        self.seed(self.SMALL)
+        small = self.count_queries()
+        self.seed(self.LARGE - self.SMALL)
+        large = self.count_queries()
+
+        self.assertEqual(set(large), set(self.BUDGETS), "У каждой страницы должен быть бюджет")
+        for name, budget in self.BUDGETS.items():
+            with self.subTest(page=name):
+                self.assertEqual(large[name], small[name], f"{name}: запросов {small[name]} -> {large[name]}")
+                self.assertLessEqual(large[name], budget, f"{name}: {large[name]} запросов при бюджете {budget}")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MailingCloneTests(TestCase):
+    """Клонирование копирует рассылку и связи с получателями в базе, без выгрузки получателей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", email="user@example.com", password="x")
+        cls.other = User.objects.create_user(username="other", email="other@example.com", password="x")
+        now = timezone.now()
+        message = Message.objects.create(subject="Тема", body="Текст", owner=cls.user)
+        cls.mailing = Mailing.objects.create(
+            start_time=now - timedelta(days=30),
+            end_time=now - timedelta(days=29),
+            status=Mailing.COMPLETED,
+            owner=cls.user,
+            message=message,
+        )
+        cls.mailing.recipients.set(
+            Recipient.objects.bulk_create(
+                Recipient(email=f"r{i}@example.com", full_name=f"Получатель {i}", owner=cls.user) for i in range(50)
+            )
+        )
+
+    def test_clone_copies_recipients_in_constant_queries(self):
+        # Точка сохранения, INSERT рассылки, INSERT ... SELECT связей, освобождение точки
+        with self.assertNumQueries(4):
+            clone = MailingService.clone(self.mailing)
+
+        self.assertEqual(clone.status, Mailing.CREATED)
+        self.assertEqual(clone.message_id, self.mailing.message_id)
+        self.assertEqual(clone.end_time - clone.start_time, timedelta(days=1))
+        self.assertGreater(clone.start_time, self.mailing.end_time)
+        self.assertEqual(
+            set(clone.recipients.values_list("pk", flat=True)),
+            set(self.mailing.recipients.values_list("pk", flat=True)),
+        )
+
+    def test_clone_view_is_limited_to_own_mailings(self):
+        self.client.force_login(self.other)
+        response = self.client.post(reverse("clients:mailing_clone", args=[self.mailing.pk]))
+        self.assertEqual(response.status_code, 404)
+
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("clients:mailing_clone", args=[self.mailing.pk]))
+        clone = Mailing.objects.exclude(pk=self.mailing.pk).get()
+        self.assertRedirects(response, reverse("clients:mailing_update", args=[clone.pk]))
+        self.assertEqual(clone.recipients.count(), 50)
+
+    def test_clone_by_manager_clears_owner_caches(self):
+        manager = User.objects.create_superuser(
+            username="manager", email="manager@example.com", password="x", role=User.ROLE_MANAGER
+        )
+        owner_cache_key = f"user_stats_{self.user.id}_{self.user.role}"
+        self.client.force_login(manager)
+
+        for clone in (
+            lambda: self.client.post(reverse("clients:mailing_clone", args=[self.mailing.pk])),
+            lambda: self.client.post(
+                reverse("admin:clients_mailing_changelist"),
+                {"action": "clone_mailings", "_selected_action": [self.mailing.pk]},
+            ),
+        ):
+            StatisticsService.get_user_stats(self.user)
+            self.assertIsNotNone(cache.get(owner_cache_key))
+            clone()
+            self.assertIsNone(cache.get(owner_cache_key))
+
+        self.assertEqual(Mailing.objects.filter(owner=self.user).count(), 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MailingSoftDeleteTests(TestCase):
+    """Удалённая рассылка сразу скрыта, а её история удаляется позже порциями."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", email="user@example.com", password="x")
+        cls.manager = User.objects.create_superuser(
+            username="manager", email="manager@example.com", password="x", role=User.ROLE_MANAGER
+        )
+        now = timezone.now()
+        message = Message.objects.create(subject="Тема", body="Текст", owner=cls.user)
+        cls.mailing = Mailing.objects.create(
+            start_time=now, end_time=now + timedelta(days=1), owner=cls.user, message=message
+        )
+        recipient = Recipient.objects.create(email="r@example.com", full_name="Получатель", owner=cls.user)
+        cls.mailing.recipients.add(recipient)
+        MailingAttempt.objects.bulk_create(
+            MailingAttempt(mailing=cls.mailing, status=MailingAttempt.SUCCESS) for _ in range(5)
+        )
+        MailingLog.objects.bulk_create(
+            MailingLog(mailing=cls.mailing, recipient_email=recipient.email, status=MailingLog.SUCCESS)
+            for _ in range(5)
+        )
+
+    def test_deleted_by_manager_is_hidden_and_owner_cache_cleared(self):
+        owner_stats_key = f"user_stats_{self.user.id}_{self.user.role}"
+        StatisticsService.get_user_stats(self.user)
+        self.client.force_login(self.manager)
+
+        response = self.client.post(reverse("clients:mailing_delete", args=[self.mailing.pk]))
+
+        self.assertRedirects(response, reverse("clients:mailing_list"), fetch_redirect_response=False)
+        self.assertIsNone(cache.get(owner_stats_key))
+        self.assertFalse(Mailing.objects.for_user(self.user).exists())
+        self.assertNotIn(self.mailing, MailingService.get_user_mailings(self.user))
+        self.assertEqual(self.client.get(reverse("admin:clients_mailing_changelist")).context["cl"].result_count, 0)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("clients:mailing_detail", args=[self.mailing.pk]))
+        self.assertEqual(response.status_code, 404)
+        # История остаётся до purge_deleted_mailings
+        self.assertEqual(MailingAttempt.objects.filter(mailing_id=self.mailing.pk).count(), 5)
+
+    def test_admin_delete_action_marks_deleted(self):
+        self.client.force_login(self.manager)
+
+        self.client.post(
+            reverse("admin:clients_mailing_changelist"),
+            {"action": "delete_selected", "_selected_action": [self.mailing.pk], "post": "yes"},
+        )
+
+        self.assertFalse(Mailing.objects.exists())
+        self.assertIsNotNone(Mailing.all_objects.get(pk=self.mailing.pk).deleted_at)
+
+    def test_purge_deleted_removes_history_in_batches(self):
+        self.mailing.mark_deleted()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(MailingService.purge_deleted(batch_size=2), 1)
+
+        self.assertFalse(Mailing.all_objects.exists())
+        self.assertFalse(MailingAttempt.objects.exists())
+        self.assertFalse(MailingLog.objects.exists())
+        self.assertFalse(Mailing.recipients.through.objects.exists())
+        sqls = [query["sql"] for query in queries]
+        # По 3 порции на 5 попыток и 5 логов
+        self.assertEqual(sum('"clients_mailingattempt"."id" IN' in sql for sql in sqls), 3)
+        self.assertEqual(sum('"clients_mailinglog"."id" IN' in sql for sql in sqls), 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SegmentTests(TestCase):
+    """Сегмент отбирает получателей условиями в момент отправки, без строк на каждого получателя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", email="user@example.com", password="x")
+        cls.other = User.objects.create_user(username="other", email="other@example.com", password="x")
+        cls.vip = Tag.objects.create(name="vip", owner=cls.user)
+        cls.new = Tag.objects.create(name="new", owner=cls.user)
+        now = timezone.now()
+
+        def recipient(name, owner, tags=(), days_ago=0):
+            obj = Recipient.objects.create(email=f"{name}@example.com", full_name=name, owner=owner)
+            obj.tags.set(tags)
+            Recipient.objects.filter(pk=obj.pk).update(created_at=now - timedelta(days=days_ago))
+            return obj
+
+        cls.vip_old = recipient("vip-old", cls.user, [cls.vip], days_ago=60)
+        cls.vip_recent = recipient("vip-recent", cls.user, [cls.vip, cls.new], days_ago=5)
+        cls.plain_recent = recipient("plain-recent", cls.user, days_ago=5)
+        other_tag = Tag.objects.create(name="vip", owner=cls.other)
+        recipient("other-vip", cls.other, [other_tag], days_ago=5)
+        cls.segment = Segment.objects.create(
+            name="VIP за месяц", owner=cls.user, created_from=now - timedelta(days=30)
+        )
+        cls.segment.tags.set([cls.vip, cls.new])
+        cls.message = Message.objects.create(subject="Тема", body="Текст", owner=cls.user)
+
+    def emails(self, recipients):
+        return set(recipients.values_list("email", flat=True))
+
+    def test_segment_filters_by_owner_tags_and_created_range(self):
+        # Получатель с двумя тегами сегмента попадает в выборку один раз
+        self.assertEqual(
+            list(self.segment.get_recipients().values_list("email", flat=True)), ["vip-recent@example.com"]
+        )
+
+        self.segment.tags.clear()
+        self.assertEqual(
+            self.emails(self.segment.get_recipients()), {"vip-recent@example.com", "plain-recent@example.com"}
+        )
+
+        self.segment.created_from = None
+        self.assertEqual(len(self.emails(self.segment.get_recipients())), 3)
+
+    def test_mailing_to_segment_is_evaluated_at_send_time(self):
+        now = timezone.now()
+        mailing = Mailing.objects.create(
+            start_time=now,
+            end_time=now + timedelta(days=1),
+            owner=self.user,
+            message=self.message,
+            segment=self.segment,
+        )
+        # Добавлен после создания рассылки — всё равно получит письмо
+        late = Recipient.objects.create(email="late@example.com", full_name="late", owner=self.user)
+        late.tags.add(self.new)
+
+        self.assertEqual(MailingDeliveryService.send(mailing), (2, 0))
+
+        self.assertEqual({message.to[0] for message in mail.outbox}, {"vip-recent@example.com", "late@example.com"})
+        self.assertFalse(Mailing.recipients.through.objects.filter(mailing=mailing).exists())
+
+    def test_form_requires_segment_or_recipients(self):
+        now = timezone.now()
+        data = {
+            "start_time": (now + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M"),
+            "end_time": (now + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M"),
+            "message": self.message.pk,
+        }
+
+        self.assertIn("recipients", MailingForm(data, user=self.user).errors)
+        self.assertTrue(MailingForm({**data, "segment": self.segment.pk}, user=self.user).is_valid())
+        both = {**data, "segment": self.segment.pk, "recipients": [self.plain_recent.pk]}
+        self.assertIn("recipients", MailingForm(both, user=self.user).errors)
+        # Чужой сегмент выбрать нельзя
+        self.assertIn("segment", MailingForm({**data, "segment": self.segment.pk}, user=self.other).errors)
+
+    def test_recipient_form_creates_missing_tags(self):
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse("clients:recipient_create"),
+            {"email": "tagged@example.com", "full_name": "tagged", "tags": "vip, партнёры, "},
+        )
+
+        recipient = Recipient.objects.get(email="tagged@example.com")
+        self.assertEqual(set(recipient.tags.values_list("name", flat=True)), {"vip", "партнёры"})
+        self.assertEqual(Tag.objects.filter(owner=self.user, name="vip").count(), 1)
+
+
+def refused_port():
+    """Порт на локальном адресе, на котором никто не слушает."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DeliveryTests(TestCase):
+    """Ошибки отправки записываются в попытки и не оставляют рассылку запущенной."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", email="user@example.com", password="x")
+        now = timezone.now()
+        cls.message = Message.objects.create(subject="Тема", body="Текст", owner=cls.user)
+        cls.mailing = Mailing.objects.create(
+            start_time=now, end_time=now + timedelta(days=1), owner=cls.user, message=cls.message
+        )
+        cls.recipient = Recipient.objects.create(email="r@example.com", full_name="Получатель", owner=cls.user)
+        cls.mailing.recipients.add(cls.recipient)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def send(self):
+        return self.client.post(reverse("clients:send_mailing_now", args=[self.mailing.pk]))
+
+    def test_unreachable_smtp_server_is_recorded_as_failed_attempt(self):
+        with override_settings(
+            EMAIL_BACKEND="clients.backends.TimedSMTPBackend",
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=refused_port(),
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+        ):
+            response = self.send()
+
+        self.assertRedirects(
+            response, reverse("clients:mailing_detail", args=[self.mailing.pk]), fetch_redirect_response=False
+        )
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.COMPLETED)
+        attempt = MailingAttempt.objects.get(mailing=self.mailing)
+        self.assertEqual(attempt.status, MailingAttempt.FAILED)
+        # Время неудавшегося соединения тоже замерено
+        self.assertIsNotNone(attempt.connect_us)
+
+    def suppress(self, email):
+        """Получатель из стоп-листа; он новее остальных и обходится первым."""
+        recipient = Recipient.objects.create(email=email, full_name="Отписан", owner=self.user)
+        Recipient.objects.filter(pk=recipient.pk).update(created_at=timezone.now() + timedelta(minutes=1))
+        self.mailing.recipients.add(recipient)
+        SuppressedEmail.objects.create(email=email.lower(), reason=SuppressedEmail.UNSUBSCRIBED)
+
+    def test_suppressed_recipient_is_skipped_before_smtp(self):
+        self.suppress("Blocked@Example.com")
+
+        self.assertEqual(MailingDeliveryService.send(self.mailing), (1, 0))
+
+        self.assertEqual([message.to for message in mail.outbox], [["r@example.com"]])
+        log = MailingLog.objects.get(mailing=self.mailing)
+        self.assertEqual(log.recipient_email, "Blocked@Example.com")
+        self.assertEqual(log.status, MailingLog.SKIPPED)
+
+    def test_failure_mid_send_keeps_skipped_logs_and_finishes_progress(self):
+        self.suppress("blocked@example.com")
+
+        with (
+            mock.patch("clients.delivery.AttemptWriter.add", side_effect=RuntimeError("база недоступна")),
+            self.assertRaises(RuntimeError),
+        ):
+            self.send()
+
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.CREATED)
+        self.assertEqual(MailingLog.objects.get(mailing=self.mailing).status, MailingLog.SKIPPED)
+        self.assertIsNotNone(cache.get(ProgressService._key(self.mailing.pk, "finished_at")))
+
+    def test_template_is_rendered_for_each_recipient(self):
+        other = Recipient.objects.create(email="o@example.com", full_name="Ольга <Ивановна>", owner=self.user)
+        self.mailing.recipients.add(other)
+        Message.objects.filter(pk=self.message.pk).update(
+            subject="Письмо для {{ full_name }}",
+            body="Здравствуйте, {{ full_name }}!",
+            html_body="<p>Здравствуйте, {{ full_name }}!</p>",
+        )
+        self.mailing.refresh_from_db()
+
+        self.assertEqual(MailingDeliveryService.send(self.mailing), (2, 0))
+
+        sent = {message.to[0]: message for message in mail.outbox}
+        self.assertEqual(sent["r@example.com"].subject, "Письмо для Получатель")
+        self.assertEqual(sent["r@example.com"].body, "Здравствуйте, Получатель!")
+        # В тексте — как есть, в HTML — с экранированием
+        self.assertEqual(sent["o@example.com"].body, "Здравствуйте, Ольга <Ивановна>!")
+        self.assertEqual(sent["o@example.com"].alternatives[0].content, "<p>Здравствуйте, Ольга &lt;Ивановна&gt;!</p>")
+
+    def test_invalid_message_template_does_not_leave_mailing_started(self):
+        Message.objects.filter(pk=self.message.pk).update(body="Привет {% bad %}")
+
+        response = self.send()
+
+        self.assertRedirects(
+            response, reverse("clients:mailing_detail", args=[self.mailing.pk]), fetch_redirect_response=False
+        )
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.CREATED)
+        self.assertFalse(MailingAttempt.objects.exists())
+
+    def test_admin_rejects_invalid_message_template(self):
+        admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="x", role=User.ROLE_MANAGER
+        )
+        self.client.force_login(admin)
+
+        response = self.client.post(
+            reverse("admin:clients_message_change", args=[self.message.pk]),
+            {"subject": "Тема", "body": "Привет {% bad %}", "html_body": ""},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("body", response.context["adminform"].form.errors)
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.body, "Текст")
+
+
+class PreparedMessageTests(SimpleTestCase):
+    """Заранее собранное письмо совпадает по заголовку To с письмом, собранным Django."""
+
+    def test_each_recipient_gets_own_headers_and_same_body(self):
+        def build(to=None):
+            message = EmailMultiAlternatives("Новости", "Текст письма", "from@example.com", to)
+            message.attach_alternative("<p>Текст письма</p>", "text/html")
+            return message
+
+        prepared = PreparedMessage(build())
+        addresses = ["one@example.com", "two@example.com"]
+
+        messages = [
+            email.message_from_bytes(prepared.for_recipient(address).message().as_bytes(), policy=email.policy.default)
+            for address in addresses
+        ]
+
+        self.assertEqual([message["To"] for message in messages], addresses)
+        self.assertNotEqual(messages[0]["Message-ID"], messages[1]["Message-ID"])
+        for message, address in zip(messages, addresses):
+            # Так письмо собирает и отправляет SMTP-бэкенд Django
+            expected = email.message_from_bytes(
+                build([address]).message(policy=email.policy.SMTP).as_bytes(), policy=email.policy.default
+            )
+            self.assertEqual(message["Subject"], expected["Subject"])
+            self.assertEqual(message["From"], expected["From"])
+            for part in ("plain", "html"):
+                self.assertEqual(
+                    message.get_body((part,)).get_content(), expected.get_body((part,)).get_content(), part
+                )
+
+    def test_idn_domain_is_punycode_encoded(self):
+        address = "user@пример.рф"
+        prepared = PreparedMessage(EmailMultiAlternatives("Тема", "Текст", "from@example.com"))
+
+        headers = prepared.for_recipient(address).message().as_bytes().split(b"\r\n")
+
+        expected = EmailMultiAlternatives("Тема", "Текст", "from@example.com", [address]).message()["To"]
+        self.assertEqual(expected, "user@xn--e1afmkfd.xn--p1ai")
+        self.assertIn(f"To: {expected}".encode("ascii"), headers)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OwnerScopeTests(TestCase):
+    """Отправка, прогресс и выгрузка доступны только владельцу рассылки и менеджеру."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", email="user@example.com", password="x")
+        cls.other = User.objects.create_user(username="other", email="other@example.com", password="x")
+        now = timezone.now()
+        message = Message.objects.create(subject="Тема", body="Текст", owner=cls.user)
+        cls.mailing = Mailing.objects.create(
+            start_time=now, end_time=now + timedelta(days=1), owner=cls.user, message=message
+        )
+        MailingAttempt.objects.create(mailing=cls.mailing, status=MailingAttempt.SUCCESS)
+        MailingLog.objects.create(mailing=cls.mailing, recipient_email="r@example.com", status=MailingLog.SUCCESS)
+
+    def test_anonymous_user_is_sent_to_login(self):
+        url = reverse("clients:send_mailing_now", args=[self.mailing.pk])
+        response = self.client.post(url)
+        self.assertRedirects(response, f"{reverse('users:login')}?next={url}", fetch_redirect_response=False)
+
+    def test_other_users_mailing_is_not_found(self):
+        self.client.force_login(self.other)
+        for name, method in (
+            ("clients:send_mailing_now", self.client.post),
+            ("clients:mailing_progress", self.client.get),
+            ("clients:mailing_progress_stream", self.client.get),
+        ):
+            with self.subTest(view=name):
+                self.assertEqual(method(reverse(name, args=[self.mailing.pk])).status_code, 404)
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.CREATED)
+
+    def test_mailing_list_page_is_one_query(self):
+        self.assertFalse(MailingService.get_user_mailings(self.other).exists())
+
+        # Тема и число получателей — в том же запросе; список не кешируется и сразу видит изменения
+        with self.assertNumQueries(1):
+            mailings = list(MailingService.get_user_mailings(self.user)[:10])
+        self.assertEqual(mailings, [self.mailing])
+        self.assertEqual(mailings[0].recipients_count, 0)
+
+    def test_export_is_limited_to_own_mailings(self):
+        for kind in ("attempts", "logs"):
+            url = reverse("clients:export_csv", args=[kind])
+            with self.subTest(kind=kind):
+                self.client.force_login(self.other)
+                rows = b"".join(self.client.get(url, {"owner": self.user.pk}).streaming_content).splitlines()
+                self.assertEqual(len(rows), 1)
+
+                self.client.force_login(self.user)
+                rows = b"".join(self.client.get(url).streaming_content).splitlines()
+                self.assertEqual(len(rows), 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProgressStreamTests(TestCase):
+    """Поток прогресса отдаётся только под ASGI; под WSGI страница опрашивает JSON."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", email="user@example.com", password="x")
+        now = timezone.now()
+        message = Message.objects.create(subject="Тема", body="Текст", owner=cls.user)
+        cls.mailing = Mailing.objects.create(
+            start_time=now, end_time=now + timedelta(days=1), owner=cls.user, message=message
+        )
+
+    def test_wsgi_request_gets_no_stream(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("clients:mailing_progress_stream", args=[self.mailing.pk]))
+        self.assertEqual(response.status_code, 204)
+
+        response = self.client.get(reverse("clients:mailing_detail", args=[self.mailing.pk]))
+        self.assertNotContains(response, "data-stream-url=")
+        self.assertContains(response, f'data-start-grace="{PROGRESS_STREAM_START_GRACE}"')
+
+    def test_detail_page_has_single_send_button(self):
+        self.client.force_login(self.user)
+        send_url = reverse("clients:send_mailing_now", args=[self.mailing.pk])
+
+        Mailing.objects.filter(pk=self.mailing.pk).update(start_time=timezone.now() + timedelta(hours=1))
+        response = self.client.get(reverse("clients:mailing_detail", args=[self.mailing.pk]))
+        self.assertContains(response, send_url, count=1)
+
+        # В периоде отправки рассылка запущена, и кнопки нет
+        Mailing.objects.filter(pk=self.mailing.pk).update(start_time=timezone.now())
+        response = self.client.get(reverse("clients:mailing_detail", args=[self.mailing.pk]))
+        self.assertEqual(response.context["mailing"].status, Mailing.STARTED)
+        self.assertNotContains(response, send_url)
+
+    async def test_asgi_request_gets_event_stream(self):
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.get(reverse("clients:mailing_progress_stream", args=[self.mailing.pk]))
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        first_event = await anext(aiter(response.streaming_content))
+        self.assertTrue(first_event.startswith(b"data: "))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MetricsTests(TestCase):
+    """Метрики Prometheus."""
+
+    def test_db_connection_gauges_are_exported(self):
+        response = self.client.get(reverse("clients:metrics"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "# TYPE db_pool_size gauge")
+        self.assertRegex(response.content.decode(), r"\ndb_connections_opened [1-9]")
+        self.assertContains(response, "\ndb_pool_requests_wait_ms 0\n")
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_token_is_required_when_configured(self):
+        url = reverse("clients:metrics")
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer wrong"}).status_code, 404)
+        self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer secret"}).status_code, 200)
+
+    def test_without_token_only_allowed_ips(self):
+        response = self.client.get(reverse("clients:metrics"), REMOTE_ADDR="203.0.113.5")
+
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ArchiveTests(TestCase):
+    """Архивирование переносит старые строки в файлы, не меняя итогов статистики."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", email="user@example.com", password="x")
+        now = timezone.now()
+        message = Message.objects.create(subject="Тема", body="Текст", owner=cls.user)
+        cls.mailing = Mailing.objects.create(
+            start_time=now, end_time=now + timedelta(days=1), owner=cls.user, message=message
+        )
+        for status in (MailingAttempt.SUCCESS, MailingAttempt.SUCCESS, MailingAttempt.FAILED):
+            MailingAttempt.objects.create(mailing=cls.mailing, status=status, server_response="ответ")
+            MailingLog.objects.create(mailing=cls.mailing, recipient_email="r@example.com", status=status)
+        cls.old = now - timedelta(days=100)
+        MailingAttempt.objects.update(attempt_time=cls.old)
+        MailingLog.objects.update(created_at=cls.old)
+        # Свежая попытка остаётся в таблице
+        MailingAttempt.objects.create(mailing=cls.mailing, status=MailingAttempt.SUCCESS)
+
+    def setUp(self):
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+
+    def read_archive(self):
+        rows = []
+        for name in sorted(os.listdir(self.directory)):
+            with gzip.open(os.path.join(self.directory, name), "rt", encoding="utf-8") as archive_file:
+                rows.extend(json.loads(line) for line in archive_file)
+        return rows
+
+    def test_rows_move_to_archive_and_stats_are_kept(self):
+        stats_before = StatisticsService.get_user_stats(self.user)
+        cache.clear()
+
+        archived = ArchiveService.archive(
+            ExportService.ATTEMPTS, timezone.now() - timedelta(days=90), batch_size=2, directory=self.directory
+        )
+
+        self.assertEqual(archived, 3)
+        self.assertEqual(MailingAttempt.objects.count(), 1)
+        self.assertEqual(StatisticsService.get_user_stats(self.user), stats_before)
+        self.assertTrue(all(name.startswith(f"attempts-{self.old:%Y-%m}-") for name in os.listdir(self.directory)))
+        rows = self.read_archive()
+        self.assertEqual(sorted(row["status"] for row in rows), ["failed", "success", "success"])
+
+        ArchiveService.archive(ExportService.LOGS, timezone.now() - timedelta(days=90), directory=self.directory)
+        self.assertFalse(MailingLog.objects.exists())
+        self.assertEqual(len(self.read_archive()), 6)
+
+    def test_rolled_back_batch_leaves_no_archive_file(self):
+        with (
+            mock.patch.object(ArchiveService, "_add_archived_counts", side_effect=RuntimeError),
+            self.assertRaises(RuntimeError),
+        ):
+            ArchiveService.archive(ExportService.ATTEMPTS, timezone.now(), directory=self.directory)
+
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertEqual(MailingAttempt.objects.count(), 4)
+
+    def test_part_left_after_commit_is_completed_on_next_run(self):
+        rows = list(MailingAttempt.objects.values(*ArchiveService.ARCHIVES[ExportService.ATTEMPTS]["fields"]))
+        committed, pending = rows[:1], rows[1:]
+        for batch in (committed, pending):
+            ArchiveService._write_rows(ExportService.ATTEMPTS, batch, "attempt_time", self.directory)
+        MailingAttempt.objects.filter(pk=committed[0]["id"]).delete()
+
+        ArchiveService.archive(ExportService.ATTEMPTS, self.old - timedelta(days=1), directory=self.directory)
+
+        self.assertEqual([row["id"] for row in self.read_archive()], [committed[0]["id"]])
+
+
+class SMTPSinkTests(SimpleTestCase):
+    """Локальный SMTP-сервер отдаёт заданные задержки, отказы и обрывы так, как их видит smtplib."""
+
+    def sink(self, **options):
+        return self.enterContext(SMTPSink(seed=1, **options))
+
+    def sendmail(self, sink):
+        with smtplib.SMTP("127.0.0.1", sink.port, timeout=5) as smtp:
+            smtp.sendmail("from@example.com", ["to@example.com"], "Subject: test\r\n\r\nText")
+
+    def test_accepts_and_counts_messages(self):
+        sink = self.sink()
+
+        self.sendmail(sink)
+
+        self.assertEqual(sink.stats()["messages"], 1)
+
+    def test_latency(self):
+        sink = self.sink(connect_latency=0.05, latency=0.05)
+
+        started = time.perf_counter()
+        self.sendmail(sink)
+
+        self.assertGreaterEqual(time.perf_counter() - started, 0.1)
+
+    def test_temporary_and_permanent_failures(self):
+        for options, code in (({"temporary_failure_rate": 1}, 451), ({"permanent_failure_rate": 1}, 550)):
+            with self.subTest(code=code):
+                sink = self.sink(**options)
+                with self.assertRaises(smtplib.SMTPDataError) as error:
+                    self.sendmail(sink)
+                self.assertEqual(error.exception.smtp_code, code)
+
+    def test_dropped_connection(self):
+        sink = self.sink(drop_rate=1)
+
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            self.sendmail(sink)
+
+        self.assertEqual(sink.stats()["dropped"], 1)
+
+    def test_max_sessions(self):
+        sink = self.sink(max_sessions=1)
+
+        with smtplib.SMTP("127.0.0.1", sink.port, timeout=5):
+            with self.assertRaises(smtplib.SMTPConnectError) as error:
+                smtplib.SMTP("127.0.0.1", sink.port, timeout=5)
+
+        self.assertEqual(error.exception.smtp_code, 421)
+        self.assertEqual(sink.stats()["refused_sessions"], 1)
+
+    def test_command_rejects_invalid_rates(self):
+        with self.assertRaises(CommandError):
+            call_command("fake_smtp", "--port", "0", "--temp-fail-rate", "0.6", "--perm-fail-rate", "0.6")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class EstimatedCountPaginatorTests(TestCase):
+    """Оценка числа строк берётся только для запроса без фильтров по большой таблице PostgreSQL."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username="user", email="user@example.com", password="x")
+        Recipient.objects.bulk_create(
+            Recipient(email=f"r{i}@example.com", full_name=f"Получатель {i}", owner=user) for i in range(3)
+        )
+
+    def setUp(self):
+        cache.clear()
+        # Соединение PostgreSQL, у которого pg_class.reltuples = 50 000
+        self.pg_connection = mock.MagicMock(vendor="postgresql")
+        self.pg_connection.ops.quote_name.side_effect = lambda name: f'"{name}"'
+        self.cursor = self.pg_connection.cursor.return_value.__enter__.return_value
+        self.cursor.fetchone.return_value = (50_000,)
+        self.enterContext(mock.patch("clients.paginators.connections", {"default": self.pg_connection}))
+
+    def count(self, queryset):
+        return EstimatedCountPaginator(queryset, 10).count
+
+    def test_unfiltered_large_table_uses_cached_estimate(self):
+        self.assertEqual(self.count(Recipient.objects.all()), 50_000)
+        self.assertEqual(self.count(Recipient.objects.all()), 50_000)
+
+        self.assertEqual(self.cursor.execute.call_count, 1)
+        self.assertEqual(self.cursor.execute.call_args.args[1], ['"clients_recipient"'])
+
+    def test_filtered_queryset_counts_exactly(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.count(Recipient.objects.filter(email__startswith="r1")), 1)
+
+        self.cursor.execute.assert_not_called()
+
+    def test_small_or_unanalyzed_table_counts_exactly(self):
+        for reltuples in (100, -1):
+            with self.subTest(reltuples=reltuples):
+                cache.clear()
+                self.cursor.fetchone.return_value = (reltuples,)
+                self.assertEqual(self.count(Recipient.objects.all()), 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SearchTests(TestCase):
+    """Поиск q в списках сообщений и получателей — по search_fields и только среди своих объектов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", email="user@example.com", password="x")
+        other = User.objects.create_user(username="other", email="other@example.com", password="x")
+        Message.objects.create(subject="Weekly news", body="Текст", owner=cls.user)
+        Message.objects.create(subject="Акция", body="Скидки и news", owner=cls.user)
+        Message.objects.create(subject="Счёт", body="Оплата", owner=cls.user)
+        Message.objects.create(subject="News", body="Чужое", owner=other)
+        Recipient.objects.create(email="anna@example.com", full_name="Анна", owner=cls.user)
+        Recipient.objects.create(email="b@example.com", full_name="Борис", comment="ANNA's friend", owner=cls.user)
+        Recipient.objects.create(email="c@example.com", full_name="Вера", owner=cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def search(self, name, query):
+        response = self.client.get(reverse(name), {"q": query})
+        self.assertEqual(response.context["search_query"], query.strip())
+        return response.context["page_obj"].object_list
+
+    def test_message_search_matches_subject_and_body(self):
+        found = self.search("clients:message_list", " NEWS ")
+        self.assertEqual({message.subject for message in found}, {"Weekly news", "Акция"})
+
+    def test_recipient_search_matches_name_email_and_comment(self):
+        found = self.search("clients:recipient_list", "anna")
+        self.assertEqual({recipient.email for recipient in found}, {"anna@example.com", "b@example.com"})
+        self.assertEqual(
+            [recipient.full_name for recipient in self.search("clients:recipient_list", "Вера")], ["Вера"]
+        )
+
+    def test_empty_query_lists_everything(self):
+        self.assertEqual(len(self.search("clients:message_list", "")), 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ObjectPermissionTests(TestCase):
+    """Страницы объекта доступны владельцу и менеджеру; объект загружается один раз за запрос."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", email="user@example.com", password="x")
+        cls.other = User.objects.create_user(username="other", email="other@example.com", password="x")
+        cls.manager = User.objects.create_user(
+            username="manager", email="manager@example.com", password="x", role=User.ROLE_MANAGER
+        )
+        cls.message = Message.objects.create(subject="Тема", body="Текст", owner=cls.user)
+        cls.url = reverse("clients:message_update", args=[cls.message.pk])
+
+    def test_owner_page_loads_object_once(self):
+        self.client.force_login(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["object"], self.message)
+        self.assertEqual(sum('FROM "clients_message"' in query["sql"] for query in queries), 1)
+
+    def test_access_by_role(self):
+        self.client.force_login(self.manager)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        self.client.force_login(self.other)
+        self.assertRedirects(self.client.get(self.url), reverse("clients:mailing_list"), fetch_redirect_response=False)
+
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertRedirects(response, f"{reverse('users:login')}?next={self.url}", fetch_redirect_response=False)
@@ -12,6 +12,14 @@ urlpatterns = [
     path("mailing/<int:pk>/update/", views.MailingUpdateView.as_view(), name="mailing_update"),
     path("mailing/<int:pk>/delete/", views.MailingDeleteView.as_view(), name="mailing_delete"),
     path("mailing/<int:pk>/send/", views.send_mailing_now, name="send_mailing_now"),
+    path("mailing/<int:pk>/clone/", views.clone_mailing, name="mailing_clone"),
+    path("mailing/<int:pk>/progress/", views.mailing_progress, name="mailing_progress"),
+    path("mailing/<int:pk>/progress/stream/", views.mailing_progress_stream, name="mailing_progress_stream"),
+    path("stats/", views.stats_api, name="stats"),
+    # Выгрузка попыток и логов в CSV
+    path("export/<str:kind>.csv", views.export_csv, name="export_csv"),
+    # Метрики отправки для Prometheus
+    path("metrics/", views.prometheus_metrics, name="metrics"),
     # Сообщения
     path("messages/", views.MessageListView.as_view(), name="message_list"),
     path("message/create/", views.MessageCreateView.as_view(), name="message_create"),
@@ -22,4 +30,9 @@ urlpatterns = [
     path("recipient/create/", views.RecipientCreateView.as_view(), name="recipient_create"),
     path("recipient/<int:pk>/update/", views.RecipientUpdateView.as_view(), name="recipient_update"),
     path("recipient/<int:pk>/delete/", views.RecipientDeleteView.as_view(), name="recipient_delete"),
+    # Сегменты получателей
+    path("segments/", views.SegmentListView.as_view(), name="segment_list"),
+    path("segment/create/", views.SegmentCreateView.as_view(), name="segment_create"),
+    path("segment/<int:pk>/update/", views.SegmentUpdateView.as_view(), name="segment_update"),
+    path("segment/<int:pk>/delete/", views.SegmentDeleteView.as_view(), name="segment_delete"),
 ]
@@ -1,25 +1,42 @@
-from django.shortcuts import render, get_object_or_404, redirect
+import asyncio
+import json
+
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.views.generic import ListView, CreateView, UpdateView, DetailView, DeleteView
 from django.urls import reverse_lazy, reverse
 from django.contrib import messages
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
-from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.mail import send_mail
 from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, HttpResponseBadRequest, Http404
+from django.views.decorators.http import require_POST, require_GET
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.crypto import constant_time_compare
+from django.template import TemplateSyntaxError
+from django.db.models import ProtectedError
+
+from . import metrics
+from .delivery import MailingDeliveryService
+from .models import Mailing, Message, Recipient, Segment
+from .forms import MailingForm, MessageForm, RecipientForm, SegmentForm
+from .mixins import ManagerOrOwnerRequiredMixin, ReplicaReadMixin, SearchMixin
+from .services import StatisticsService, MailingService, ExportService, ProgressService, DeliveryTimingService
 
-from .models import Mailing, Message, Recipient, MailingAttempt
-from .forms import MailingForm, MessageForm, RecipientForm
-from .mixins import ManagerOrOwnerRequiredMixin
-from .services import StatisticsService, MailingService
 
+async def home(request):
+    # Пользователь загружается асинхронно; шаблоны и контекст-процессоры получают уже готовый объект
+    request.user = await request.auser()
 
-def home(request):
     # Получаем статистику через сервис
-    stats = StatisticsService.get_user_stats(request.user)
+    stats = await StatisticsService.aget_user_stats(request.user)
 
     # Получаем последние рассылки
-    latest_mailings = Mailing.objects.all().order_by("-created_at")[:5]
+    latest_mailings = [
+        mailing
+        async for mailing in Mailing.objects.for_user(request.user)
+        .select_related("message")
+        .order_by("-created_at")[:5]
+    ]
 
     context = {
         **stats,
@@ -28,7 +45,66 @@ def home(request):
     return render(request, "clients/home.html", context)
 
 
-class MailingListView(LoginRequiredMixin, ListView):
+@login_required
+@require_GET
+async def stats_api(request):
+    """Статистика пользователя в JSON (async)."""
+    user = await request.auser()
+    return JsonResponse(await StatisticsService.aget_user_stats(user))
+
+
+async def _aget_mailing_for_progress(request, pk):
+    """Рассылка для страниц прогресса; чужая рассылка — 404."""
+    user = await request.auser()
+    return await aget_object_or_404(Mailing.objects.for_user(user).select_related("segment"), pk=pk)
+
+
+@login_required
+@require_GET
+async def mailing_progress(request, pk):
+    """Прогресс отправки рассылки в JSON (async) — запасной вариант для опроса без SSE."""
+    mailing = await _aget_mailing_for_progress(request, pk)
+    return JsonResponse(await ProgressService.aget(mailing))
+
+
+# Интервал между событиями и максимальная длительность одного SSE-подключения (секунды)
+PROGRESS_STREAM_INTERVAL = 1
+PROGRESS_STREAM_MAX_DURATION = 600
+# Сколько ждать запуска отправки: поток (и опрос на странице) может начаться раньше,
+# чем POST на отправку дойдёт до сервера
+PROGRESS_STREAM_START_GRACE = 5
+
+
+@login_required
+@require_GET
+async def mailing_progress_stream(request, pk):
+    """Прогресс отправки рассылки потоком server-sent events.
+
+    Поток работает только под ASGI: под WSGI Django дочитывает асинхронный ответ целиком
+    перед отправкой, и события пришли бы разом в конце, заняв поток на всё время.
+    Там отвечаем 204 — клиент SSE не переподключается, а страница опрашивает mailing_progress.
+    """
+    mailing = await _aget_mailing_for_progress(request, pk)
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    async def events():
+        for tick in range(PROGRESS_STREAM_MAX_DURATION // PROGRESS_STREAM_INTERVAL):
+            progress = await ProgressService.aget(mailing)
+            yield f"data: {json.dumps(progress)}\n\n"
+            if not progress["running"] and tick * PROGRESS_STREAM_INTERVAL >= PROGRESS_STREAM_START_GRACE:
+                yield "event: done\ndata: {}\n\n"
+                return
+            await asyncio.sleep(PROGRESS_STREAM_INTERVAL)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Отключаем буферизацию ответа в nginx
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+class MailingListView(LoginRequiredMixin, ReplicaReadMixin, ListView):
     """Список всех рассылок."""
 
     model = Mailing
@@ -49,6 +125,9 @@ class MailingCreateView(LoginRequiredMixin, CreateView):
     template_name = "clients/mailing_form.html"
     success_url = reverse_lazy("clients:mailing_list")
 
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), "user": self.request.user}
+
     def form_valid(self, form):
         form.instance.status = Mailing.CREATED
         form.instance.owner = self.request.user
@@ -56,7 +135,6 @@ class MailingCreateView(LoginRequiredMixin, CreateView):
         messages.success(self.request, "Рассылка успешно создана!")
         # Очищаем кеш через сервис
         StatisticsService.clear_user_stats_cache(self.request.user)
-        MailingService.clear_mailings_cache(self.request.user)
         return response
 
 
@@ -67,64 +145,72 @@ class MailingUpdateView(ManagerOrOwnerRequiredMixin, UpdateView):
     form_class = MailingForm
     template_name = "clients/mailing_form.html"
 
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), "user": self.request.user}
+
     def get_success_url(self):
         messages.success(self.request, "Рассылка успешно обновлена!")
         # Очищаем кеш через сервис
         StatisticsService.clear_user_stats_cache(self.request.user)
-        MailingService.clear_mailings_cache(self.request.user)
         return reverse("clients:mailing_detail", kwargs={"pk": self.object.pk})
 
 
-class MailingDetailView(LoginRequiredMixin, DetailView):
+class MailingDetailView(LoginRequiredMixin, ManagerOrOwnerRequiredMixin, DetailView):
     """Детальный просмотр рассылки."""
 
     model = Mailing
+    object_select_related = ("message", "segment")
     template_name = "clients/mailing_detail.html"
     context_object_name = "mailing"
+    # Сегмент может охватывать сотни тысяч получателей: на странице показываем только начало списка
+    RECIPIENTS_PREVIEW_LIMIT = 100
 
     def get_object(self, queryset=None):
         obj = super().get_object(queryset)
         obj.update_status()  # ← пересчёт и сохранение статуса
         return obj
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Поток прогресса (SSE) — только под ASGI, иначе страница опрашивает JSON
+        context["progress_stream"] = isinstance(self.request, ASGIRequest)
+        context["progress_start_grace"] = PROGRESS_STREAM_START_GRACE
+        recipients = self.object.get_recipients()
+        context["recipients_count"] = recipients.count()
+        context["recipients_preview"] = recipients[: self.RECIPIENTS_PREVIEW_LIMIT]
+        context["timing_percentiles"] = DeliveryTimingService.get_percentiles(self.object)
+        context["timing_columns"] = [f"p{p}" for p in DeliveryTimingService.PERCENTILES]
+        return context
+
 
+@login_required
 @require_POST
 def send_mailing_now(request, pk):
     """Отправка рассылки немедленно."""
-    mailing = get_object_or_404(Mailing, pk=pk)
-
-    # Проверяем права доступа
-    if not (request.user.is_manager() or mailing.owner == request.user):
-        messages.error(request, "У вас нет прав для отправки этой рассылки.")
-        return redirect("clients:mailing_detail", pk=mailing.pk)
+    mailing = get_object_or_404(Mailing.objects.for_user(request.user), pk=pk)
 
     if mailing.status == Mailing.STARTED:
         return JsonResponse({"status": "error", "message": "Рассылка уже запущена"}, status=400)
 
     # Обновляем статус рассылки
+    previous_status = mailing.status
     mailing.status = Mailing.STARTED
     mailing.save()
 
     # Отправляем письма
-    success_count = 0
-    error_count = 0
-
-    for recipient in mailing.recipients.all():
-        try:
-            send_mail(
-                subject=mailing.message.subject,
-                message=mailing.message.body,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[recipient.email],
-                fail_silently=False,
-            )
-            MailingAttempt.objects.create(
-                mailing=mailing, status=MailingAttempt.SUCCESS, server_response="Успешно отправлено"
-            )
-            success_count += 1
-        except Exception as e:
-            MailingAttempt.objects.create(mailing=mailing, status=MailingAttempt.FAILED, server_response=str(e))
-            error_count += 1
+    try:
+        success_count, error_count = MailingDeliveryService.send(mailing)
+    except TemplateSyntaxError as e:
+        # Шаблон сообщения не компилируется: ни одно письмо не ушло, рассылку можно отправить после правки
+        mailing.status = previous_status
+        mailing.save()
+        messages.error(request, f"Ошибка в шаблоне сообщения: {e}")
+        return redirect("clients:mailing_detail", pk=mailing.pk)
+    except Exception:
+        # Сбой посреди отправки: рассылка не должна навсегда остаться «Запущена»
+        mailing.status = previous_status
+        mailing.save()
+        raise
 
     mailing.status = Mailing.COMPLETED
     mailing.save()
@@ -133,20 +219,77 @@ def send_mailing_now(request, pk):
     return redirect("clients:mailing_detail", pk=mailing.pk)
 
 
+@login_required
+@require_POST
+def clone_mailing(request, pk):
+    """Копия рассылки с теми же сообщением и получателями."""
+    mailing = get_object_or_404(Mailing.objects.for_user(request.user).select_related("owner"), pk=pk)
+    clone = MailingService.clone(mailing)
+    # Копия принадлежит владельцу рассылки: менеджер, клонирующий чужую рассылку, сбрасывает и его статистику
+    for user in {request.user, mailing.owner}:
+        StatisticsService.clear_user_stats_cache(user)
+    messages.success(request, f"Создана копия рассылки: #{clone.pk}. Проверьте период отправки.")
+    return redirect("clients:mailing_update", pk=clone.pk)
+
+
+@login_required
+@require_GET
+def export_csv(request, kind):
+    """Потоковая выгрузка попыток или логов рассылок в CSV.
+
+    Фильтры в GET-параметрах: mailing, owner, date_from, date_to (YYYY-MM-DD), status.
+    Обычный пользователь выгружает только данные своих рассылок.
+    """
+    if kind not in ExportService.EXPORTS:
+        raise Http404
+
+    try:
+        queryset = ExportService.get_queryset(
+            kind,
+            user=request.user,
+            mailing=request.GET.get("mailing"),
+            owner=request.GET.get("owner"),
+            date_from=request.GET.get("date_from"),
+            date_to=request.GET.get("date_to"),
+            status=request.GET.get("status"),
+        )
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    response = StreamingHttpResponse(ExportService.iter_csv(kind, queryset), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{kind}.csv"'
+    return response
+
+
+@require_GET
+def prometheus_metrics(request):
+    """Метрики отправки в текстовом формате Prometheus.
+
+    Если задан METRICS_TOKEN, нужен заголовок «Authorization: Bearer <токен>».
+    Без токена доступ только с адресов из METRICS_ALLOWED_IPS: за прокси на том же хосте
+    REMOTE_ADDR у всех запросов 127.0.0.1, поэтому такой режим годится только без прокси.
+    """
+    if settings.METRICS_TOKEN:
+        if not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {settings.METRICS_TOKEN}"):
+            raise Http404
+    elif request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # Остальные представления остаются без изменений
-class MessageListView(LoginRequiredMixin, ListView):
+class MessageListView(LoginRequiredMixin, ReplicaReadMixin, SearchMixin, ListView):
     """Список сообщений."""
 
     model = Message
     template_name = "clients/message_list.html"
     context_object_name = "messages"
     paginate_by = 10
+    search_fields = ("subject", "body")
 
     def get_queryset(self):
         """Фильтруем сообщения в зависимости от роли пользователя."""
-        if self.request.user.is_manager():
-            return Message.objects.all()
-        return Message.objects.filter(owner=self.request.user)
+        return self.search(Message.objects.for_user(self.request.user))
 
 
 class MessageCreateView(LoginRequiredMixin, CreateView):
@@ -178,19 +321,18 @@ class MessageUpdateView(ManagerOrOwnerRequiredMixin, UpdateView):
         return response
 
 
-class RecipientListView(LoginRequiredMixin, ListView):
+class RecipientListView(LoginRequiredMixin, ReplicaReadMixin, SearchMixin, ListView):
     """Список получателей."""
 
     model = Recipient
     template_name = "clients/recipient_list.html"
     context_object_name = "recipients"
     paginate_by = 20
+    search_fields = ("full_name", "email", "comment")
 
     def get_queryset(self):
         """Фильтруем получателей в зависимости от роли пользователя."""
-        if self.request.user.is_manager():
-            return Recipient.objects.all()
-        return Recipient.objects.filter(owner=self.request.user)
+        return self.search(Recipient.objects.for_user(self.request.user))
 
 
 class RecipientCreateView(LoginRequiredMixin, CreateView):
@@ -255,6 +397,70 @@ class RecipientDeleteView(ManagerOrOwnerRequiredMixin, DeleteView):
         return super().delete(request, *args, **kwargs)
 
 
+class SegmentListView(LoginRequiredMixin, ReplicaReadMixin, ListView):
+    """Список сегментов получателей."""
+
+    model = Segment
+    template_name = "clients/segment_list.html"
+    context_object_name = "segments"
+    paginate_by = 10
+
+    def get_queryset(self):
+        return Segment.objects.for_user(self.request.user).prefetch_related("tags")
+
+
+class SegmentCreateView(LoginRequiredMixin, CreateView):
+    """Создание сегмента получателей."""
+
+    model = Segment
+    form_class = SegmentForm
+    template_name = "clients/segment_form.html"
+    success_url = reverse_lazy("clients:segment_list")
+
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), "user": self.request.user}
+
+    def form_valid(self, form):
+        form.instance.owner = self.request.user
+        response = super().form_valid(form)
+        messages.success(self.request, "Сегмент успешно создан!")
+        return response
+
+
+class SegmentUpdateView(ManagerOrOwnerRequiredMixin, UpdateView):
+    """Редактирование сегмента получателей."""
+
+    model = Segment
+    form_class = SegmentForm
+    template_name = "clients/segment_form.html"
+    success_url = reverse_lazy("clients:segment_list")
+
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), "user": self.request.user}
+
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        messages.success(self.request, "Сегмент успешно обновлен!")
+        return response
+
+
+class SegmentDeleteView(ManagerOrOwnerRequiredMixin, DeleteView):
+    """Удаление сегмента, если на него не ссылаются рассылки."""
+
+    model = Segment
+    template_name = "clients/segment_confirm_delete.html"
+    success_url = reverse_lazy("clients:segment_list")
+
+    def form_valid(self, form):
+        try:
+            response = super().form_valid(form)
+        except ProtectedError:
+            messages.error(self.request, "Сегмент используется в рассылках и не может быть удален.")
+            return redirect("clients:segment_list")
+        messages.success(self.request, "Сегмент успешно удален!")
+        return response
+
+
 class MessageDeleteView(ManagerOrOwnerRequiredMixin, DeleteView):
     """Удаление сообщения."""
 
@@ -271,9 +477,15 @@ class MailingDeleteView(ManagerOrOwnerRequiredMixin, DeleteView):
     """Удаление рассылки."""
 
     model = Mailing
+    object_select_related = ("message", "segment", "owner")
     template_name = "clients/mailing_confirm_delete.html"
     success_url = reverse_lazy("clients:mailing_list")
 
-    def delete(self, request, *args, **kwargs):
-        messages.success(request, "Рассылка успешно удалена!")
-        return super().delete(request, *args, **kwargs)
+    def form_valid(self, form):
+        """Помечаем рассылку удалённой; попытки и логи удалит purge_deleted_mailings."""
+        self.object.mark_deleted()
+        messages.success(self.request, "Рассылка успешно удалена!")
+        # Менеджер может удалить чужую рассылку: сбрасываем статистику и ему, и владельцу
+        for user in {self.request.user, self.object.owner}:
+            StatisticsService.clear_user_stats_cache(user)
+        return redirect(self.get_success_url())
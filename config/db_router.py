@@ -0,0 +1,102 @@
+"""
+Маршрутизация чтения на реплику PostgreSQL.
+
+Чтение на реплику включается явно: код, которому допустимо небольшое отставание
+(статистика, списки, страницы изменений в админке), делает queryset.using(get_read_db()).
+Все записи идут на основную базу. После записи запрос, а также запросы этого клиента
+в течение REPLICA_PIN_SECONDS (через cookie), читают с основной базы, чтобы пользователь
+сразу видел свои изменения.
+"""
+
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_DB_ALIAS = "replica"
+PIN_COOKIE_NAME = "db_pin_primary"
+
+_pinned_to_primary = ContextVar("pinned_to_primary", default=False)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def get_read_db():
+    """Алиас базы для чтения, допускающего отставание реплики."""
+    if replica_configured() and not _pinned_to_primary.get():
+        return REPLICA_DB_ALIAS
+    return DEFAULT_DB_ALIAS
+
+
+def pin_to_primary():
+    """До конца запроса читать только с основной базы."""
+    _pinned_to_primary.set(True)
+
+
+class ReplicaRouter:
+    """Роутер: запись и миграции — только на основную базу, реплика — по явному using()."""
+
+    def db_for_read(self, model, **hints):
+        # None: Django возьмёт базу объекта из hints или основную
+        return None
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinningMiddleware:
+    """Закрепляет клиента за основной базой после изменяющего запроса.
+
+    Поддерживает и синхронный, и асинхронный режим, чтобы не мешать async-представлениям под ASGI.
+    """
+
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = self._pin_request(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned_to_primary.reset(token)
+        return self._process_response(request, response)
+
+    async def __acall__(self, request):
+        token = self._pin_request(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _pinned_to_primary.reset(token)
+        return self._process_response(request, response)
+
+    def _pin_request(self, request):
+        # Потоки WSGI-сервера переиспользуются, поэтому флаг выставляется на каждый запрос заново
+        pinned = request.method not in self.SAFE_METHODS or PIN_COOKIE_NAME in request.COOKIES
+        return _pinned_to_primary.set(pinned)
+
+    def _process_response(self, request, response):
+        if request.method not in self.SAFE_METHODS and replica_configured():
+            response.set_cookie(PIN_COOKIE_NAME, "1", max_age=settings.REPLICA_PIN_SECONDS, httponly=True)
+        return response
@@ -0,0 +1,223 @@
+"""
+Профилирование запросов: время и число SQL-запросов, обращения к кешу и общее время ответа.
+
+Включается настройкой PROFILING_ENABLED, профилируется доля запросов PROFILING_SAMPLE_RATE.
+Результат уходит в заголовок Server-Timing (виден во вкладке Network браузера) и строкой JSON
+в логгер config.profiling. Запросы дольше PROFILING_SLOW_REQUEST_MS логируются с самыми
+долгими SQL-запросами.
+"""
+
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache.backends.redis import RedisCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger("config.profiling")
+
+_current_profile = ContextVar("current_profile", default=None)
+
+
+class RequestProfile:
+    """Счётчики одного запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.sql_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_calls = 0
+        self.cache_time = 0.0
+
+    def add_query(self, alias, sql, duration):
+        self.queries.append((duration, alias, sql))
+        self.sql_time += duration
+
+    def add_cache_call(self, duration, hits=0, misses=0):
+        self.cache_calls += 1
+        self.cache_time += duration
+        self.cache_hits += hits
+        self.cache_misses += misses
+
+    def top_queries(self, count):
+        return [
+            {"alias": alias, "ms": round(duration * 1000, 2), "sql": sql[:1000]}
+            for duration, alias, sql in sorted(self.queries, key=lambda query: query[0], reverse=True)[:count]
+        ]
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(context["connection"].alias, sql, time.perf_counter() - started)
+
+
+def _instrument_connection(sender, connection, **kwargs):
+    # Обёртка ставится один раз на соединение и ничего не делает вне профилируемого запроса
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def install():
+    """Подключает учёт SQL-запросов; вызывается при старте приложения, до открытия соединений."""
+    if settings.PROFILING_ENABLED:
+        connection_created.connect(_instrument_connection, dispatch_uid="config_profiling_instrument_connection")
+
+
+_MISSING = object()
+
+
+class InstrumentedCacheMixin:
+    """Учёт попаданий, промахов и времени обращений к кешу в профиле запроса.
+
+    Асинхронные методы BaseCache вызывают синхронные, поэтому учитываются тоже.
+    """
+
+    def _timed(self, method, *args, **kwargs):
+        profile = _current_profile.get()
+        if profile is None:
+            return method(*args, **kwargs), None
+        started = time.perf_counter()
+        result = method(*args, **kwargs)
+        return result, (profile, time.perf_counter() - started)
+
+    def get(self, key, default=None, version=None):
+        value, timing = self._timed(super().get, key, _MISSING, version=version)
+        if timing:
+            profile, duration = timing
+            hit = value is not _MISSING
+            profile.add_cache_call(duration, hits=int(hit), misses=int(not hit))
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values, timing = self._timed(super().get_many, keys, version=version)
+        if timing:
+            profile, duration = timing
+            profile.add_cache_call(duration, hits=len(values), misses=len(keys) - len(values))
+        return values
+
+    def _record(self, method, *args, **kwargs):
+        result, timing = self._timed(method, *args, **kwargs)
+        if timing:
+            timing[0].add_cache_call(timing[1])
+        return result
+
+    def set(self, *args, **kwargs):
+        return self._record(super().set, *args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        return self._record(super().add, *args, **kwargs)
+
+    def set_many(self, *args, **kwargs):
+        return self._record(super().set_many, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._record(super().delete, *args, **kwargs)
+
+    def delete_many(self, *args, **kwargs):
+        return self._record(super().delete_many, *args, **kwargs)
+
+    def incr(self, *args, **kwargs):
+        return self._record(super().incr, *args, **kwargs)
+
+    def touch(self, *args, **kwargs):
+        return self._record(super().touch, *args, **kwargs)
+
+    def has_key(self, *args, **kwargs):
+        return self._record(super().has_key, *args, **kwargs)
+
+
+class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+    """RedisCache с учётом обращений для профилирования."""
+
+
+class ProfilingMiddleware:
+    """Профилирует выборку запросов; подключается первым в MIDDLEWARE, чтобы учесть все остальные.
+
+    Поддерживает и синхронный, и асинхронный режим.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+        return self._process_response(request, response, profile)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+        return self._process_response(request, response, profile)
+
+    @staticmethod
+    def _sampled():
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    def _process_response(self, request, response, profile):
+        total_ms = (time.perf_counter() - profile.started) * 1000
+        sql_ms = profile.sql_time * 1000
+        cache_ms = profile.cache_time * 1000
+        response["Server-Timing"] = ", ".join(
+            [
+                f'sql;dur={sql_ms:.1f};desc="{len(profile.queries)} queries"',
+                f'cache;dur={cache_ms:.1f};desc="{profile.cache_hits} hits, {profile.cache_misses} misses"',
+                f"app;dur={max(total_ms - sql_ms - cache_ms, 0):.1f}",
+                f"total;dur={total_ms:.1f}",
+            ]
+        )
+
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total_ms, 2),
+            "sql_queries": len(profile.queries),
+            "sql_ms": round(sql_ms, 2),
+            "cache_calls": profile.cache_calls,
+            "cache_hits": profile.cache_hits,
+            "cache_misses": profile.cache_misses,
+            "cache_ms": round(cache_ms, 2),
+        }
+        if total_ms >= settings.PROFILING_SLOW_REQUEST_MS:
+            record["top_queries"] = profile.top_queries(settings.PROFILING_TOP_QUERIES)
+            logger.warning(json.dumps(record, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(record, ensure_ascii=False))
+        return response
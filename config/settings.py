@@ -12,7 +12,8 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 import os
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -39,14 +40,18 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "clients",
     "users",
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы в профиль попали все остальные middleware
+    "config.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
+    "config.db_router.ReplicaPinningMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
@@ -78,15 +83,63 @@ WSGI_APPLICATION = "config.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql_psycopg2",
+        "ENGINE": "django.db.backends.postgresql",
         "NAME": config("DATABASE_NAME"),
         "USER": config("DATABASE_USER"),
         "PASSWORD": config("DATABASE_PASSWORD"),
         "HOST": config("DATABASE_HOST"),
         "PORT": config("DATABASE_PORT", default="5432"),
+        # Постоянные соединения: не переподключаемся к PostgreSQL на каждый запрос
+        "CONN_MAX_AGE": config("DB_CONN_MAX_AGE", default=60, cast=int),
+        # Перед повторным использованием соединение проверяется, упавшее заменяется новым
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {},
     }
 }
 
+# Пул соединений psycopg 3 (нужен пакет psycopg[pool]). Размер пула задаётся отдельно
+# для веб-процессов и воркеров отправки: PROCESS_ROLE=web|worker в окружении процесса.
+DB_POOL_ENABLED = config("DB_POOL_ENABLED", default=False, cast=bool)
+PROCESS_ROLE = config("PROCESS_ROLE", default="web")
+
+if DB_POOL_ENABLED:
+    # Пул Django работает только с драйвером psycopg 3, а в зависимостях проекта — psycopg2
+    try:
+        import psycopg  # noqa: F401
+        from psycopg_pool import ConnectionPool
+    except ImportError as e:
+        raise ImproperlyConfigured(
+            'DB_POOL_ENABLED=True требует psycopg 3 с пулом: pip install "psycopg[binary,pool]"'
+        ) from e
+
+    _role = PROCESS_ROLE.upper()
+    DATABASES["default"]["CONN_MAX_AGE"] = 0  # соединения держит пул, а не Django
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": config(f"DB_POOL_MIN_SIZE_{_role}", default=2, cast=int),
+        "max_size": config(f"DB_POOL_MAX_SIZE_{_role}", default=10, cast=int),
+        "timeout": config("DB_POOL_TIMEOUT", default=10, cast=float),
+        # Проверка соединения при выдаче из пула
+        "check": ConnectionPool.check_connection,
+    }
+
+
+# Реплика для чтения статистики, списков и админки (см. config/db_router.py).
+# Для локальной проверки можно указать ту же базу, что и основная.
+DATABASE_REPLICA_HOST = config("DATABASE_REPLICA_HOST", default="")
+if DATABASE_REPLICA_HOST:
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "HOST": DATABASE_REPLICA_HOST,
+        "PORT": config("DATABASE_REPLICA_PORT", default=DATABASES["default"]["PORT"]),
+        "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+        # В тестах реплика — та же тестовая база
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["config.db_router.ReplicaRouter"]
+# Сколько секунд после изменяющего запроса клиент читает только с основной базы
+REPLICA_PIN_SECONDS = config("REPLICA_PIN_SECONDS", default=5, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -127,17 +180,21 @@ AUTH_USER_MODEL = "users.CustomUser"
 LOGIN_REDIRECT_URL = "clients:mailing_list"
 LOGOUT_REDIRECT_URL = "users:login"
 LOGIN_URL = "users:login"
+# Пользователь сессии читается из кеша; сбрасывается при изменении пользователя
+AUTHENTICATION_BACKENDS = ["users.backends.CachedModelBackend"]
+# Сессии в кеше с записью в базу: чтение сессии не обращается к базе
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
 
 
 STATIC_URL = "static/"
 STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 
 # Настройки почты
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
-EMAIL_HOST = "smtp.yandex.ru"  # или другой SMTP-сервер
-EMAIL_PORT = 465
-EMAIL_USE_TLS = False
-EMAIL_USE_SSL = True
+EMAIL_BACKEND = "clients.backends.TimedSMTPBackend"
+EMAIL_HOST = config("EMAIL_HOST", default="smtp.yandex.ru")  # или другой SMTP-сервер
+EMAIL_PORT = config("EMAIL_PORT", default=465, cast=int)
+EMAIL_USE_TLS = config("EMAIL_USE_TLS", default=False, cast=bool)
+EMAIL_USE_SSL = config("EMAIL_USE_SSL", default=True, cast=bool)
 EMAIL_HOST_USER = config("EMAIL_HOST_USER", default="")
 EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD", default="")
 DEFAULT_FROM_EMAIL = config("DEFAULT_FROM_EMAIL")
@@ -145,6 +202,9 @@ SERVER_EMAIL = config("SERVER_EMAIL")
 
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Каталог для архива старых попыток и логов рассылок (команда archive_attempts)
+ARCHIVE_DIR = config("ARCHIVE_DIR", default=os.path.join(BASE_DIR, "archive"))
+
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
 
@@ -152,7 +212,32 @@ CACHE_ENABLED = True
 if CACHE_ENABLED:
     CACHES = {
         "default": {
-            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            # RedisCache с учётом обращений для профилирования запросов
+            "BACKEND": "config.profiling.InstrumentedRedisCache",
             "LOCATION": "redis://127.0.0.1:6379/1",
         }
     }
+
+# Профилирование запросов: Server-Timing и строка JSON в лог (config/profiling.py)
+PROFILING_ENABLED = config("PROFILING_ENABLED", default=False, cast=bool)
+# Доля профилируемых запросов, от 0 до 1
+PROFILING_SAMPLE_RATE = config("PROFILING_SAMPLE_RATE", default=0.1, cast=float)
+# Запросы дольше этого (мс) логируются как медленные вместе с самыми долгими SQL-запросами
+PROFILING_SLOW_REQUEST_MS = config("PROFILING_SLOW_REQUEST_MS", default=500, cast=int)
+PROFILING_TOP_QUERIES = config("PROFILING_TOP_QUERIES", default=5, cast=int)
+
+# Токен для /metrics/ (Prometheus): запрос должен прийти с заголовком «Authorization: Bearer <токен>»
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+# Без токена метрики доступны с этих адресов; за прокси на том же хосте это открывает их всем
+METRICS_ALLOWED_IPS = config("METRICS_ALLOWED_IPS", default="127.0.0.1,::1", cast=Csv())
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "config.profiling": {"handlers": ["console"], "level": "INFO", "propagate": False},
+        "clients.metrics": {"handlers": ["console"], "level": "INFO", "propagate": False},
+        "users.outbox": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
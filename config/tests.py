@@ -0,0 +1,134 @@
+import contextvars
+import json
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from clients.models import Mailing
+
+from .db_router import PIN_COOKIE_NAME, REPLICA_DB_ALIAS, ReplicaPinningMiddleware, get_read_db
+from .profiling import InstrumentedCacheMixin, ProfilingMiddleware, _record_query
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    """Чтение, допускающее отставание, идёт на реплику; запись и чтение после неё — на основную базу."""
+
+    def setUp(self):
+        # Реплика — зеркало основной базы, как в settings.py; соединение с ней тестам не нужно
+        replica = {**settings.DATABASES["default"], "TEST": {"MIRROR": "default"}}
+        self.enterContext(mock.patch.dict(settings.DATABASES, {REPLICA_DB_ALIAS: replica}))
+
+    @staticmethod
+    def run_isolated(function, *args):
+        """Флаг закрепления за основной базой живёт в contextvar: записи других тестов его выставляют."""
+        return contextvars.Context().run(function, *args)
+
+    def request(self, method, cookies=None):
+        """Прогоняет запрос через middleware; возвращает (база для чтения в представлении, ответ)."""
+        seen = {}
+
+        def view(request):
+            seen["read_db"] = get_read_db()
+            return HttpResponse()
+
+        factory = RequestFactory()
+        if cookies:
+            factory.cookies.load(cookies)
+        request = getattr(factory, method)("/")
+        response = self.run_isolated(ReplicaPinningMiddleware(view), request)
+        return seen["read_db"], response
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        def route():
+            read_db = get_read_db()
+            write_db = router.db_for_write(Mailing)
+            return read_db, write_db, get_read_db()
+
+        # После записи чтение в том же запросе идёт на основную базу
+        self.assertEqual(self.run_isolated(route), (REPLICA_DB_ALIAS, "default", "default"))
+        self.assertFalse(router.allow_migrate(REPLICA_DB_ALIAS, "clients"))
+
+    def test_post_pins_next_requests_to_primary(self):
+        read_db, response = self.request("get")
+        self.assertEqual(read_db, REPLICA_DB_ALIAS)
+        self.assertNotIn(PIN_COOKIE_NAME, response.cookies)
+
+        read_db, response = self.request("post")
+        self.assertEqual(read_db, "default")
+        cookie = response.cookies[PIN_COOKIE_NAME]
+        self.assertEqual(cookie["max-age"], settings.REPLICA_PIN_SECONDS)
+
+        read_db, _ = self.request("get", cookies={PIN_COOKIE_NAME: cookie.value})
+        self.assertEqual(read_db, "default")
+
+    def test_without_replica_everything_reads_primary(self):
+        del settings.DATABASES[REPLICA_DB_ALIAS]
+
+        read_db, response = self.request("post")
+
+        self.assertEqual(read_db, "default")
+        self.assertNotIn(PIN_COOKIE_NAME, response.cookies)
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    """Кеш в памяти с учётом обращений, как InstrumentedRedisCache."""
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1, PROFILING_SLOW_REQUEST_MS=60_000)
+class ProfilingMiddlewareTests(TestCase):
+    """Профиль запроса: заголовок Server-Timing и строка JSON в лог."""
+
+    def setUp(self):
+        self.cache = InstrumentedLocMemCache("profiling-tests", {})
+        self.cache.set("hit", 1)
+        # Обёртку SQL install() вешает на новые соединения; тестовое уже открыто
+        self.enterContext(connection.execute_wrapper(_record_query))
+
+    def view(self, request):
+        Mailing.objects.count()
+        Mailing.objects.exists()
+        self.cache.get("hit")
+        self.cache.get("miss")
+        return HttpResponse()
+
+    def get(self):
+        return ProfilingMiddleware(self.view)(RequestFactory().get("/page/"))
+
+    def test_server_timing_and_log_record(self):
+        with self.assertLogs("config.profiling", "INFO") as logs:
+            response = self.get()
+
+        timing = response["Server-Timing"]
+        self.assertIn('desc="2 queries"', timing)
+        self.assertIn('desc="1 hits, 1 misses"', timing)
+        self.assertIn("total;dur=", timing)
+        self.assertEqual(logs.records[0].levelname, "INFO")
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record["path"], record["sql_queries"], record["cache_calls"]), ("/page/", 2, 2))
+        self.assertNotIn("top_queries", record)
+
+    @override_settings(PROFILING_SLOW_REQUEST_MS=0, PROFILING_TOP_QUERIES=1)
+    def test_slow_request_logs_top_queries(self):
+        with self.assertLogs("config.profiling", "WARNING") as logs:
+            self.get()
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(len(record["top_queries"]), 1)
+        self.assertIn("clients_mailing", record["top_queries"][0]["sql"])
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_unsampled_request_is_not_profiled(self):
+        with self.assertNoLogs("config.profiling"):
+            response = self.get()
+
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled_middleware_is_not_used(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(self.view)
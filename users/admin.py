@@ -2,7 +2,9 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.translation import gettext_lazy as _
 
-from .models import CustomUser
+from django.utils import timezone
+
+from .models import CustomUser, OutgoingEmail
 
 
 @admin.register(CustomUser)
@@ -43,14 +45,55 @@ class CustomUserAdmin(UserAdmin):
 
     def block_users(self, request, queryset):
         """Блокировка выбранных пользователей."""
+        user_ids = list(queryset.values_list("pk", flat=True))
         updated = queryset.update(is_active=False)
+        CustomUser.clear_cached(user_ids)
         self.message_user(request, f"{updated} пользователей заблокировано.")
 
     block_users.short_description = "Заблокировать выбранных пользователей"
 
     def unblock_users(self, request, queryset):
         """Разблокировка выбранных пользователей."""
+        user_ids = list(queryset.values_list("pk", flat=True))
         updated = queryset.update(is_active=True)
+        CustomUser.clear_cached(user_ids)
         self.message_user(request, f"{updated} пользователей разблокировано.")
 
     unblock_users.short_description = "Разблокировать выбранных пользователей"
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    """Админ-панель очереди системных писем."""
+
+    list_display = ("to_email", "subject", "status", "attempts", "next_attempt_at", "created_at", "sent_at")
+    list_filter = ("status", "created_at")
+    search_fields = ("to_email", "subject")
+    ordering = ("-created_at",)
+    readonly_fields = (
+        "subject",
+        "body",
+        "html_body",
+        "from_email",
+        "to_email",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "last_error",
+        "created_at",
+        "sent_at",
+    )
+
+    actions = ["retry_now"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def retry_now(self, request, queryset):
+        """Возвращает письма в очередь для немедленной отправки."""
+        updated = queryset.exclude(status=OutgoingEmail.SENT).update(
+            status=OutgoingEmail.PENDING, attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f"{updated} писем возвращено в очередь.")
+
+    retry_now.short_description = "Отправить повторно"
@@ -0,0 +1,22 @@
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from .models import CustomUser
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend, который берёт пользователя сессии из кеша, а не из базы на каждом запросе.
+
+    Запись сбрасывается при сохранении пользователя (роль, пароль, активность)
+    и при массовых изменениях через CustomUser.clear_cached.
+    """
+
+    def get_user(self, user_id):
+        key = CustomUser.cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, CustomUser.CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
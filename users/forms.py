@@ -1,8 +1,11 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm, PasswordResetForm, SetPasswordForm
 from django.contrib.auth import get_user_model
+from django.template import loader
 from django.utils.translation import gettext_lazy as _
 
+from .services import OutboxService
+
 User = get_user_model()
 
 
@@ -52,6 +55,15 @@ class CustomPasswordResetForm(PasswordResetForm):
         widget=forms.EmailInput(attrs={"class": "form-control", "placeholder": _("Email")}),
     )
 
+    def send_mail(
+        self, subject_template_name, email_template_name, context, from_email, to_email, html_email_template_name=None
+    ):
+        """Ставит письмо в очередь системных писем вместо отправки в запросе."""
+        subject = "".join(loader.render_to_string(subject_template_name, context).splitlines())
+        body = loader.render_to_string(email_template_name, context)
+        html_body = loader.render_to_string(html_email_template_name, context) if html_email_template_name else ""
+        OutboxService.enqueue(subject, body, to_email, html_body=html_body, from_email=from_email)
+
 
 class CustomSetPasswordForm(SetPasswordForm):
     """Форма установки нового пароля."""
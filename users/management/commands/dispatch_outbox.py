@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.services import OutboxService
+
+
+class Command(BaseCommand):
+    help = "Отправка системных писем из очереди с повторными попытками"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=OutboxService.BATCH_SIZE, help="Писем за одну SMTP-сессию"
+        )
+        parser.add_argument("--interval", type=float, default=2, help="Пауза между проверками пустой очереди, с")
+        parser.add_argument("--once", action="store_true", help="Разобрать очередь один раз и завершиться")
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                sent, failed = OutboxService.dispatch(batch_size=options["batch_size"])
+                if sent or failed:
+                    self.stdout.write(f"Отправлено: {sent}, ошибок: {failed}")
+                elif options["once"]:
+                    break
+                else:
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
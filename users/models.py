@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
+from django.core.cache import cache
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
@@ -37,6 +39,9 @@ class CustomUser(AbstractUser):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username"]
 
+    # Сколько секунд пользователь сессии живёт в кеше (users.backends.CachedModelBackend)
+    CACHE_TIMEOUT = 60
+
     class Meta:
         verbose_name = _("User")
         verbose_name_plural = _("Users")
@@ -51,3 +56,55 @@ class CustomUser(AbstractUser):
     def is_regular_user(self):
         """Проверяет, является ли пользователем обычным пользователем."""
         return self.role == self.ROLE_USER
+
+    @staticmethod
+    def cache_key(user_id):
+        return f"auth_user_{user_id}"
+
+    @classmethod
+    def clear_cached(cls, user_ids):
+        """Сбрасывает закешированных пользователей; нужно после queryset.update в обход save()."""
+        cache.delete_many([cls.cache_key(user_id) for user_id in user_ids])
+
+
+class OutgoingEmail(models.Model):
+    """Системное письмо в очереди на отправку (transactional outbox).
+
+    Письмо сохраняется в той же транзакции, что и данные, ради которых оно пишется,
+    а отправляет его команда dispatch_outbox с повторными попытками.
+    """
+
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (PENDING, "В очереди"),
+        (SENT, "Отправлено"),
+        (FAILED, "Не отправлено"),
+    ]
+
+    subject = models.CharField("Тема", max_length=255)
+    body = models.TextField("Текст")
+    html_body = models.TextField("HTML-версия", blank=True)
+    from_email = models.CharField("Отправитель", max_length=254)
+    to_email = models.EmailField("Получатель")
+    status = models.CharField("Статус", max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    next_attempt_at = models.DateTimeField("Следующая попытка", default=timezone.now)
+    last_error = models.TextField("Последняя ошибка", blank=True)
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+    sent_at = models.DateTimeField("Отправлено", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Системное письмо"
+        verbose_name_plural = "Системные письма"
+        indexes = [
+            # Диспетчер выбирает только письма в очереди, по времени следующей попытки
+            models.Index(
+                fields=["next_attempt_at"], condition=models.Q(status="pending"), name="outgoing_email_pending"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.to_email}: {self.subject}"
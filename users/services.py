@@ -0,0 +1,96 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+logger = logging.getLogger("users.outbox")
+
+
+class OutboxService:
+    """Очередь системных писем: активация аккаунта, восстановление пароля."""
+
+    BATCH_SIZE = 50
+    MAX_ATTEMPTS = 8
+    # Задержка перед повтором удваивается с каждой неудачной попыткой, но не больше RETRY_MAX_DELAY
+    RETRY_BASE_DELAY = timedelta(minutes=1)
+    RETRY_MAX_DELAY = timedelta(hours=1)
+    # На это время взятые в работу письма скрыты от других диспетчеров; если процесс упал — письмо вернётся в очередь
+    LEASE = timedelta(minutes=5)
+
+    @staticmethod
+    def enqueue(subject, body, to_email, html_body="", from_email=None):
+        """Ставит письмо в очередь; вызывается в транзакции вместе с изменением данных."""
+        return OutgoingEmail.objects.create(
+            subject=subject,
+            body=body,
+            html_body=html_body or "",
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            to_email=to_email,
+        )
+
+    @classmethod
+    def claim(cls, batch_size):
+        """Забирает порцию писем, которым пора уходить; параллельные диспетчеры не получат те же письма."""
+        now = timezone.now()
+        with transaction.atomic():
+            emails = list(
+                OutgoingEmail.objects.select_for_update(skip_locked=True)
+                .filter(status=OutgoingEmail.PENDING, next_attempt_at__lte=now)
+                .order_by("next_attempt_at")[:batch_size]
+            )
+            OutgoingEmail.objects.filter(pk__in=[email.pk for email in emails]).update(next_attempt_at=now + cls.LEASE)
+        return emails
+
+    @classmethod
+    def dispatch(cls, batch_size=None):
+        """Отправляет одну порцию писем из очереди. Возвращает (отправлено, ошибок)."""
+        emails = cls.claim(batch_size or cls.BATCH_SIZE)
+        sent_count = 0
+        error_count = 0
+        if not emails:
+            return sent_count, error_count
+
+        # Одна SMTP-сессия на порцию: соединение открыто заранее, и send_messages его не закрывает.
+        # open() внутри цикла переподключается, только если сессию закрыли после ошибки
+        connection = get_connection()
+        try:
+            for email in emails:
+                message = EmailMultiAlternatives(
+                    email.subject, email.body, email.from_email, [email.to_email], connection=connection
+                )
+                if email.html_body:
+                    message.attach_alternative(email.html_body, "text/html")
+                email.attempts += 1
+                try:
+                    connection.open()
+                    message.send()
+                except Exception as e:
+                    cls._schedule_retry(email, e)
+                    error_count += 1
+                    # После ошибки SMTP-сессия может быть в неопределённом состоянии
+                    connection.close()
+                else:
+                    email.status = OutgoingEmail.SENT
+                    email.sent_at = timezone.now()
+                    email.last_error = ""
+                    sent_count += 1
+                email.save(update_fields=["status", "attempts", "next_attempt_at", "last_error", "sent_at"])
+        finally:
+            connection.close()
+        return sent_count, error_count
+
+    @classmethod
+    def _schedule_retry(cls, email, error):
+        email.last_error = str(error)
+        if email.attempts >= cls.MAX_ATTEMPTS:
+            email.status = OutgoingEmail.FAILED
+            logger.error("Письмо #%s на %s не отправлено после %s попыток", email.pk, email.to_email, email.attempts)
+            return
+        delay = min(cls.RETRY_BASE_DELAY * 2 ** (email.attempts - 1), cls.RETRY_MAX_DELAY)
+        email.next_attempt_at = timezone.now() + delay
+        logger.warning("Письмо #%s на %s: ошибка отправки, повтор через %s", email.pk, email.to_email, delay)
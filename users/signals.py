@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CustomUser
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def clear_cached_user(sender, instance, **kwargs):
+    """Роль, пароль или активность могли измениться — пользователь сессии перечитывается из базы."""
+    CustomUser.clear_cached([instance.pk])
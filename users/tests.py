@@ -1 +1,153 @@
-# Create your tests here.
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from clients.smtp_sink import SMTPSink
+
+from .models import CustomUser, OutgoingEmail
+from .services import OutboxService
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OutboxTests(TestCase):
+    """Системные письма уходят через очередь, а не в запросе."""
+
+    def test_register_enqueues_activation_email(self):
+        response = self.client.post(
+            reverse("users:register"),
+            {"email": "new@example.com", "username": "new", "password1": "Xx12345678!q", "password2": "Xx12345678!q"},
+        )
+
+        self.assertRedirects(response, reverse("users:login"), fetch_redirect_response=False)
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.to_email, "new@example.com")
+        self.assertTrue(CustomUser.objects.filter(email="new@example.com", is_active=False).exists())
+
+    def test_password_reset_enqueues_email(self):
+        CustomUser.objects.create_user(username="user", email="user@example.com", password="x")
+
+        self.client.post(reverse("users:password_reset"), {"email": "user@example.com"})
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutgoingEmail.objects.get().to_email, "user@example.com")
+
+    def test_dispatch_sends_pending_emails(self):
+        OutboxService.enqueue("Тема", "Текст", "user@example.com")
+
+        self.assertEqual(OutboxService.dispatch(), (1, 0))
+
+        self.assertEqual(len(mail.outbox), 1)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.status, OutgoingEmail.SENT)
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(OutboxService.dispatch(), (0, 0))
+
+    def test_dispatch_sends_batch_in_one_smtp_session(self):
+        for i in range(3):
+            OutboxService.enqueue("Тема", "Текст", f"user{i}@example.com")
+
+        with (
+            SMTPSink() as sink,
+            override_settings(
+                EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+                EMAIL_HOST="127.0.0.1",
+                EMAIL_PORT=sink.port,
+                EMAIL_USE_TLS=False,
+                EMAIL_USE_SSL=False,
+            ),
+        ):
+            self.assertEqual(OutboxService.dispatch(), (3, 0))
+            stats = sink.stats()
+
+        self.assertEqual(stats["messages"], 3)
+        self.assertEqual(stats["sessions"], 1)
+
+    def test_failed_send_is_retried_with_backoff_then_given_up(self):
+        OutboxService.enqueue("Тема", "Текст", "user@example.com")
+
+        with (
+            mock.patch("users.services.EmailMultiAlternatives.send", side_effect=OSError("SMTP недоступен")),
+            self.assertLogs("users.outbox", "WARNING"),
+        ):
+            self.assertEqual(OutboxService.dispatch(), (0, 1))
+            email = OutgoingEmail.objects.get()
+            self.assertEqual(email.status, OutgoingEmail.PENDING)
+            self.assertEqual(email.last_error, "SMTP недоступен")
+            self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=30))
+            # До срока повтора письмо не берётся
+            self.assertEqual(OutboxService.dispatch(), (0, 0))
+
+            for _ in range(OutboxService.MAX_ATTEMPTS - 1):
+                OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+                OutboxService.dispatch()
+
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.FAILED)
+        self.assertEqual(email.attempts, OutboxService.MAX_ATTEMPTS)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CachedUserTests(TestCase):
+    """Пользователь и сессия берутся из кеша и сбрасываются при изменении пользователя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username="user", email="user@example.com", password="x")
+        cls.admin = CustomUser.objects.create_superuser(
+            username="admin", email="admin@example.com", password="x", role=CustomUser.ROLE_MANAGER
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def profile_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("users:profile"))
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_warm_request_skips_session_and_user_queries(self):
+        cache.clear()
+        cold = self.profile_queries()
+        self.assertEqual(self.profile_queries(), cold - 2)
+
+    def test_role_change_is_seen_on_next_request(self):
+        self.profile_queries()
+        self.user.role = CustomUser.ROLE_MANAGER
+        self.user.save()
+
+        response = self.client.get(reverse("users:profile"))
+
+        self.assertEqual(response.wsgi_request.user.role, CustomUser.ROLE_MANAGER)
+
+    def test_blocked_user_is_logged_out(self):
+        self.profile_queries()
+        admin_client = self.client_class()
+        admin_client.force_login(self.admin)
+
+        admin_client.post(
+            reverse("admin:users_customuser_changelist"),
+            {"action": "block_users", "_selected_action": [self.user.pk]},
+        )
+
+        response = self.client.get(reverse("users:profile"))
+        self.assertRedirects(response, f"{reverse('users:login')}?next={reverse('users:profile')}")
+
+    def test_password_change_ends_other_sessions(self):
+        self.profile_queries()
+        self.user.set_password("new-password")
+        self.user.save()
+
+        response = self.client.get(reverse("users:profile"))
+        self.assertEqual(response.status_code, 302)
@@ -5,11 +5,11 @@ from django.urls import reverse_lazy
 from django.contrib import messages
 from django.utils.encoding import force_bytes, force_str
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
-from django.core.mail import send_mail
-from django.conf import settings
+from django.db import transaction
 
 from .forms import CustomUserCreationForm, CustomAuthenticationForm, CustomPasswordResetForm, CustomSetPasswordForm
 from .models import CustomUser
+from .services import OutboxService
 from .tokens import account_activation_token
 
 
@@ -36,7 +36,7 @@ class CustomPasswordResetView(PasswordResetView):
     template_name = "users/password_reset.html"
     email_template_name = "users/password_reset_email.html"
     subject_template_name = "users/password_reset_subject.txt"
-    success_url = reverse_lazy("password_reset_done")
+    success_url = reverse_lazy("users:password_reset_done")
 
     def form_valid(self, form):
         messages.success(self.request, "Инструкции по восстановлению пароля отправлены на ваш email.")
@@ -48,7 +48,7 @@ class CustomPasswordResetConfirmView(PasswordResetConfirmView):
 
     form_class = CustomSetPasswordForm
     template_name = "users/password_reset_confirm.html"
-    success_url = reverse_lazy("login")
+    success_url = reverse_lazy("users:login")
 
     def form_valid(self, form):
         messages.success(self.request, "Пароль успешно изменен. Теперь вы можете войти.")
@@ -62,18 +62,20 @@ def register(request):
         if form.is_valid():
             user = form.save(commit=False)
             user.is_active = False  # Деактивируем пользователя до подтверждения email
-            user.save()
 
-            # Отправка письма с подтверждением
-            token = account_activation_token.make_token(user)
-            uid = urlsafe_base64_encode(force_bytes(user.pk))
+            # Пользователь и письмо с подтверждением сохраняются вместе; отправит письмо dispatch_outbox
+            with transaction.atomic():
+                user.save()
 
-            current_site = request.get_host()
-            mail_subject = "Активация аккаунта"
+                token = account_activation_token.make_token(user)
+                uid = urlsafe_base64_encode(force_bytes(user.pk))
 
-            # Простое текстовое сообщение
-            activation_link = f"http://{current_site}/activate/{uid}/{token}/"
-            message = f"""Здравствуйте, {user.username}!
+                current_site = request.get_host()
+                mail_subject = "Активация аккаунта"
+
+                # Простое текстовое сообщение
+                activation_link = f"http://{current_site}/activate/{uid}/{token}/"
+                message = f"""Здравствуйте, {user.username}!
 
 Спасибо за регистрацию в нашей системе рассылок.
 
@@ -85,20 +87,10 @@ def register(request):
 С уважением,
 Команда системы рассылок"""
 
-            try:
-                send_mail(
-                    mail_subject,
-                    message,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [user.email],
-                    fail_silently=False,
-                )
-                messages.success(request, "Регистрация прошла успешно! Проверьте ваш email для активации аккаунта.")
-                return redirect("users:login")
-            except Exception as e:
-                messages.error(request, f"Ошибка при отправке письма: {e}")
-                user.delete()  # Удаляем пользователя, если не удалось отправить письмо
-                return redirect("users:register")
+                OutboxService.enqueue(mail_subject, message, user.email)
+
+            messages.success(request, "Регистрация прошла успешно! Проверьте ваш email для активации аккаунта.")
+            return redirect("users:login")
     else:
         form = CustomUserCreationForm()
 